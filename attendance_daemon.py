@@ -0,0 +1,408 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+
+import cv2
+
+import face_training
+from attendance_store import get_attendance_ledger
+from camera import CameraStream, is_camera_source, parse_source
+from employee_directory import get_directory
+from face_tracker import DETECT_EVERY_N_FRAMES
+from model_registry import get_model_registry
+from pipeline_metrics import get_metrics, start_metrics_server
+from recognition_pipeline import RecognitionPipeline, make_continuous_decider, CONFIDENCE_THRESHOLD
+
+logger = logging.getLogger("attendance_daemon")
+
+# A camera process sends the same employee again only after this many
+# seconds; the writer process drops repeats across cameras
+EVENT_RESEND_INTERVAL = 60.0
+# Seconds to wait for camera processes to finish after a stop
+WORKER_STOP_TIMEOUT = 10.0
+
+
+# Function to add the options shared by all commands that run cameras
+def add_pipeline_arguments(parser):
+    parser.add_argument("--fast", action="store_true",
+                        help="process video files and image folders as fast as possible instead of in real time")
+    parser.add_argument("--loop", action="store_true", help="restart video files and image folders at the end")
+    parser.add_argument("--model", default=face_training.TRAINER_PATH, help="trained LBPH model")
+    parser.add_argument("--cascade", default=face_training.CASCADE_PATH, help="face cascade XML")
+    parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD,
+                        help="LBPH distance below which a face is recognized")
+    parser.add_argument("--detect-interval", type=int, default=DETECT_EVERY_N_FRAMES,
+                        help="run face detection every N frames")
+    parser.add_argument("--stats-interval", type=float, default=60.0,
+                        help="seconds between statistics log lines (0 to disable)")
+    parser.add_argument("--log-file", default=None, help="log to this file instead of stderr")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+
+
+# Function to parse the command line
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Headless attendance station: continuous attendance without the Tkinter UI")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run continuous attendance until stopped")
+    run_parser.add_argument("--source", default="0",
+                            help="camera index, video file or folder of images (default: camera 0)")
+    add_pipeline_arguments(run_parser)
+    run_parser.add_argument("--metrics-port", type=int, default=0,
+                            help="serve pipeline metrics for Prometheus on this local port (0 = off)")
+
+    multi_parser = subparsers.add_parser("multi", help="run several cameras, one process each, until stopped")
+    multi_parser.add_argument("--sources", nargs="+", required=True,
+                              help="camera indexes, video files or folders of images, one process each")
+    add_pipeline_arguments(multi_parser)
+    multi_parser.add_argument("--threads", type=int, default=0,
+                              help="OpenCV threads per camera process (default: CPU cores / cameras)")
+    multi_parser.add_argument("--pin", action="store_true",
+                              help="pin each camera process to its own share of the CPU cores")
+    multi_parser.add_argument("--metrics-port", type=int, default=0,
+                              help="serve camera N's pipeline metrics on this local port + N (0 = off)")
+
+    return parser.parse_args(argv)
+
+
+# Function to set up logging for the daemon
+def setup_logging(log_file=None, level="INFO"):
+    handler = logging.FileHandler(log_file) if log_file else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+# Function to run continuous attendance until a signal arrives or the camera
+# fails. Returns the process exit code.
+def run(args):
+    stop_event = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info("Received signal %s, shutting down", signum)
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    # Load the model and the face cascade. The registry is fetched first,
+    # since that is where a legacy trainner.yml is copied to trainer.yml.
+    models = get_model_registry(args.model)
+    if not os.path.exists(args.model):
+        logger.error("Model file %s not found. Please train the model first.", args.model)
+        return 1
+    try:
+        models.get_recognizer()
+    except Exception as e:
+        logger.error("Could not load model %s: %s", args.model, e)
+        return 1
+    # Predicts with the current model, so retraining takes effect without a restart
+    recognizer = models.shared_recognizer()
+    logger.info("Face recognizer loaded from %s", args.model)
+
+    try:
+        face_cascade = models.get_cascade(args.cascade)
+    except ValueError:
+        logger.error("Failed to load face detector %s", args.cascade)
+        return 1
+
+    metrics_server = start_metrics_server(args.metrics_port)
+
+    directory = get_directory()
+    ledger = get_attendance_ledger()
+    logger.info("Loaded %d employee records, %d already marked today",
+                len(directory), len(ledger.get_records()))
+
+    # Start the camera on its own capture thread
+    cap = CameraStream(parse_source(args.source), realtime=not args.fast, loop=args.loop)
+    try:
+        cap.start()
+    except RuntimeError as e:
+        logger.error("%s", e)
+        return 1
+    logger.info("Frame source %s started", args.source)
+
+    pipeline = RecognitionPipeline(cap, face_cascade, recognizer, decide=make_continuous_decider(directory, ledger),
+                                   confidence_threshold=args.threshold, tracking=True,
+                                   detect_interval=args.detect_interval)
+    pipeline.start()
+
+    exit_code = 0
+    next_stats = time.time() + args.stats_interval
+    try:
+        while not stop_event.is_set():
+            for kind, id, employee_name, timestamp in pipeline.get_events():
+                logger.info("Attendance %s for %s (ID: %s) at %s", kind, employee_name, id, timestamp)
+
+            # Nothing displays the results, so just let them go
+            pipeline.get_results()
+
+            if not pipeline.is_running():
+                if is_camera_source(args.source):
+                    logger.error("Pipeline stopped: %s", pipeline.error)
+                    exit_code = 1
+                else:
+                    logger.info("Frame source finished")
+                break
+
+            if args.stats_interval and time.time() >= next_stats:
+                next_stats = time.time() + args.stats_interval
+                logger.info("Stats: %s", get_metrics().format_summary())
+
+            stop_event.wait(0.2)
+    finally:
+        pipeline.stop()
+        for kind, id, employee_name, timestamp in pipeline.get_events():
+            logger.info("Attendance %s for %s (ID: %s) at %s", kind, employee_name, id, timestamp)
+        cap.release()
+        ledger.close()
+        if metrics_server is not None:
+            metrics_server.stop()
+        logger.info("Stopped (%d frames captured, %d attendance records written)",
+                    cap.frames_captured, ledger.written)
+
+    return exit_code
+
+
+# Function to get the CPU cores this process may run on
+def get_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+# Function to split CPU cores into `parts` groups of nearly equal size. With
+# more parts than cores, cores are shared round-robin.
+def split_cpus(cpus, parts):
+    if parts >= len(cpus):
+        return [{cpus[i % len(cpus)]} for i in range(parts)]
+    return [set(group) for group in (cpus[i * len(cpus) // parts:(i + 1) * len(cpus) // parts]
+                                     for i in range(parts))]
+
+
+# Function to make the decision step of a camera process: recognized faces
+# are sent to the writer process as ("recognized", camera, id, confidence,
+# time), each employee at most once per EVENT_RESEND_INTERVAL
+def make_event_decider(camera, events):
+    last_sent = {}
+
+    def decide(result):
+        now = time.time()
+        for face in result.faces:
+            if face.status != "recognized":
+                continue
+            if now - last_sent.get(face.id, 0.0) < EVENT_RESEND_INTERVAL:
+                continue
+            last_sent[face.id] = now
+            events.put(("recognized", camera, int(face.id), float(face.confidence), now))
+
+    return decide
+
+
+# Function run by each camera process: recognition for one camera, sending
+# recognized faces to the writer process until SIGTERM. Ends with
+# ("stopped", camera, frames captured, error or None).
+def camera_worker(camera, source, args, threads, cpus, events):
+    # The writer process handles Ctrl+C and stops the cameras with SIGTERM.
+    # No lock is shared with it, so a camera process that dies can't leave
+    # one held.
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    setup_logging(args.log_file, args.log_level)
+
+    if cpus:
+        try:
+            os.sched_setaffinity(0, cpus)
+        except (AttributeError, OSError) as e:
+            logger.error("Camera %d: could not pin to CPUs %s: %s", camera, sorted(cpus), e)
+    cv2.setNumThreads(threads)
+
+    cap = None
+    pipeline = None
+    metrics_server = None
+    error = None
+    try:
+        # The gallery is memory-mapped, so every camera process shares its
+        # pages. Camera processes only read the model files; the writer
+        # process converts and indexes them.
+        models = get_model_registry(args.model, read_only=True)
+        face_cascade = models.get_cascade(args.cascade)
+        if args.metrics_port:
+            metrics_server = start_metrics_server(args.metrics_port + camera)
+
+        cap = CameraStream(parse_source(source), realtime=not args.fast, loop=args.loop)
+        cap.start()
+        logger.info("Camera %d: frame source %s started (%d OpenCV threads, CPUs %s)", camera, source, threads,
+                    sorted(cpus) if cpus else "any")
+
+        pipeline = RecognitionPipeline(cap, face_cascade, models.shared_recognizer(),
+                                       decide=make_event_decider(camera, events),
+                                       confidence_threshold=args.threshold, tracking=True,
+                                       detect_interval=args.detect_interval)
+        pipeline.start()
+
+        next_stats = time.time() + args.stats_interval
+        while not stop_event.is_set():
+            pipeline.get_events()
+            pipeline.get_results()
+            if not pipeline.is_running():
+                if is_camera_source(source):
+                    error = f"Pipeline stopped: {pipeline.error}"
+                break
+            if args.stats_interval and time.time() >= next_stats:
+                next_stats = time.time() + args.stats_interval
+                logger.info("Camera %d stats: %s", camera, get_metrics().format_summary())
+            stop_event.wait(0.2)
+    except Exception as e:
+        error = str(e)
+    finally:
+        if pipeline is not None:
+            pipeline.stop()
+        if cap is not None:
+            cap.release()
+        if metrics_server is not None:
+            metrics_server.stop()
+        if error:
+            logger.error("Camera %d: %s", camera, error)
+        events.put(("stopped", camera, cap.frames_captured if cap is not None else 0, error))
+
+
+# Function to run several cameras, one process each, with this process as
+# the single attendance writer: it receives the recognized faces of every
+# camera and marks each employee once per day, whichever camera saw them.
+# Returns the process exit code.
+def run_multi(args):
+    # Spawned rather than forked: the parent already runs threads (the
+    # ledger's writer), and OpenCV's thread pools do not survive a fork
+    context = multiprocessing.get_context("spawn")
+    stop_event = threading.Event()
+    events = context.Queue()
+
+    def handle_signal(signum, frame):
+        logger.info("Received signal %s, shutting down", signum)
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    # This process does every gallery conversion and index build, at startup
+    # and whenever the model is retrained, so the read-only camera processes
+    # only ever map finished files. It also copies a legacy trainner.yml to
+    # trainer.yml when the registry is fetched, before the check below.
+    models = get_model_registry(args.model)
+    if not os.path.exists(args.model):
+        logger.error("Model file %s not found. Please train the model first.", args.model)
+        return 1
+    try:
+        models.get_recognizer()
+        models.get_cascade(args.cascade)
+    except Exception as e:
+        logger.error("Could not load the model or face detector: %s", e)
+        return 1
+    # The camera processes start once a conversion or index build is written
+    models.wait_for_writes()
+
+    cpus = get_cpus()
+    threads = args.threads or max(1, len(cpus) // len(args.sources))
+    cpu_groups = split_cpus(cpus, len(args.sources)) if args.pin else [None] * len(args.sources)
+
+    directory = get_directory()
+    ledger = get_attendance_ledger()
+    logger.info("Loaded %d employee records, %d already marked today",
+                len(directory), len(ledger.get_records()))
+
+    workers = {}
+    for camera, source in enumerate(args.sources):
+        worker = context.Process(target=camera_worker, name=f"camera-{camera}",
+                                 args=(camera, source, args, threads, cpu_groups[camera], events))
+        worker.start()
+        workers[camera] = worker
+    logger.info("Started %d camera processes", len(workers))
+
+    exit_code = 0
+    running = set(workers)
+    model_error = None
+
+    def handle_event(event):
+        nonlocal exit_code
+        if event[0] == "stopped":
+            _, camera, frames, error = event
+            running.discard(camera)
+            logger.info("Camera %d stopped after %d frames", camera, frames)
+            if error and is_camera_source(args.sources[camera]):
+                exit_code = 1
+            return
+
+        _, camera, id, confidence, timestamp = event
+        employee_name = directory.get_name(id)
+        if employee_name is None:
+            logger.error("No employee with ID %s (camera %d)", id, camera)
+            return
+        marked = ledger.mark(id, employee_name)
+        if marked is not None:
+            logger.info("Attendance marked for %s (ID: %s) at %s by camera %d", employee_name, id, marked[1], camera)
+
+    try:
+        while running and not stop_event.is_set():
+            try:
+                handle_event(events.get(timeout=0.2))
+            except queue.Empty:
+                pass
+            # Converts or indexes a retrained model (a file check at most
+            # once per RELOAD_CHECK_INTERVAL). A failure is logged once.
+            try:
+                models.get_recognizer()
+                model_error = None
+            except Exception as e:
+                if str(e) != model_error:
+                    logger.error("Could not load model %s: %s", args.model, e)
+                model_error = str(e)
+            # A process that died without saying so (killed, crashed)
+            for camera in list(running):
+                if not workers[camera].is_alive() and events.empty():
+                    logger.error("Camera %d process exited with code %s", camera, workers[camera].exitcode)
+                    running.discard(camera)
+                    exit_code = 1
+    finally:
+        for camera in running:
+            workers[camera].terminate()
+        # Recognitions still in flight are marked before the ledger closes
+        deadline = time.time() + WORKER_STOP_TIMEOUT
+        while running and time.time() < deadline:
+            try:
+                handle_event(events.get(timeout=0.2))
+            except queue.Empty:
+                running = {camera for camera in running if workers[camera].is_alive()}
+        for camera, worker in workers.items():
+            worker.join(max(0.0, deadline - time.time()))
+            if worker.is_alive():
+                logger.error("Camera %d did not stop, killing it", camera)
+                worker.kill()
+                worker.join()
+        ledger.close()
+        logger.info("Stopped (%d attendance records written)", ledger.written)
+
+    return exit_code
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging(args.log_file, args.log_level)
+    if args.command == "run":
+        return run(args)
+    if args.command == "multi":
+        return run_multi(args)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,417 @@
+import argparse
+import atexit
+import csv
+import datetime
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from pipeline_metrics import get_metrics
+
+# Storage settings. "csv" keeps one Attendance/<date>.csv per day, "sqlite"
+# keeps everything in one indexed database.
+ATTENDANCE_BACKEND = "csv"
+ATTENDANCE_DIR = "Attendance"
+ATTENDANCE_DB_PATH = "Attendance/attendance.db"
+
+# Ledger write policy: pending records are written every FLUSH_INTERVAL seconds
+# or as soon as FLUSH_BATCH_SIZE of them are waiting; FSYNC forces them to disk.
+FLUSH_INTERVAL = 1.0
+FLUSH_BATCH_SIZE = 50
+FSYNC = False
+
+
+# Attendance stored as one CSV file per day (ID, Name, Time)
+class CsvAttendanceStore:
+    def __init__(self, folder=ATTENDANCE_DIR):
+        self.folder = folder
+        self.lock = threading.Lock()
+
+    # Function to get the CSV file of a date
+    def get_file(self, date):
+        return os.path.join(self.folder, f"{date}.csv")
+
+    # Function to get a date's records as (id, name, time) tuples
+    def get_records(self, date):
+        attendance_file = self.get_file(date)
+        if not os.path.exists(attendance_file):
+            return []
+
+        records = []
+        with open(attendance_file, newline='') as f:
+            for row in csv.DictReader(f):
+                try:
+                    records.append((int(row["ID"]), row["Name"], row["Time"]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+        return records
+
+    # Function to check if an employee already has attendance on a date
+    def has_attendance(self, date, id):
+        return any(record[0] == int(id) for record in self.get_records(date))
+
+    # Function to mark attendance. Returns False if it was already marked.
+    def mark(self, date, id, name, time):
+        with self.lock:
+            if self.has_attendance(date, id):
+                return False
+
+            # Create attendance directory if it doesn't exist
+            if not os.path.exists(self.folder):
+                os.makedirs(self.folder)
+
+            attendance_file = self.get_file(date)
+            new_file = not os.path.exists(attendance_file)
+            with open(attendance_file, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(["ID", "Name", "Time"])
+                writer.writerow([id, name, time])
+            return True
+
+    # Function to append (date, id, name, time) records without duplicate checks.
+    # Used by the ledger, which already knows the records are new.
+    def append_many(self, records, fsync=False):
+        by_date = {}
+        for date, id, name, timestamp in records:
+            by_date.setdefault(date, []).append([id, name, timestamp])
+
+        with self.lock:
+            # Create attendance directory if it doesn't exist
+            if not os.path.exists(self.folder):
+                os.makedirs(self.folder)
+
+            for date, rows in by_date.items():
+                attendance_file = self.get_file(date)
+                new_file = not os.path.exists(attendance_file)
+                with open(attendance_file, 'a', newline='') as f:
+                    writer = csv.writer(f)
+                    if new_file:
+                        writer.writerow(["ID", "Name", "Time"])
+                    writer.writerows(rows)
+                    if fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+
+    # Function to list the dates that have attendance
+    def get_dates(self):
+        if not os.path.exists(self.folder):
+            return []
+        return sorted(os.path.splitext(f)[0] for f in os.listdir(self.folder) if f.endswith(".csv"))
+
+    def close(self):
+        pass
+
+
+# Attendance stored in SQLite (WAL mode). Duplicate checks and per-date
+# queries are index lookups instead of file parses.
+class SqliteAttendanceStore:
+    def __init__(self, path=ATTENDANCE_DB_PATH):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.created = not os.path.exists(path)
+        # One connection shared by all threads, serialized by the lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS attendance ("
+                " date TEXT NOT NULL,"
+                " employee_id INTEGER NOT NULL,"
+                " name TEXT NOT NULL,"
+                " time TEXT NOT NULL,"
+                " PRIMARY KEY (date, employee_id))"
+            )
+            # The primary key covers lookups by date; this one covers lookups by employee
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_employee ON attendance (employee_id, date)")
+            self.conn.commit()
+
+    def get_records(self, date):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT employee_id, name, time FROM attendance WHERE date = ? ORDER BY time, rowid", (date,)
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def has_attendance(self, date, id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM attendance WHERE date = ? AND employee_id = ?", (date, int(id))
+            ).fetchone()
+        return row is not None
+
+    def mark(self, date, id, name, time):
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO attendance (date, employee_id, name, time) VALUES (?, ?, ?, ?)",
+                (date, int(id), str(name), time),
+            )
+            self.conn.commit()
+        return cursor.rowcount == 1
+
+    # Function to mark many records in one transaction. Returns how many were new.
+    def mark_many(self, records):
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO attendance (date, employee_id, name, time) VALUES (?, ?, ?, ?)",
+                [(date, int(id), str(name), timestamp) for date, id, name, timestamp in records],
+            )
+            self.conn.commit()
+            return self.conn.total_changes - before
+
+    # Function to write records from the ledger in one transaction
+    def append_many(self, records, fsync=False):
+        if fsync:
+            with self.lock:
+                self.conn.execute("PRAGMA synchronous=FULL")
+        self.mark_many(records)
+
+    def get_dates(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT DISTINCT date FROM attendance ORDER BY date").fetchall()
+        return [row[0] for row in rows]
+
+    # Function to get the dates an employee was present
+    def get_employee_dates(self, id):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT date FROM attendance WHERE employee_id = ? ORDER BY date", (int(id),)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# Sent to the ledger's writer thread
+_FLUSH = object()
+_STOP = object()
+
+
+# In-memory attendance of the current day in front of an attendance store.
+# Duplicate checks are set lookups, the day switches automatically at
+# midnight, and records are written by a background thread in batches, so
+# marking attendance never waits for the disk.
+class AttendanceLedger:
+    def __init__(self, store, flush_interval=FLUSH_INTERVAL, batch_size=FLUSH_BATCH_SIZE, fsync=FSYNC):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.fsync = fsync
+
+        self.lock = threading.Lock()
+        self.current_date = None
+        self.marked = {}            # id -> (name, time) for current_date
+        self.records = []           # (id, name, time) for current_date, in marking order
+
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self._writer_loop, name="AttendanceWriter", daemon=True)
+        self.writer.start()
+
+        # Counters
+        self.written = 0
+        self.write_errors = 0
+
+    # Function to get today's date as used for the attendance files
+    def today(self):
+        return datetime.datetime.now().strftime('%Y-%m-%d')
+
+    # Function to switch to another day, loading what the store has for it
+    def _switch_day(self, date):
+        records = self.store.get_records(date)
+        self.current_date = date
+        self.records = list(records)
+        self.marked = {id: (name, timestamp) for id, name, timestamp in records}
+
+    # Function to make sure the ledger is on today's date. Returns the date.
+    def roll_over(self):
+        date = self.today()
+        with self.lock:
+            if date != self.current_date:
+                self._switch_day(date)
+        return date
+
+    # Function to mark attendance now. Returns (date, time) if it was new, or
+    # None if the employee was already marked today.
+    def mark(self, id, name):
+        now = datetime.datetime.now()
+        date = now.strftime('%Y-%m-%d')
+        timestamp = now.strftime('%H:%M:%S')
+
+        with self.lock:
+            if date != self.current_date:
+                self._switch_day(date)
+            if id in self.marked:
+                return None
+            self.marked[id] = (name, timestamp)
+            self.records.append((id, name, timestamp))
+
+        self.queue.put((date, id, name, timestamp))
+        return date, timestamp
+
+    # Function to check if an employee is marked today
+    def has_attendance(self, id):
+        self.roll_over()
+        with self.lock:
+            return id in self.marked
+
+    # Function to get a date's records, including ones not written yet
+    def get_records(self, date=None):
+        if date is None:
+            date = self.roll_over()
+        with self.lock:
+            if date == self.current_date:
+                return list(self.records)
+        self.flush()
+        return self.store.get_records(date)
+
+    def _write(self, pending):
+        if not pending:
+            return pending
+        try:
+            start = time.time()
+            self.store.append_many(pending, fsync=self.fsync)
+            get_metrics().observe("attendance_write", time.time() - start)
+            self.written += len(pending)
+            return []
+        except Exception as e:
+            # Keep the records and try again on the next flush
+            self.write_errors += 1
+            print(f"ERROR: Could not write attendance: {str(e)}")
+            return pending
+
+    def _writer_loop(self):
+        pending = []
+        deadline = None
+        while True:
+            timeout = self.flush_interval
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.time())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            # Nothing but _STOP may end this thread, or later records would
+            # be queued and never written
+            try:
+                if item is _STOP:
+                    self._write(pending)
+                    return
+                if isinstance(item, tuple) and item and item[0] is _FLUSH:
+                    try:
+                        pending = self._write(pending)
+                    finally:
+                        item[1].set()
+                    deadline = None
+                elif item is not None:
+                    pending.append(item)
+
+                # Records that could not be written are tried again a flush interval later
+                if pending and deadline is None:
+                    deadline = time.time() + self.flush_interval
+                if pending and (len(pending) >= self.batch_size or time.time() >= deadline):
+                    pending = self._write(pending)
+                    deadline = time.time() + self.flush_interval if pending else None
+                if not pending:
+                    deadline = None
+            except Exception as e:
+                print(f"ERROR: Attendance writer failed: {str(e)}")
+
+    # Function to write everything pending now and wait for it
+    def flush(self, timeout=5.0):
+        if not self.writer.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put((_FLUSH, done))
+        done.wait(timeout)
+
+    # Function to write everything pending and stop the writer thread
+    def close(self, timeout=5.0):
+        if self.writer.is_alive():
+            self.queue.put(_STOP)
+            self.writer.join(timeout)
+
+
+# Function to copy every Attendance/<date>.csv into a SQLite store. Records
+# that are already in the database are skipped, so it's safe to run again.
+def import_csv_attendance(store, folder=ATTENDANCE_DIR):
+    csv_store = CsvAttendanceStore(folder)
+    imported = 0
+    for date in csv_store.get_dates():
+        records = [(date, id, name, timestamp) for id, name, timestamp in csv_store.get_records(date)]
+        imported += store.mark_many(records)
+    return imported
+
+
+# One store and one ledger per process, shared by every window and mode
+_store = None
+_ledger = None
+_store_lock = threading.Lock()
+
+
+# Function to get the shared attendance store for the configured backend
+def get_attendance_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            if ATTENDANCE_BACKEND == "sqlite":
+                _store = SqliteAttendanceStore(ATTENDANCE_DB_PATH)
+                # A new database starts with the history from the CSV files
+                if _store.created:
+                    count = import_csv_attendance(_store)
+                    print(f"Imported {count} attendance records from CSV files")
+            else:
+                _store = CsvAttendanceStore(ATTENDANCE_DIR)
+        return _store
+
+
+# Function to get the shared attendance ledger. Pending records are written
+# when the process exits.
+def get_attendance_ledger():
+    global _ledger
+    store = get_attendance_store()
+    with _store_lock:
+        if _ledger is None:
+            _ledger = AttendanceLedger(store)
+            atexit.register(_ledger.close)
+        return _ledger
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance storage tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import-csv", help="import Attendance/<date>.csv files into SQLite")
+    import_parser.add_argument("--folder", default=ATTENDANCE_DIR)
+    import_parser.add_argument("--db", default=ATTENDANCE_DB_PATH)
+
+    query_parser = subparsers.add_parser("who", help="list who was present on a date (SQLite)")
+    query_parser.add_argument("date", help="date as YYYY-MM-DD")
+    query_parser.add_argument("--db", default=ATTENDANCE_DB_PATH)
+
+    args = parser.parse_args()
+    store = SqliteAttendanceStore(args.db)
+    try:
+        if args.command == "import-csv":
+            count = import_csv_attendance(store, args.folder)
+            print(f"Imported {count} attendance records into {args.db}")
+        elif args.command == "who":
+            for id, name, timestamp in store.get_records(args.date):
+                print(f"{id},{name},{timestamp}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,8 @@
+import time
+# Start of the startup timing report (see report_startup)
+_startup_start = time.time()
+import argparse
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox
 import cv2
@@ -5,9 +10,16 @@ import csv
 import os
 import numpy as np
 from PIL import Image, ImageTk
-import pandas as pd
 import datetime
-import time
+import face_training
+import camera
+from camera import CameraStream, open_frame_source
+from recognition_pipeline import RecognitionPipeline, RateCounter, detect_faces_scaled, make_continuous_decider
+from face_tracker import DETECT_EVERY_N_FRAMES
+from employee_directory import get_directory
+from attendance_store import get_attendance_ledger
+from model_registry import get_model_registry
+from pipeline_metrics import get_metrics, start_metrics_server, MetricsLogger
 
 # Define color scheme (modern palette)
 PRIMARY_COLOR = "#4361ee"        # Vibrant blue for primary elements
@@ -21,6 +33,55 @@ LIGHT_ACCENT = "#4cc9f0"         # Light blue accent
 GRADIENT_TOP = "#4361ee"         # Gradient top color
 GRADIENT_BOTTOM = "#3a0ca3"      # Gradient bottom color
 
+# Camera feed display settings. The feed is redrawn at most DISPLAY_MAX_FPS
+# times per second, independently of how fast frames are recognized.
+DISPLAY_SIZE = (640, 480)
+DISPLAY_MAX_FPS = 15
+DISPLAY_INTERPOLATION = cv2.INTER_LINEAR
+
+# Seconds since startup at which each startup phase finished
+startup_times = {}
+
+# Function to record that a startup phase finished
+def mark_startup(phase):
+    startup_times[phase] = time.time() - _startup_start
+
+# Function to print when each startup phase finished and how long each
+# background load took
+def report_startup(loads):
+    phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup_times.items())
+    loaded = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in loads.items())
+    print(f"Startup: {phases} | prewarm: {loaded}")
+
+# Function to load the slow parts in the background while the home screen is
+# shown: pandas for the Excel export, the employee list, the face cascade and
+# the trained model
+def prewarm():
+    loads = {}
+    try:
+        start = time.time()
+        import pandas  # noqa: F401 (only loaded so the export doesn't wait for it)
+        loads["pandas"] = time.time() - start
+
+        start = time.time()
+        get_directory()
+        loads["employees"] = time.time() - start
+
+        # Loaded into the shared registry, where every window finds them
+        models = get_model_registry()
+        start = time.time()
+        models.get_cascade()
+        loads["cascade"] = time.time() - start
+
+        if os.path.exists(face_training.TRAINER_PATH):
+            start = time.time()
+            models.get_recognizer()
+            loads["model"] = time.time() - start
+    except Exception as e:
+        print(f"ERROR: Prewarming failed: {str(e)}")
+    mark_startup("prewarm")
+    report_startup(loads)
+
 # Set up styles for ttk widgets
 def setup_styles():
     style = ttk.Style()
@@ -44,16 +105,8 @@ def setup_styles():
                   relief="flat",
                   background=PRIMARY_COLOR)
 
-# Window is our Main frame of system
-window = tk.Tk()
-window.title("Face Recognition Attendance System")
-window.configure(background=BG_COLOR)
-
-# Setup ttk styles
-setup_styles()
-
-# Make the window resizable
-window.resizable(True, True)
+# Window is our Main frame of system (created in main())
+window = None
 
 # First improve the center_window function for better automatic sizing
 def center_window(window, width=None, height=None):
@@ -222,6 +275,29 @@ def create_rounded_entry(parent, width=20, font_size=14, validate_command=None):
     
     return entry_frame, entry
 
+# Milliseconds a header waits after the last resize before it redraws
+HEADER_REDRAW_DELAY = 50
+
+# Gradient images by (width, height, top color, bottom color), shared by
+# every header and footer in the process
+_gradient_images = {}
+
+# Function to get a vertical gradient as a Tk image. Each size and color pair
+# is rendered once; canvases clip the image, so one image as wide as the
+# screen serves every window width.
+def get_gradient_image(width, height, top=GRADIENT_TOP, bottom=GRADIENT_BOTTOM):
+    key = (width, height, top, bottom)
+    image = _gradient_images.get(key)
+    if image is None:
+        top_rgb = np.array([int(top[i:i+2], 16) for i in (1, 3, 5)], dtype=np.float64)
+        bottom_rgb = np.array([int(bottom[i:i+2], 16) for i in (1, 3, 5)], dtype=np.float64)
+        ratio = (np.arange(height) / height)[:, None]
+        column = (top_rgb * (1 - ratio) + bottom_rgb * ratio).astype(np.uint8)
+        pixels = np.ascontiguousarray(np.broadcast_to(column[:, None, :], (height, width, 3)))
+        image = ImageTk.PhotoImage(image=Image.fromarray(pixels))
+        _gradient_images[key] = image
+    return image
+
 # Function to create gradient header with centered text
 def create_gradient_header(parent, text, font_size=22, height=100):
     # Create a canvas for the gradient
@@ -235,22 +311,13 @@ def create_gradient_header(parent, text, font_size=22, height=100):
         if width <= 1:  # If still not available, use a default
             width = 1000
     
-    # Draw gradient background
-    for i in range(height):
-        # Calculate color based on position
-        r1, g1, b1 = int(GRADIENT_TOP[1:3], 16), int(GRADIENT_TOP[3:5], 16), int(GRADIENT_TOP[5:7], 16)
-        r2, g2, b2 = int(GRADIENT_BOTTOM[1:3], 16), int(GRADIENT_BOTTOM[3:5], 16), int(GRADIENT_BOTTOM[5:7], 16)
-        
-        ratio = i / height
-        r = int(r1 * (1 - ratio) + r2 * ratio)
-        g = int(g1 * (1 - ratio) + g2 * ratio)
-        b = int(b1 * (1 - ratio) + b2 * ratio)
-        
-        color = f'#{r:02x}{g:02x}{b:02x}'
-        header_canvas.create_line(0, i, width, i, fill=color)
+    # Draw gradient background, wide enough for the window at any size
+    gradient_width = max(width, parent.winfo_screenwidth())
+    header_canvas.gradient = get_gradient_image(gradient_width, height)
+    image_id = header_canvas.create_image(0, 0, image=header_canvas.gradient, anchor="nw")
     
     # Add text centered in the header
-    header_canvas.create_text(
+    text_id = header_canvas.create_text(
         width // 2, height // 2,  # Center the text horizontally and vertically
         text=text,
         fill="white",
@@ -258,38 +325,28 @@ def create_gradient_header(parent, text, font_size=22, height=100):
         anchor="center"  # Ensure text is anchored at its center point
     )
     
-    # Force the canvas to update and redraw after parent size changes
-    def update_canvas(event):
-        # Get the new width
-        new_width = parent.winfo_width()
-        
-        # Clear the canvas
-        header_canvas.delete("all")
-        
-        # Redraw gradient
-        for i in range(height):
-            r1, g1, b1 = int(GRADIENT_TOP[1:3], 16), int(GRADIENT_TOP[3:5], 16), int(GRADIENT_TOP[5:7], 16)
-            r2, g2, b2 = int(GRADIENT_BOTTOM[1:3], 16), int(GRADIENT_BOTTOM[3:5], 16), int(GRADIENT_BOTTOM[5:7], 16)
-            
-            ratio = i / height
-            r = int(r1 * (1 - ratio) + r2 * ratio)
-            g = int(g1 * (1 - ratio) + g2 * ratio)
-            b = int(b1 * (1 - ratio) + b2 * ratio)
-            
-            color = f'#{r:02x}{g:02x}{b:02x}'
-            header_canvas.create_line(0, i, new_width, i, fill=color)
-        
-        # Redraw text in the center
-        header_canvas.create_text(
-            new_width // 2, height // 2,
-            text=text,
-            fill="white",
-            font=('Segoe UI', font_size, 'bold'),
-            anchor="center"
-        )
-    
-    # Bind the update function to window size changes
-    parent.bind("<Configure>", update_canvas)
+    pending = None
+    
+    # Function to fit the header to its current width: the text is moved, and
+    # the gradient is only replaced if the canvas got wider than the image
+    def redraw():
+        nonlocal pending
+        pending = None
+        new_width = header_canvas.winfo_width()
+        if new_width > header_canvas.gradient.width():
+            header_canvas.gradient = get_gradient_image(new_width, height)
+            header_canvas.itemconfigure(image_id, image=header_canvas.gradient)
+        header_canvas.coords(text_id, new_width // 2, height // 2)
+    
+    # Resizing fires many events in a row, so redraw once they stop
+    def on_configure(event):
+        nonlocal pending
+        if pending is not None:
+            header_canvas.after_cancel(pending)
+        pending = header_canvas.after(HEADER_REDRAW_DELAY, redraw)
+    
+    # Only the header's own size matters, not every widget in the parent
+    header_canvas.bind("<Configure>", on_configure)
     
     return header_canvas
 
@@ -357,34 +414,38 @@ def register_employee():
             return
         
         # Confirm before starting
-        if not messagebox.askyesno("Confirm", "Camera will start capturing 100 images.\n\nPlease be ready and face the camera.\n\nDo you want to continue?"):
+        if not messagebox.askyesno("Confirm", f"Camera will capture up to {face_training.CAPTURE_TARGET_SAMPLES} images.\n\nPlease be ready and face the camera, turning your head slightly now and then.\n\nDo you want to continue?"):
             return
         
+        capture_dir = None
         try:
-            # Create directory for training images if it doesn't exist
-            if not os.path.exists("TrainingImage"):
-                os.makedirs("TrainingImage")
-                
             # Check if an employee with this ID already exists
-            employee_exists = False
-            if os.path.exists("EmployeeDetails.csv"):
-                df = pd.read_csv("EmployeeDetails.csv")
-                if int(emp_id) in df["ID"].values:
-                    employee_exists = True
+            directory = get_directory()
+            employee_exists = int(emp_id) in directory
             
             if employee_exists:
                 if not messagebox.askyesno("Warning", "Employee ID already exists. Do you want to overwrite?"):
                     return
             
+            # Images are captured into their own folder and only replace the
+            # employee's old samples once enough of them were captured
+            capture_dir = face_training.start_capture(emp_id)
+            
             # Get the face detector
-            detector = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
+            detector = get_model_registry().get_cascade()
             
-            # Start camera
-            cam = cv2.VideoCapture(0)
+            # Start camera (or the configured video file / image folder)
+            cam = open_frame_source()
             
-            # Sample count
-            sample_num = 0
-            total_samples = 100  # Reduced from 200 to 100 for efficiency
+            # Only sharp, big enough faces that differ from the ones already
+            # saved are kept, until enough of them are saved
+            selector = face_training.SampleSelector()
+            hints = {
+                "small": "Face too small, move closer",
+                "blurry": "Image blurry, hold still",
+                "duplicate": "Same as a saved image, turn your head slightly",
+            }
+            capture_start = time.time()
             
             # Progress tracking
             progress_frame = tk.Frame(card["inner_frame"], bg=CARD_BG_COLOR)
@@ -399,27 +460,35 @@ def register_employee():
             )
             progress_bar.pack(pady=5)
             
-            while True:
+            while not selector.done and time.time() - capture_start < face_training.CAPTURE_TIMEOUT:
                 ret, img = cam.read()
                 if not ret:
                     break
                     
                 gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                faces = detector.detectMultiScale(gray, 1.3, 5)
+                # Registration has its own face size bounds, not the pipeline's
+                faces = detect_faces_scaled(detector, gray, 1.3, 5,
+                                            min_face_size=face_training.CAPTURE_MIN_FACE_SIZE, max_face_size=0)
                 
-                for (x, y, w, h) in faces:
-                    cv2.rectangle(img, (x, y), (x + w, y + h), (255, 0, 0), 2)
-                    sample_num += 1
-                    
-                    # Save the captured face
-                    img_path = f"TrainingImage/User.{emp_id}.{sample_num}.jpg"
-                    cv2.imwrite(img_path, gray[y:y+h, x:x+w])
+                # Only the biggest face is the employee being registered
+                if len(faces) > 0:
+                    x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+                    face = gray[y:y+h, x:x+w]
+                    reason = selector.consider(face)
+                    if reason is None:
+                        cv2.rectangle(img, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                        
+                        # Save the captured face
+                        img_path = os.path.join(capture_dir, f"User.{emp_id}.{selector.kept}.jpg")
+                        cv2.imwrite(img_path, face)
+                        progress = f"Captured image {selector.kept}/{selector.target}"
+                    else:
+                        cv2.rectangle(img, (x, y), (x + w, y + h), (255, 0, 0), 2)
+                        progress = f"Captured image {selector.kept}/{selector.target} - {hints[reason]}"
                     
                     # Update status and progress bar
-                    progress = f"Capturing image {sample_num}/{total_samples}"
                     status_label.config(text=progress)
-                    progress_value = int((sample_num / total_samples) * 100)
-                    progress_bar["value"] = progress_value
+                    progress_bar["value"] = int((selector.kept / selector.target) * 100)
                     register_window.update()
                 
                 cv2.imshow('Capture', img)
@@ -427,43 +496,42 @@ def register_employee():
                 # Wait for 100ms
                 if cv2.waitKey(100) & 0xFF == ord('q'):
                     break
-                elif sample_num >= total_samples:
-                    break
             
             cam.release()
             cv2.destroyAllWindows()
+            print(f"Registration capture: kept {selector.kept} images, rejected "
+                  + ", ".join(f"{count} {reason}" for reason, count in selector.rejected.items()))
             
-            # Save employee details to CSV
-            csv_path = "EmployeeDetails.csv"
+            if selector.kept < face_training.CAPTURE_MIN_SAMPLES:
+                face_training.discard_capture(capture_dir)
+                status_label.config(text="")
+                progress_frame.destroy()
+                messagebox.showwarning("Warning", f"Only {selector.kept} usable images were captured (at least {face_training.CAPTURE_MIN_SAMPLES} are needed).\n\nPlease try again closer to the camera and in better light.")
+                return
             
-            if not os.path.exists(csv_path):
-                with open(csv_path, 'w', newline='') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(["ID", "Name"])
-                    writer.writerow([emp_id, emp_name])
-            else:
-                df = pd.read_csv(csv_path)
-                
-                # Check if employee exists and update or add
-                if int(emp_id) in df["ID"].values:
-                    df.loc[df["ID"] == int(emp_id), "Name"] = emp_name
-                else:
-                    df = df._append({"ID": int(emp_id), "Name": emp_name}, ignore_index=True)
-                
-                df.to_csv(csv_path, index=False)
+            face_training.keep_capture(emp_id, capture_dir)
+            
+            # Save employee details to CSV (adds the employee or updates the name)
+            directory.save_employee(int(emp_id), emp_name)
             
             # Train the model
             status_label.config(text="Training model... Please wait.")
             progress_bar["value"] = 100
             register_window.update()
             
-            # Run the training function
-            train_model()
+            # Add only this employee's samples to the existing model. Any
+            # samples the model still has for this ID are replaced, even if
+            # the ID isn't in EmployeeDetails.csv.
+            if not update_model(emp_id):
+                return
             
             messagebox.showinfo("Success", f"Employee {emp_name} registered successfully with ID {emp_id}.\n\nThe model has been trained.")
             register_window.destroy()
             
         except Exception as e:
+            # Images of a capture that didn't finish are dropped
+            if capture_dir is not None:
+                face_training.discard_capture(capture_dir)
             messagebox.showerror("Error", f"An error occurred: {str(e)}")
             
     # Button frame with modern styling
@@ -480,60 +548,21 @@ def register_employee():
                               width=12, height=1, bg_color=ACCENT_COLOR, font_size=12)
     cancel_btn.pack(side=tk.LEFT, padx=15)
 
-# Function to train the model
-def train_model():
+# Function to update the model with a single employee's samples
+def update_model(emp_id):
     try:
-        recognizer = cv2.face.LBPHFaceRecognizer_create()
-        detector = cv2.CascadeClassifier("haarcascade_frontalface_default.xml")
-        
-        # Create directory for training labels if it doesn't exist
-        if not os.path.exists("TrainingImageLabel"):
-            os.makedirs("TrainingImageLabel")
-        
-        # Get faces and IDs
-        faces, ids = get_images_and_labels("TrainingImage")
-        
-        # Train the model
-        recognizer.train(faces, np.array(ids))
-        
-        # Save the model
-        recognizer.save("TrainingImageLabel/trainer.yml")
-        
+        # A conversion or index build still running in the background would
+        # otherwise write its older gallery after this one
+        models = get_model_registry()
+        models.wait_for_writes()
+        # The gallery and index update_model saved are installed as they are
+        recognizer, saved = face_training.update_model(emp_id, replace=True)
+        models.set_recognizer(recognizer, saved)
         return True
     except Exception as e:
         messagebox.showerror("Error", f"Error training model: {str(e)}")
         return False
 
-# Function to get images and labels for training
-def get_images_and_labels(path):
-    # Get all file paths
-    image_paths = [os.path.join(path, f) for f in os.listdir(path)]
-    face_samples = []
-    ids = []
-    
-    detector = cv2.CascadeClassifier("haarcascade_frontalface_default.xml")
-    
-    for image_path in image_paths:
-        try:
-            # Load image and convert to grayscale
-            pil_img = Image.open(image_path).convert('L')
-            img_numpy = np.array(pil_img, 'uint8')
-            
-            # Get the ID from the image file name
-            id = int(os.path.split(image_path)[-1].split(".")[1])
-            
-            # Detect faces
-            faces = detector.detectMultiScale(img_numpy)
-            
-            # Store face samples and IDs
-            for (x, y, w, h) in faces:
-                face_samples.append(img_numpy[y:y+h, x:x+w])
-                ids.append(id)
-        except Exception as e:
-            print(f"Error processing {image_path}: {str(e)}")
-    
-    return face_samples, ids
-
 # Function to start automatic attendance
 def start_attendance():
     attendance_window = tk.Toplevel(window)
@@ -662,13 +691,83 @@ def start_attendance():
     attendance_window.geometry(f"{main_width}x{main_height}")
     center_window(attendance_window, main_width, main_height)
 
+# Function to draw the recognition results on a frame. When the frame was
+# resized for display, box x and width are multiplied by sx and y and height
+# by sy (they differ when the aspect ratio changed, e.g. 16:9 shown as 4:3).
+def draw_face_results(frame, faces, sx=1.0, sy=1.0):
+    for face in faces:
+        bx, by, bw, bh = face.box
+        x, y, w, h = int(bx * sx), int(by * sy), int(bw * sx), int(bh * sy)
+        
+        # Draw rectangle around the face
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
+        
+        if face.status == "error":
+            cv2.putText(frame, "Error", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+        elif face.status == "recognized" and face.name is not None:
+            cv2.putText(frame, str(face.name), (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+            if face.marked:
+                cv2.putText(frame, "Marked", (x, y+h+20), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        else:
+            cv2.putText(frame, "Unknown", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+
+# Shows camera frames in a label. Frames are resized into a preallocated
+# buffer, the face boxes are drawn on that small copy, and one PhotoImage is
+# reused for every frame instead of creating a new Tk image each time.
+class FrameRenderer:
+    def __init__(self, label, size=DISPLAY_SIZE, max_fps=DISPLAY_MAX_FPS, interpolation=DISPLAY_INTERPOLATION):
+        self.label = label
+        self.size = size
+        self.interpolation = interpolation
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        width, height = size
+        self.bgr = np.empty((height, width, 3), dtype=np.uint8)
+        self.rgb = np.empty((height, width, 3), dtype=np.uint8)
+        self.photo = None
+        self.last_shown = 0.0
+        self.rate = RateCounter()
+    
+    # Function to check if enough time passed to show another frame
+    def due(self):
+        return time.time() - self.last_shown >= self.min_interval
+    
+    # Function to show a BGR frame with the recognition results drawn on it
+    def show(self, frame, faces=()):
+        start = time.time()
+        width, height = self.size
+        frame_h, frame_w = frame.shape[:2]
+        
+        # Resizing also makes the copy that the boxes are drawn on
+        if (frame_w, frame_h) == self.size:
+            np.copyto(self.bgr, frame)
+        else:
+            cv2.resize(frame, self.size, dst=self.bgr, interpolation=self.interpolation)
+        draw_face_results(self.bgr, faces, sx=width / float(frame_w), sy=height / float(frame_h))
+        cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB, dst=self.rgb)
+        img = Image.fromarray(self.rgb)
+        
+        if self.photo is None:
+            self.photo = ImageTk.PhotoImage(image=img)
+            self.label.imgtk = self.photo
+            self.label.configure(image=self.photo)
+        else:
+            self.photo.paste(img)
+        
+        self.last_shown = start
+        self.rate.tick()
+        metrics = get_metrics()
+        metrics.observe("display", time.time() - start)
+        metrics.tick("display")
+
 # Function to mark attendance for a single employee
 def mark_single_attendance():
     try:
-        # Check if the model exists
-        if not os.path.exists("TrainingImageLabel/trainer.yml"):
+        # Check if the model exists (fetching the registry first copies a
+        # legacy trainner.yml to trainer.yml)
+        get_model_registry()
+        if not os.path.exists(face_training.TRAINER_PATH):
             messagebox.showerror("Error", "Model file not found. Please train the model first.")
-            print("ERROR: TrainingImageLabel/trainer.yml not found")
+            print(f"ERROR: {face_training.TRAINER_PATH} not found")
             return
             
         # Create a window to display the camera feed
@@ -702,6 +801,12 @@ def mark_single_attendance():
         
         camera_frame = tk.Label(camera_holder, bg="black")
         camera_frame.pack(fill="both", expand=True)
+        renderer = FrameRenderer(camera_frame)
+        
+        # Display and recognition rates
+        fps_label = create_label(content_frame, "", width=50, height=1, 
+                                font_size=9, bold=False, bg_color=BG_COLOR)
+        fps_label.pack()
         
         # Get main window dimensions for sizing
         main_width = window.winfo_width()
@@ -713,9 +818,14 @@ def mark_single_attendance():
         
         print("Initializing face recognizer...")
         # Initialize the face recognizer
+        # The model and the parsed cascade file are shared by all windows and
+        # only read from disk again when they change; each window gets its own
+        # cascade classifier
+        models = get_model_registry()
         try:
-            recognizer = cv2.face.LBPHFaceRecognizer_create()
-            recognizer.read("TrainingImageLabel/trainer.yml")
+            models.get_recognizer()
+            # Predicts with whatever model is current, so a retrain is picked up live
+            recognizer = models.shared_recognizer()
             print("Face recognizer loaded successfully")
         except Exception as e:
             print(f"ERROR: Could not initialize face recognizer: {str(e)}")
@@ -725,12 +835,7 @@ def mark_single_attendance():
         
         # Load the face cascade
         try:
-            face_cascade = cv2.CascadeClassifier("haarcascade_frontalface_default.xml")
-            if face_cascade.empty():
-                print("ERROR: haarcascade_frontalface_default.xml file is empty or failed to load")
-                messagebox.showerror("Error", "Failed to load face detector. Check haarcascade_frontalface_default.xml file.")
-                single_window.destroy()
-                return
+            face_cascade = models.get_cascade()
             print("Face cascade loaded successfully")
         except Exception as e:
             print(f"ERROR: Could not load face cascade: {str(e)}")
@@ -738,20 +843,17 @@ def mark_single_attendance():
             single_window.destroy()
             return
         
-        # Load the employee details
-        try:
-            df = pd.read_csv("EmployeeDetails.csv")
-            print(f"Loaded {len(df)} employee records")
-        except Exception as e:
-            print(f"ERROR: Could not load EmployeeDetails.csv: {str(e)}")
-            messagebox.showerror("Error", f"Could not load employee details: {str(e)}")
-            single_window.destroy()
-            return
+        # Load the employee details (shared, and reloaded when the file changes;
+        # errors are printed and the last loaded records are kept)
+        directory = get_directory()
+        directory.reload_if_changed(force=True)
         
-        # Start the camera
+        # Start the camera on its own capture thread
         try:
-            cap = cv2.VideoCapture(0)
-            if not cap.isOpened():
+            cap = CameraStream()
+            try:
+                cap.start()
+            except RuntimeError:
                 print("ERROR: Could not open camera")
                 messagebox.showerror("Error", "Could not open camera. Please check your camera connection.")
                 single_window.destroy()
@@ -759,15 +861,10 @@ def mark_single_attendance():
             print("Camera started successfully")
             
             # Immediately get a frame to display
-            ret, initial_frame = cap.read()
-            if ret:
+            initial_packet = cap.read(timeout=2.0)
+            if initial_packet is not None:
                 # Display the initial frame right away
-                cv2image = cv2.cvtColor(initial_frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(cv2image)
-                img = img.resize((640, 480), Image.LANCZOS)
-                imgtk = ImageTk.PhotoImage(image=img)
-                camera_frame.imgtk = imgtk
-                camera_frame.configure(image=imgtk)
+                renderer.show(initial_packet.frame)
                 single_window.update()
             
         except Exception as e:
@@ -779,180 +876,147 @@ def mark_single_attendance():
         # Set a flag to track if attendance has been marked
         attendance_marked = False
         
+        # Today's attendance, written to disk in the background (see attendance_store.py)
+        ledger = get_attendance_ledger()
+        
+        # Attendance decision for the pipeline. Runs on the pipeline's decision
+        # thread, so it must not touch any widgets; it only reports events.
+        decision_done = False
+        
+        def decide(result):
+            nonlocal decision_done
+            
+            if decision_done:
+                return
+            
+            for face in result.faces:
+                if face.status != "recognized":
+                    continue
+                
+                id = face.id
+                employee_name = directory.get_name(id)
+                if employee_name is None:
+                    print(f"ERROR: No employee with ID {id}")
+                    face.status = "unknown"
+                    continue
+                face.name = employee_name
+                
+                # Mark attendance (the ledger knows if it was already marked today)
+                marked = ledger.mark(id, employee_name)
+                if marked is not None:
+                    date, timestamp = marked
+                    result.events.append(("marked", id, employee_name, timestamp))
+                else:
+                    face.marked = True
+                    result.events.append(("already", id, employee_name, None))
+                
+                # Single mode only handles the first recognized employee
+                decision_done = True
+                return
+        
+        # Faces are tracked and only count as recognized once enough predictions
+        # of their track agree, so one misidentified frame can't mark anyone
+        pipeline = RecognitionPipeline(cap, face_cascade, recognizer, decide=decide, tracking=True,
+                                       detect_interval=DETECT_EVERY_N_FRAMES)
+        
         # Define close_window function before it's used
         def close_window():
             try:
+                pipeline.stop()
                 cap.release()
+                ledger.flush()
                 single_window.destroy()
-                print("Camera released and window closed")
+                print(f"Camera released and window closed ({cap.frames_captured} frames captured, {cap.frames_dropped} dropped)")
             except Exception as e:
                 print(f"ERROR in close_window: {str(e)}")
         
+        # Function to show the outcome once the pipeline has decided
+        def show_attendance_result(kind, id, employee_name, timestamp):
+            if kind == "marked":
+                status_label.config(text=f"Attendance marked for {employee_name} (ID: {id})")
+                print(f"Attendance marked for {employee_name}")
+                
+                # Show success message
+                result_frame = tk.Frame(content_frame, bg="#e6f7e9", padx=20, pady=20)  # Light green
+                result_frame.pack(fill="x", pady=20, padx=50)
+                
+                result_msg = tk.Label(
+                    result_frame, 
+                    text=f"Attendance Successfully Marked!\n\nID: {id}\nName: {employee_name}\nTime: {timestamp}", 
+                    bg="#e6f7e9", 
+                    fg="#0d6832",  # Dark green
+                    font=('Segoe UI', 14),
+                    padx=20,
+                    pady=20
+                )
+                result_msg.pack()
+            else:
+                status_label.config(text=f"Attendance already marked for {employee_name}")
+                print(f"Attendance already marked for {employee_name}")
+                
+                # Show already marked message
+                result_frame = tk.Frame(content_frame, bg="#fff3e6", padx=20, pady=20)  # Light orange
+                result_frame.pack(fill="x", pady=20, padx=50)
+                
+                result_msg = tk.Label(
+                    result_frame, 
+                    text=f"Attendance Already Marked!\n\nID: {id}\nName: {employee_name}", 
+                    bg="#fff3e6", 
+                    fg="#cc7000",  # Dark orange
+                    font=('Segoe UI', 14),
+                    padx=20,
+                    pady=20
+                )
+                result_msg.pack()
+            
+            # Add close button
+            close_btn_frame = tk.Frame(content_frame, bg=BG_COLOR)
+            close_btn_frame.pack(pady=20)
+            
+            close_btn = create_round_button(close_btn_frame, "Close", close_window, 
+                                         width=10, height=1, font_size=12)
+            close_btn.pack()
+            
+            # Update window size to fit new content
+            single_window.update_idletasks()
+            new_height = single_window.winfo_reqheight()
+            single_window.geometry(f"{main_width}x{new_height}")
+            center_window(single_window, main_width, new_height)
+            
+            # Close after 3 seconds
+            single_window.after(3000, close_window)
+        
+        # Faces of the newest recognition result, drawn on every displayed frame
+        last_faces = []
+        last_frame_id = 0
+        
+        # UI loop: polls the pipeline and shows the newest frame. No detection or
+        # recognition happens here.
         def update_camera():
-            nonlocal attendance_marked
+            nonlocal attendance_marked, last_faces, last_frame_id
             
             if attendance_marked:
                 return
                 
             try:
-                ret, frame = cap.read()
-                if not ret:
-                    status_label.config(text="Error accessing camera")
-                    print("ERROR: Cannot read frame from camera")
-                    return
-                
-                # Make a copy of the frame to draw on
-                display_frame = frame.copy()
+                for kind, id, employee_name, timestamp in pipeline.get_events():
+                    attendance_marked = True
+                    pipeline.stop()
+                    show_attendance_result(kind, id, employee_name, timestamp)
                 
-                # Convert to grayscale for face detection
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-                
-                if len(faces) > 0:
-                    print(f"Detected {len(faces)} faces")
-                
-                for (x, y, w, h) in faces:
-                    # Draw rectangle around the face
-                    cv2.rectangle(display_frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
-                    
-                    try:
-                        # Recognize the face
-                        id, confidence = recognizer.predict(gray[y:y+h, x:x+w])
-                        print(f"Face recognized with ID: {id}, confidence: {confidence}")
-                        
-                        # Lower confidence is better in LBPH (0 is a perfect match)
-                        if confidence < 70:  # Adjust threshold as needed
-                            # Add text with the person's name
-                            try:
-                                employee_name = df.loc[df['ID'] == id, 'Name'].iloc[0]
-                                cv2.putText(display_frame, employee_name, (x, y-10), 
-                                         cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-                                
-                                # Mark attendance
-                                ts = time.time()
-                                date = datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d')
-                                timestamp = datetime.datetime.fromtimestamp(ts).strftime('%H:%M:%S')
-                                
-                                # Create attendance directory if it doesn't exist
-                                if not os.path.exists("Attendance"):
-                                    os.makedirs("Attendance")
-                                    
-                                # Create attendance file for today if it doesn't exist
-                                attendance_file = f"Attendance/{date}.csv"
-                                
-                                if not os.path.exists(attendance_file):
-                                    with open(attendance_file, 'w', newline='') as f:
-                                        writer = csv.writer(f)
-                                        writer.writerow(["ID", "Name", "Time"])
-                                
-                                # Check if attendance has already been marked for this employee today
-                                attendance_marked_already = False
-                                
-                                if os.path.exists(attendance_file):
-                                    attendance_df = pd.read_csv(attendance_file)
-                                    if id in attendance_df['ID'].values:
-                                        attendance_marked_already = True
-                                
-                                if not attendance_marked_already:
-                                    with open(attendance_file, 'a', newline='') as f:
-                                        writer = csv.writer(f)
-                                        writer.writerow([id, employee_name, timestamp])
-                                    
-                                    status_label.config(text=f"Attendance marked for {employee_name} (ID: {id})")
-                                    attendance_marked = True
-                                    print(f"Attendance marked for {employee_name}")
-                                    
-                                    # Show success message
-                                    success_frame = tk.Frame(content_frame, bg="#e6f7e9", padx=20, pady=20)  # Light green
-                                    success_frame.pack(fill="x", pady=20, padx=50)
-                                    
-                                    success_msg = tk.Label(
-                                        success_frame, 
-                                        text=f"Attendance Successfully Marked!\n\nID: {id}\nName: {employee_name}\nTime: {timestamp}", 
-                                        bg="#e6f7e9", 
-                                        fg="#0d6832",  # Dark green
-                                        font=('Segoe UI', 14),
-                                        padx=20,
-                                        pady=20
-                                    )
-                                    success_msg.pack()
-                                    
-                                    # Add close button
-                                    close_btn_frame = tk.Frame(content_frame, bg=BG_COLOR)
-                                    close_btn_frame.pack(pady=20)
-                                    
-                                    close_btn = create_round_button(close_btn_frame, "Close", close_window, 
-                                                                 width=10, height=1, font_size=12)
-                                    close_btn.pack()
-                                    
-                                    # Update window size to fit new content
-                                    single_window.update_idletasks()
-                                    new_height = single_window.winfo_reqheight()
-                                    single_window.geometry(f"{main_width}x{new_height}")
-                                    center_window(single_window, main_width, new_height)
-                                    
-                                    # Stop updating after 3 seconds
-                                    single_window.after(3000, close_window)
-                                    return
-                                else:
-                                    status_label.config(text=f"Attendance already marked for {employee_name}")
-                                    attendance_marked = True
-                                    print(f"Attendance already marked for {employee_name}")
-                                    
-                                    # Show already marked message
-                                    already_frame = tk.Frame(content_frame, bg="#fff3e6", padx=20, pady=20)  # Light orange
-                                    already_frame.pack(fill="x", pady=20, padx=50)
-                                    
-                                    already_msg = tk.Label(
-                                        already_frame, 
-                                        text=f"Attendance Already Marked!\n\nID: {id}\nName: {employee_name}", 
-                                        bg="#fff3e6", 
-                                        fg="#cc7000",  # Dark orange
-                                        font=('Segoe UI', 14),
-                                        padx=20,
-                                        pady=20
-                                    )
-                                    already_msg.pack()
-                                    
-                                    # Add close button
-                                    close_btn_frame = tk.Frame(content_frame, bg=BG_COLOR)
-                                    close_btn_frame.pack(pady=20)
-                                    
-                                    close_btn = create_round_button(close_btn_frame, "Close", close_window, 
-                                                                 width=10, height=1, font_size=12)
-                                    close_btn.pack()
-                                    
-                                    # Update window size to fit new content
-                                    single_window.update_idletasks()
-                                    new_height = single_window.winfo_reqheight()
-                                    single_window.geometry(f"{main_width}x{new_height}")
-                                    center_window(single_window, main_width, new_height)
-                                    
-                                    # Stop updating after 3 seconds
-                                    single_window.after(3000, close_window)
-                                    return
-                            except Exception as e:
-                                print(f"ERROR: Could not process employee data: {str(e)}")
-                                cv2.putText(display_frame, "Unknown", (x, y-10), 
-                                         cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-                        else:
-                            # Face detected but confidence too low
-                            cv2.putText(display_frame, "Unknown", (x, y-10), 
-                                     cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-                    except Exception as e:
-                        print(f"ERROR: Face recognition failed: {str(e)}")
-                        cv2.putText(display_frame, "Error", (x, y-10), 
-                                 cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+                for result in pipeline.get_results():
+                    last_faces = result.faces
                 
-                # Convert to ImageTk format to display
-                cv2image = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(cv2image)
-                img = img.resize((640, 480), Image.LANCZOS)
-                imgtk = ImageTk.PhotoImage(image=img)
+                if not pipeline.is_running() and not attendance_marked:
+                    status_label.config(text="Error accessing camera")
+                    print(f"ERROR: {pipeline.error}")
+                    return
                 
-                # Update the camera frame
-                camera_frame.imgtk = imgtk
-                camera_frame.configure(image=imgtk)
+                packet = pipeline.latest_frame()
+                if packet is not None and packet.frame_id != last_frame_id and renderer.due():
+                    last_frame_id = packet.frame_id
+                    renderer.show(packet.frame, last_faces)
+                    fps_label.config(text=f"Display: {renderer.rate.rate():.1f} FPS | Recognition: {pipeline.recognition_rate.rate():.1f} FPS")
                 
                 # Call this function again after 5 milliseconds for smoother video
                 if not attendance_marked:
@@ -972,7 +1036,8 @@ def mark_single_attendance():
                                          bg_color=ACCENT_COLOR, font_size=12)
         close_button.pack()
         
-        # Start updating the camera feed immediately
+        # Start the pipeline and the camera feed immediately
+        pipeline.start()
         update_camera()
         
         # Set focus to the window
@@ -988,10 +1053,12 @@ def mark_single_attendance():
 # Function to mark attendance continuously for multiple employees
 def mark_continuous_attendance():
     try:
-        # Check if the model exists
-        if not os.path.exists("TrainingImageLabel/trainer.yml"):
+        # Check if the model exists (fetching the registry first copies a
+        # legacy trainner.yml to trainer.yml)
+        get_model_registry()
+        if not os.path.exists(face_training.TRAINER_PATH):
             messagebox.showerror("Error", "Model file not found. Please train the model first.")
-            print("ERROR: TrainingImageLabel/trainer.yml not found")
+            print(f"ERROR: {face_training.TRAINER_PATH} not found")
             return
             
         # Create a window to display the camera feed and attendance list
@@ -1030,6 +1097,12 @@ def mark_continuous_attendance():
         
         camera_frame = tk.Label(camera_holder, bg="black")
         camera_frame.pack(fill="both", expand=True)
+        renderer = FrameRenderer(camera_frame)
+        
+        # Display and recognition rates
+        fps_label = create_label(left_frame, "", width=50, height=1, 
+                                font_size=9, bold=False, bg_color=BG_COLOR)
+        fps_label.pack()
         
         # Right frame for attendance list with fixed size
         right_frame_data = create_rounded_card(content_frame, width=400, height=550, padding_x=20, padding_y=20, radius=15)
@@ -1142,9 +1215,14 @@ def mark_continuous_attendance():
         
         print("Initializing face recognizer...")
         # Initialize the face recognizer
+        # The model and the parsed cascade file are shared by all windows and
+        # only read from disk again when they change; each window gets its own
+        # cascade classifier
+        models = get_model_registry()
         try:
-            recognizer = cv2.face.LBPHFaceRecognizer_create()
-            recognizer.read("TrainingImageLabel/trainer.yml")
+            models.get_recognizer()
+            # Predicts with whatever model is current, so a retrain is picked up live
+            recognizer = models.shared_recognizer()
             print("Face recognizer loaded successfully")
         except Exception as e:
             print(f"ERROR: Could not initialize face recognizer: {str(e)}")
@@ -1154,12 +1232,7 @@ def mark_continuous_attendance():
         
         # Load the face cascade
         try:
-            face_cascade = cv2.CascadeClassifier("haarcascade_frontalface_default.xml")
-            if face_cascade.empty():
-                print("ERROR: haarcascade_frontalface_default.xml file is empty or failed to load")
-                messagebox.showerror("Error", "Failed to load face detector. Check haarcascade_frontalface_default.xml file.")
-                continuous_window.destroy()
-                return
+            face_cascade = models.get_cascade()
             print("Face cascade loaded successfully")
         except Exception as e:
             print(f"ERROR: Could not load face cascade: {str(e)}")
@@ -1167,20 +1240,17 @@ def mark_continuous_attendance():
             continuous_window.destroy()
             return
         
-        # Load the employee details
-        try:
-            df = pd.read_csv("EmployeeDetails.csv")
-            print(f"Loaded {len(df)} employee records")
-        except Exception as e:
-            print(f"ERROR: Could not load EmployeeDetails.csv: {str(e)}")
-            messagebox.showerror("Error", f"Could not load employee details: {str(e)}")
-            continuous_window.destroy()
-            return
+        # Load the employee details (shared, and reloaded when the file changes;
+        # errors are printed and the last loaded records are kept)
+        directory = get_directory()
+        directory.reload_if_changed(force=True)
         
-        # Start the camera
+        # Start the camera on its own capture thread
         try:
-            cap = cv2.VideoCapture(0)
-            if not cap.isOpened():
+            cap = CameraStream()
+            try:
+                cap.start()
+            except RuntimeError:
                 print("ERROR: Could not open camera")
                 messagebox.showerror("Error", "Could not open camera. Please check your camera connection.")
                 continuous_window.destroy()
@@ -1192,110 +1262,69 @@ def mark_continuous_attendance():
             continuous_window.destroy()
             return
         
-        # Dictionary to track marked attendance to avoid duplicates
-        marked_attendance = {}
-        
-        # Attendance file path
-        attendance_file = f"Attendance/{today_date}.csv"
-        
-        # Create attendance file for today if it doesn't exist
-        if not os.path.exists("Attendance"):
-            os.makedirs("Attendance")
-            
-        if not os.path.exists(attendance_file):
-            with open(attendance_file, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(["ID", "Name", "Time"])
-        else:
-            # Load existing attendance records
-            if os.path.exists(attendance_file):
-                attendance_df = pd.read_csv(attendance_file)
-                for _, row in attendance_df.iterrows():
-                    marked_attendance[row['ID']] = row['Time']
-                    
-                # Display existing attendance records
-                for _, row in attendance_df.iterrows():
-                    add_attendance_record(row['ID'], row['Name'], row['Time'])
-                    
+        # Today's attendance with duplicate checks in memory. It switches to a new
+        # day at midnight and writes to disk in the background (see attendance_store.py)
+        ledger = get_attendance_ledger()
+        
+        # Function to show the attendance of a day, replacing what is listed
+        def show_day(date):
+            nonlocal today_date
+            today_date = date
+            date_label.config(text=f"Date: {today_date}")
+            for child in scrollable_frame.winfo_children():
+                child.destroy()
+            count_label.config(text="Total: 0")
+            for id, name, timestamp in ledger.get_records(today_date):
+                add_attendance_record(id, name, timestamp)
+        
+        # Load and display today's existing attendance records
+        show_day(ledger.roll_over())
+        
+        # Attendance decision for the pipeline. Runs on the pipeline's decision
+        # thread, so it must not touch any widgets; new marks are reported as events.
+        decide = make_continuous_decider(directory, ledger)
+        
+        # Faces are tracked between cascade runs, which is where continuous mode
+        # spends most of its time when people stand still
+        pipeline = RecognitionPipeline(cap, face_cascade, recognizer, decide=decide, tracking=True,
+                                       detect_interval=DETECT_EVERY_N_FRAMES)
+        
+        # Faces of the newest recognition result, drawn on every displayed frame
+        last_faces = []
+        last_frame_id = 0
+        
+        # UI loop: polls the pipeline and shows the newest frame. No detection or
+        # recognition happens here.
         def update_camera():
+            nonlocal last_faces, last_frame_id
+            
             try:
-                ret, frame = cap.read()
-                if not ret:
-                    status_label.config(text="Error accessing camera")
-                    print("ERROR: Cannot read frame from camera")
-                    return
-                
-                # Convert to grayscale
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                
-                # Detect faces
-                faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-                
-                if len(faces) > 0:
-                    print(f"Detected {len(faces)} faces")
+                # Start a new list when the day changes (the kiosk may run overnight)
+                current_date = datetime.datetime.now().strftime('%Y-%m-%d')
+                if current_date != today_date:
+                    show_day(ledger.roll_over())
                 
-                for (x, y, w, h) in faces:
-                    # Draw rectangle around the face
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
+                for kind, id, employee_name, timestamp in pipeline.get_events():
+                    # Add to UI
+                    add_attendance_record(id, employee_name, timestamp)
                     
-                    try:
-                        # Recognize the face
-                        id, confidence = recognizer.predict(gray[y:y+h, x:x+w])
-                        print(f"Face recognized with ID: {id}, confidence: {confidence}")
-                        
-                        # Lower confidence is better in LBPH (0 is a perfect match)
-                        if confidence < 70:  # Adjust threshold as needed
-                            # Get employee name from the ID
-                            try:
-                                employee_name = df.loc[df['ID'] == id, 'Name'].iloc[0]
-                                print(f"Matched with employee: {employee_name}")
-                                
-                                # Display employee name
-                                cv2.putText(frame, employee_name, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-                                
-                                # Check if attendance has already been marked for this employee
-                                if id not in marked_attendance:
-                                    # Mark attendance
-                                    ts = time.time()
-                                    timestamp = datetime.datetime.fromtimestamp(ts).strftime('%H:%M:%S')
-                                    
-                                    # Add to marked_attendance
-                                    marked_attendance[id] = timestamp
-                                    
-                                    # Save to CSV
-                                    with open(attendance_file, 'a', newline='') as f:
-                                        writer = csv.writer(f)
-                                        writer.writerow([id, employee_name, timestamp])
-                                    
-                                    # Add to UI
-                                    add_attendance_record(id, employee_name, timestamp)
-                                    
-                                    # Update status
-                                    status_label.config(text=f"Attendance marked for {employee_name} (ID: {id})")
-                                    print(f"Attendance marked for {employee_name}")
-                                else:
-                                    # Already marked, just display employee name
-                                    cv2.putText(frame, "Marked", (x, y+h+20), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                            except Exception as e:
-                                print(f"ERROR: Could not process employee data: {str(e)}")
-                                # No matching employee found
-                                cv2.putText(frame, "Unknown", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-                        else:
-                            # Face detected but confidence too low
-                            cv2.putText(frame, "Unknown", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-                    except Exception as e:
-                        print(f"ERROR: Face recognition failed: {str(e)}")
-                        cv2.putText(frame, "Error", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+                    # Update status
+                    status_label.config(text=f"Attendance marked for {employee_name} (ID: {id})")
+                    print(f"Attendance marked for {employee_name}")
                 
-                # Convert to ImageTk format
-                cv2image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(cv2image)
-                img = img.resize((640, 480), Image.LANCZOS)
-                imgtk = ImageTk.PhotoImage(image=img)
+                for result in pipeline.get_results():
+                    last_faces = result.faces
                 
-                # Update the camera frame
-                camera_frame.imgtk = imgtk
-                camera_frame.configure(image=imgtk)
+                if not pipeline.is_running():
+                    status_label.config(text="Error accessing camera")
+                    print(f"ERROR: {pipeline.error}")
+                    return
+                
+                packet = pipeline.latest_frame()
+                if packet is not None and packet.frame_id != last_frame_id and renderer.due():
+                    last_frame_id = packet.frame_id
+                    renderer.show(packet.frame, last_faces)
+                    fps_label.config(text=f"Display: {renderer.rate.rate():.1f} FPS | Recognition: {pipeline.recognition_rate.rate():.1f} FPS")
                 
                 # Call this function again after 10 milliseconds
                 camera_frame.after(10, update_camera)
@@ -1305,9 +1334,11 @@ def mark_continuous_attendance():
         
         def close_window():
             try:
+                pipeline.stop()
                 cap.release()
+                ledger.flush()
                 continuous_window.destroy()
-                print("Camera released and window closed")
+                print(f"Camera released and window closed ({cap.frames_captured} frames captured, {cap.frames_dropped} dropped)")
             except Exception as e:
                 print(f"ERROR in close_window: {str(e)}")
         
@@ -1317,7 +1348,7 @@ def mark_continuous_attendance():
         
         # Add a "Export to Excel" button
         export_btn = create_round_button(button_frame, "Export to Excel", 
-                                       lambda: export_to_excel(attendance_file), 
+                                       lambda: export_to_excel(ledger, today_date), 
                                        bg_color=PRIMARY_COLOR, font_size=12)
         export_btn.pack(side=tk.LEFT, padx=10)
         
@@ -1326,7 +1357,8 @@ def mark_continuous_attendance():
                                          bg_color=ACCENT_COLOR, font_size=12)
         close_button.pack(side=tk.LEFT, padx=10)
         
-        # Start updating the camera feed
+        # Start the pipeline and the camera feed
+        pipeline.start()
         continuous_window.after(10, update_camera)
         
         # Set focus to the window
@@ -1340,26 +1372,22 @@ def mark_continuous_attendance():
         messagebox.showerror("Error", f"An error occurred: {str(e)}")
 
 # Function to export attendance data to Excel
-def export_to_excel(attendance_file):
+def export_to_excel(ledger, date):
     try:
-        # Check if the file exists
-        if not os.path.exists(attendance_file):
-            messagebox.showerror("Error", "Attendance file not found.")
-            return
-            
-        # Try to read the CSV file
-        df = pd.read_csv(attendance_file)
+        # Read the records of the day, including ones not written to disk yet
+        records = ledger.get_records(date)
         
         # If there's no data, show an error
-        if len(df) == 0:
+        if len(records) == 0:
             messagebox.showinfo("Info", "No attendance records to export.")
             return
         
-        # Get base filename without extension
-        base_name = os.path.splitext(os.path.basename(attendance_file))[0]
+        # pandas is slow to import, so it's only loaded when needed (or by prewarm)
+        import pandas as pd
+        df = pd.DataFrame(records, columns=["ID", "Name", "Time"])
         
         # Create Excel file name
-        excel_file = f"Attendance/Excel/{base_name}.xlsx"
+        excel_file = f"Attendance/Excel/{date}.xlsx"
         
         # Create directory if it doesn't exist
         os.makedirs(os.path.dirname(excel_file), exist_ok=True)
@@ -1376,125 +1404,164 @@ def export_to_excel(attendance_file):
     except Exception as e:
         messagebox.showerror("Error", f"Failed to export data: {str(e)}")
 
-# Create gradient header for main window
-header = create_gradient_header(window, "Face Recognition Attendance System", font_size=22, height=100)
+# Function to build the main window and start the application
+def main():
+    global window
+    
+    # Frame source options, e.g. to replay a recorded session
+    parser = argparse.ArgumentParser(description="Face Recognition Attendance System")
+    parser.add_argument("--source", default=None,
+                        help="camera index, video file or folder of images (default: camera 0)")
+    parser.add_argument("--fast", action="store_true",
+                        help="process video files and image folders as fast as possible instead of in real time")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="serve pipeline metrics for Prometheus on this local port (0 = off)")
+    parser.add_argument("--stats-interval", type=float, default=0,
+                        help="seconds between pipeline statistics lines on the console (0 = off)")
+    args = parser.parse_args()
+    if args.source is not None:
+        camera.FRAME_SOURCE = camera.parse_source(args.source)
+    if args.fast:
+        camera.FRAME_SOURCE_REALTIME = False
+    mark_startup("imports")
+    
+    window = tk.Tk()
+    window.title("Face Recognition Attendance System")
+    window.configure(background=BG_COLOR)
+    
+    # Setup ttk styles
+    setup_styles()
+    
+    # Make the window resizable
+    window.resizable(True, True)
+    
+    # Create gradient header for main window
+    header = create_gradient_header(window, "Face Recognition Attendance System", font_size=22, height=100)
 
-# Main content area
-content_frame = tk.Frame(window, bg=BG_COLOR)
-content_frame.pack(fill="both", expand=True, pady=50)
+    # Main content area
+    content_frame = tk.Frame(window, bg=BG_COLOR)
+    content_frame.pack(fill="both", expand=True, pady=50)
 
-# Create card container with better spacing
-card_container = tk.Frame(content_frame, bg=BG_COLOR)
-card_container.pack()
+    # Create card container with better spacing
+    card_container = tk.Frame(content_frame, bg=BG_COLOR)
+    card_container.pack()
 
-# ------------------- Register Employee Card -------------------
-register_card_data = create_rounded_card(card_container, width=340, height=380, padding_x=25, padding_y=25, radius=20)
-register_card = register_card_data["frame"]
-register_card.grid(row=0, column=0, padx=30, pady=20)
+    # ------------------- Register Employee Card -------------------
+    register_card_data = create_rounded_card(card_container, width=340, height=380, padding_x=25, padding_y=25, radius=20)
+    register_card = register_card_data["frame"]
+    register_card.grid(row=0, column=0, padx=30, pady=20)
 
-register_inner = register_card_data["inner_frame"]
+    register_inner = register_card_data["inner_frame"]
 
-# Icon
-register_icon_label = create_label(register_inner, "👤", width=5, height=2, 
-                                 bg_color=CARD_BG_COLOR, font_size=48)
-register_icon_label.pack(pady=10)
+    # Icon
+    register_icon_label = create_label(register_inner, "👤", width=5, height=2, 
+                                     bg_color=CARD_BG_COLOR, font_size=48)
+    register_icon_label.pack(pady=10)
 
-# Title
-register_title = create_label(register_inner, "Register Employee", width=20, height=1, 
-                            bg_color=CARD_BG_COLOR, font_size=16)
-register_title.pack(pady=10)
+    # Title
+    register_title = create_label(register_inner, "Register Employee", width=20, height=1, 
+                                bg_color=CARD_BG_COLOR, font_size=16)
+    register_title.pack(pady=10)
 
-# Description
-register_desc = create_label(register_inner, "Add new employees to\nthe recognition system", 
-                           width=25, height=2, bg_color=CARD_BG_COLOR, 
-                           font_size=11, bold=False)
-register_desc.pack(pady=15)
+    # Description
+    register_desc = create_label(register_inner, "Add new employees to\nthe recognition system", 
+                               width=25, height=2, bg_color=CARD_BG_COLOR, 
+                               font_size=11, bold=False)
+    register_desc.pack(pady=15)
 
-# Register button
-register_btn = create_round_button(register_inner, "Register Now", register_employee, 
-                           width=15, height=1, font_size=12)
-register_btn.pack(pady=20)
+    # Register button
+    register_btn = create_round_button(register_inner, "Register Now", register_employee, 
+                               width=15, height=1, font_size=12)
+    register_btn.pack(pady=20)
 
-# ------------------- Start Attendance Card -------------------
-attendance_card_data = create_rounded_card(card_container, width=340, height=380, padding_x=25, padding_y=25, radius=20)
-attendance_card = attendance_card_data["frame"]
-attendance_card.grid(row=0, column=1, padx=30, pady=20)
+    # ------------------- Start Attendance Card -------------------
+    attendance_card_data = create_rounded_card(card_container, width=340, height=380, padding_x=25, padding_y=25, radius=20)
+    attendance_card = attendance_card_data["frame"]
+    attendance_card.grid(row=0, column=1, padx=30, pady=20)
 
-attendance_inner = attendance_card_data["inner_frame"]
+    attendance_inner = attendance_card_data["inner_frame"]
 
-# Icon
-attendance_icon_label = create_label(attendance_inner, "📋", width=5, height=2, 
-                                   bg_color=CARD_BG_COLOR, font_size=48)
-attendance_icon_label.pack(pady=10)
+    # Icon
+    attendance_icon_label = create_label(attendance_inner, "📋", width=5, height=2, 
+                                       bg_color=CARD_BG_COLOR, font_size=48)
+    attendance_icon_label.pack(pady=10)
 
-# Title
-attendance_title = create_label(attendance_inner, "Start Attendance", width=20, height=1, 
-                              bg_color=CARD_BG_COLOR, font_size=16)
-attendance_title.pack(pady=10)
+    # Title
+    attendance_title = create_label(attendance_inner, "Start Attendance", width=20, height=1, 
+                                  bg_color=CARD_BG_COLOR, font_size=16)
+    attendance_title.pack(pady=10)
 
-# Description
-attendance_desc = create_label(attendance_inner, "Begin automatic attendance\nusing face recognition", 
-                             width=25, height=2, bg_color=CARD_BG_COLOR, 
-                             font_size=11, bold=False)
-attendance_desc.pack(pady=15)
+    # Description
+    attendance_desc = create_label(attendance_inner, "Begin automatic attendance\nusing face recognition", 
+                                 width=25, height=2, bg_color=CARD_BG_COLOR, 
+                                 font_size=11, bold=False)
+    attendance_desc.pack(pady=15)
 
-# Start button
-attendance_btn = create_round_button(attendance_inner, "Start Now", start_attendance, 
-                             width=15, height=1, font_size=12)
-attendance_btn.pack(pady=20)
+    # Start button
+    attendance_btn = create_round_button(attendance_inner, "Start Now", start_attendance, 
+                                 width=15, height=1, font_size=12)
+    attendance_btn.pack(pady=20)
 
-# Footer with status information and rounded corners
-footer_height = 40
-footer_canvas = tk.Canvas(window, height=footer_height, bg=BG_COLOR, highlightthickness=0)
-footer_canvas.pack(fill=tk.X, side=tk.BOTTOM)
+    # Footer with status information and rounded corners
+    footer_height = 40
+    footer_canvas = tk.Canvas(window, height=footer_height, bg=BG_COLOR, highlightthickness=0)
+    footer_canvas.pack(fill=tk.X, side=tk.BOTTOM)
 
-# Create gradient for footer
-width = window.winfo_screenwidth()
-for i in range(footer_height):
-    # Calculate color based on position
-    r1, g1, b1 = int(GRADIENT_TOP[1:3], 16), int(GRADIENT_TOP[3:5], 16), int(GRADIENT_TOP[5:7], 16)
-    r2, g2, b2 = int(GRADIENT_BOTTOM[1:3], 16), int(GRADIENT_BOTTOM[3:5], 16), int(GRADIENT_BOTTOM[5:7], 16)
-    
-    ratio = i / footer_height
-    r = int(r1 * (1 - ratio) + r2 * ratio)
-    g = int(g1 * (1 - ratio) + g2 * ratio)
-    b = int(b1 * (1 - ratio) + b2 * ratio)
-    
-    color = f'#{r:02x}{g:02x}{b:02x}'
-    footer_canvas.create_line(0, i, width, i, fill=color)
+    # Create gradient for footer
+    width = window.winfo_screenwidth()
+    footer_canvas.gradient = get_gradient_image(width, footer_height)
+    footer_canvas.create_image(0, 0, image=footer_canvas.gradient, anchor="nw")
 
-# Add status text to footer
-footer_canvas.create_text(
-    width - 150, footer_height // 2,
-    text="Face Recognition Attendance System | v1.0",
-    fill="white",
-    font=('Segoe UI', 9)
-)
+    # Add status text to footer
+    footer_canvas.create_text(
+        width - 150, footer_height // 2,
+        text="Face Recognition Attendance System | v1.0",
+        fill="white",
+        font=('Segoe UI', 9)
+    )
 
-# Add status indicator
-footer_canvas.create_oval(20, footer_height // 2 - 5, 30, footer_height // 2 + 5, fill="#4cc9f0", outline="")
-footer_canvas.create_text(
-    80, footer_height // 2,
-    text="System Ready",
-    fill="white",
-    font=('Segoe UI', 9)
-)
+    # Add status indicator
+    footer_canvas.create_oval(20, footer_height // 2 - 5, 30, footer_height // 2 + 5, fill="#4cc9f0", outline="")
+    footer_canvas.create_text(
+        80, footer_height // 2,
+        text="System Ready",
+        fill="white",
+        font=('Segoe UI', 9)
+    )
 
-# Create required directories
-if not os.path.exists("TrainingImage"):
-    os.makedirs("TrainingImage")
-    
-if not os.path.exists("TrainingImageLabel"):
-    os.makedirs("TrainingImageLabel")
-    
-if not os.path.exists("Attendance"):
-    os.makedirs("Attendance")
+    mark_startup("window")
+
+    # Paint the home screen before doing anything else
+    window.update()
+    mark_startup("first paint")
+
+    # Create required directories
+    if not os.path.exists("TrainingImage"):
+        os.makedirs("TrainingImage")
+
+    if not os.path.exists("TrainingImageLabel"):
+        os.makedirs("TrainingImageLabel")
+
+    if not os.path.exists("Attendance"):
+        os.makedirs("Attendance")
+
+    # Create employee details CSV if it doesn't exist
+    if not os.path.exists("EmployeeDetails.csv"):
+        with open("EmployeeDetails.csv", 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["ID", "Name"])
+
+    start_metrics_server(args.metrics_port)
+    if args.stats_interval > 0:
+        MetricsLogger(get_metrics(), args.stats_interval).start()
+
+    # Load the model and the rest while the user is on the home screen
+    threading.Thread(target=prewarm, name="Prewarm", daemon=True).start()
 
-# Create employee details CSV if it doesn't exist
-if not os.path.exists("EmployeeDetails.csv"):
-    with open("EmployeeDetails.csv", 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(["ID", "Name"])
+    # Start the main loop
+    window.mainloop()
 
-# Start the main loop
-window.mainloop() 
\ No newline at end of file
+# The guard keeps training worker processes from building the UI when they
+# import this module
+if __name__ == "__main__":
+    main()
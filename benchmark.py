@@ -0,0 +1,392 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import face_training
+from gallery import Gallery, GalleryRecognizer, get_gallery_data_path
+from recognition_pipeline import detect_faces_scaled
+
+# Default benchmark matrix
+GALLERY_SIZES = [10, 100, 1000]
+FRAME_SIZES = [(640, 480), (1280, 720), (1920, 1080)]
+FACES_PER_FRAME = [1, 4]
+SAMPLES_PER_EMPLOYEE = 3
+FACE_SIZE = 100
+# Employees of the gallery the frame benchmark recognizes faces with
+FRAME_GALLERY_EMPLOYEES = 100
+# Frame width at which the drawn faces are pasted at their own size; wider
+# frames get proportionally bigger faces, like the same camera view would
+FRAME_FACE_WIDTH = 640
+
+
+# Function to make fake face crops: every employee gets a smooth random base
+# pattern, and each sample is that pattern with noise and a small brightness change
+def make_face_crops(n_employees, samples_per_employee, rng, size=FACE_SIZE):
+    crops = []
+    labels = []
+    for emp_id in range(1, n_employees + 1):
+        base = rng.integers(0, 256, (size // 4, size // 4), dtype=np.uint8)
+        base = cv2.resize(base, (size, size), interpolation=cv2.INTER_CUBIC)
+        for _ in range(samples_per_employee):
+            noise = rng.normal(0, 8, (size, size))
+            sample = np.clip(base.astype(np.float32) + noise + rng.uniform(-15, 15), 0, 255).astype(np.uint8)
+            crops.append(sample)
+            labels.append(emp_id)
+    return crops, np.array(labels, dtype=np.int32)
+
+
+# Function to make fake training images that the Haar cascade detects as
+# faces: a light oval with dark brows, eyes, nose and mouth on a darker
+# background. Every employee gets their own brightness and feature sizes, and
+# each sample adds noise and a brightness change.
+def make_face_images(n_employees, samples_per_employee, rng, size=FACE_SIZE):
+    images = []
+    labels = []
+    # Drawn at twice the size and scaled down, with a margin around the face
+    s = size * 2
+    margin = s // 4
+    k = s / 200.0
+    cx = cy = margin + s // 2
+    for emp_id in range(1, n_employees + 1):
+        background = int(rng.uniform(100, 140))
+        skin = int(rng.uniform(200, 230))
+        eyes = int(rng.uniform(22, 28) * k)
+        mouth = int(rng.uniform(18, 30) * k)
+
+        drawing = np.full((s + 2 * margin, s + 2 * margin), background, dtype=np.uint8)
+        cv2.ellipse(drawing, (cx, cy + int(5 * k)), (int(62 * k), int(80 * k)), 0, 0, 360, skin, -1)
+        for side in (-1, 1):
+            cv2.ellipse(drawing, (cx + side * eyes, cy - int(40 * k)), (int(16 * k), int(5 * k)), 0, 0, 360, 60, -1)
+            cv2.ellipse(drawing, (cx + side * eyes, cy - int(18 * k)), (int(13 * k), int(7 * k)), 0, 0, 360, 40, -1)
+        cv2.line(drawing, (cx, cy - int(15 * k)), (cx, cy + int(20 * k)), skin - 50, max(1, int(6 * k)))
+        cv2.ellipse(drawing, (cx, cy + int(45 * k)), (mouth, int(7 * k)), 0, 0, 360, 80, -1)
+        drawing = cv2.GaussianBlur(drawing, (0, 0), 3 * k)
+        base = cv2.resize(drawing, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+        for _ in range(samples_per_employee):
+            noise = rng.normal(0, 4, base.shape)
+            images.append(np.clip(base + noise + rng.uniform(-10, 10), 0, 255).astype(np.uint8))
+            labels.append(emp_id)
+    return images, np.array(labels, dtype=np.int32)
+
+
+# Function to make a BGR frame with some face images (see make_face_images)
+# pasted at random places that don't overlap, scaled with the frame width
+def make_frame(width, height, images, n_faces, rng):
+    frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    frame = cv2.GaussianBlur(frame, (9, 9), 0)
+    scale = width / float(FRAME_FACE_WIDTH)
+    side = int(round(images[0].shape[0] * scale))
+    # One face per cell of a grid of face-sized cells
+    columns, rows = max(1, width // side), max(1, height // side)
+    boxes = []
+    for cell in rng.choice(columns * rows, min(n_faces, columns * rows), replace=False):
+        image = images[int(rng.integers(0, len(images)))]
+        image = cv2.resize(image, (side, side), interpolation=cv2.INTER_LINEAR)
+        x, y = int(cell % columns) * side, int(cell // columns) * side
+        frame[y:y+side, x:x+side] = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        boxes.append((x, y, side, side))
+    return frame, boxes
+
+
+# Function to train the recognizer the frame benchmark uses on the faces the
+# cascade finds in some face images, as training would
+def make_frame_recognizer(face_cascade, images, labels):
+    faces, ids = [], []
+    for image, label in zip(images, labels):
+        for x, y, w, h in face_cascade.detectMultiScale(image):
+            faces.append(image[y:y+h, x:x+w])
+            ids.append(label)
+    if not faces:
+        raise ValueError("No faces detected in the gallery images")
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.train(faces, np.array(ids, dtype=np.int32))
+    return GalleryRecognizer(Gallery.from_recognizer(recognizer))
+
+
+# Function to get the face cascade next to this file, so the benchmark works
+# from any folder (the training benchmark changes folder)
+def get_cascade_path():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), face_training.CASCADE_PATH)
+
+
+# Function to time a call. Returns statistics in milliseconds.
+def time_call(fn, repeat=20, warmup=2):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000.0)
+    times = np.array(times)
+    return {
+        "repeat": repeat,
+        "mean_ms": float(times.mean()),
+        "median_ms": float(np.median(times)),
+        "p95_ms": float(np.percentile(times, 95)),
+        "min_ms": float(times.min()),
+    }
+
+
+# Function to time each stage of the attendance frame loop: detection and
+# recognition as the pipeline runs them, and the display conversion. Every
+# result records how many of the frame's faces the cascade detected; a frame
+# in which none were detected would time detection on an empty frame and skip
+# recognition, so it is reported as an error.
+def bench_frame_stages(face_cascade, recognizer, images, rng, frame_sizes, faces_per_frame, repeat):
+    results = []
+    for width, height in frame_sizes:
+        for n_faces in faces_per_frame:
+            frame, _ = make_frame(width, height, images, n_faces, rng)
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            boxes = detect_faces_scaled(face_cascade, gray, 1.3, 5)
+            if not boxes:
+                print(f"  ERROR: No faces detected in the {width}x{height} frame with {n_faces} faces")
+                continue
+            if len(boxes) != n_faces:
+                print(f"  WARNING: {len(boxes)} faces detected in the {width}x{height} frame with {n_faces} faces")
+
+            def recognize():
+                # What RecognitionPipeline.predict_faces does with the detected boxes
+                recognizer.predict_batch([gray[y:y+h, x:x+w] for x, y, w, h in boxes])
+
+            def display_convert():
+                # PIL conversion with a high-quality resampler
+                img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                img.resize((640, 480), Image.LANCZOS)
+
+            display_bgr = np.empty((480, 640, 3), dtype=np.uint8)
+            display_rgb = np.empty((480, 640, 3), dtype=np.uint8)
+
+            def display_buffer():
+                # What FrameRenderer does before pasting into its PhotoImage
+                cv2.resize(frame, (640, 480), dst=display_bgr, interpolation=cv2.INTER_LINEAR)
+                cv2.cvtColor(display_bgr, cv2.COLOR_BGR2RGB, dst=display_rgb)
+                Image.fromarray(display_rgb)
+
+            stages = {
+                "copy": lambda: frame.copy(),
+                "cvt_gray": lambda: cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY),
+                "detect_full": lambda: face_cascade.detectMultiScale(gray, 1.3, 5),
+                "detect_scaled": lambda: detect_faces_scaled(face_cascade, gray, 1.3, 5),
+                "recognize": recognize,
+                "display_convert": display_convert,
+                "display_buffer": display_buffer,
+            }
+            for stage, fn in stages.items():
+                stats = time_call(fn, repeat)
+                stats.update({"stage": stage, "width": width, "height": height, "faces": n_faces,
+                              "detected": len(boxes)})
+                results.append(stats)
+                print(f"  {stage:16s} {width}x{height} faces={n_faces} detected={len(boxes)}: "
+                      f"{stats['median_ms']:.2f} ms")
+    return results
+
+
+# Function to time recognizer.predict for galleries of different sizes, for
+# one face and for all the faces of a crowded frame
+def bench_predict(gallery_sizes, samples_per_employee, rng, repeat, crowd=max(FACES_PER_FRAME)):
+    results = []
+    for n_employees in gallery_sizes:
+        crops, labels = make_face_crops(n_employees, samples_per_employee, rng)
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+
+        train_stats = time_call(lambda: recognizer.train(crops, labels), repeat=1, warmup=0)
+        train_stats.update({"stage": "lbph_train", "employees": n_employees, "samples": len(crops)})
+        results.append(train_stats)
+
+        query = crops[len(crops) // 2]
+        predict_stats = time_call(lambda: recognizer.predict(query), repeat)
+        predict_stats.update({"stage": "lbph_predict", "employees": n_employees, "samples": len(crops)})
+        results.append(predict_stats)
+
+        # Saving and loading trainer.yml is part of every model update and window open
+        with tempfile.TemporaryDirectory() as folder:
+            model_path = os.path.join(folder, "trainer.yml")
+            save_stats = time_call(lambda: recognizer.write(model_path), repeat=1, warmup=0)
+            save_stats.update({"stage": "model_save", "employees": n_employees, "samples": len(crops),
+                               "bytes": os.path.getsize(model_path)})
+            results.append(save_stats)
+
+            def load():
+                loaded = cv2.face.LBPHFaceRecognizer_create()
+                loaded.read(model_path)
+            load_stats = time_call(load, repeat=1, warmup=0)
+            load_stats.update({"stage": "model_load", "employees": n_employees, "samples": len(crops)})
+            results.append(load_stats)
+
+            # The binary gallery that recognition loads instead of trainer.yml
+            gallery_path = os.path.join(folder, "trainer.gallery")
+            Gallery.from_recognizer(recognizer).save(gallery_path)
+            gallery_stats = time_call(lambda: Gallery.load(gallery_path), repeat=5, warmup=1)
+            gallery_stats.update({"stage": "gallery_load", "employees": n_employees, "samples": len(crops),
+                                  "bytes": os.path.getsize(get_gallery_data_path(gallery_path))})
+            results.append(gallery_stats)
+
+            gallery_recognizer = GalleryRecognizer(Gallery.load(gallery_path))
+            gallery_predict_stats = time_call(lambda: gallery_recognizer.predict(query), repeat)
+            gallery_predict_stats.update({"stage": "gallery_predict", "employees": n_employees,
+                                          "samples": len(crops)})
+            results.append(gallery_predict_stats)
+
+            # Every face of a crowded frame: one predict per face against one batch
+            frame_faces = [crops[int(i)] for i in rng.integers(0, len(crops), crowd)]
+            frame_stats = time_call(lambda: [recognizer.predict(face) for face in frame_faces], repeat)
+            frame_stats.update({"stage": "lbph_predict_frame", "employees": n_employees,
+                                "samples": len(crops), "faces": crowd})
+            results.append(frame_stats)
+            batch_stats = time_call(lambda: gallery_recognizer.predict_batch(frame_faces), repeat)
+            batch_stats.update({"stage": "gallery_predict_batch", "employees": n_employees,
+                                "samples": len(crops), "faces": crowd})
+            results.append(batch_stats)
+
+        print(f"  gallery {n_employees:5d} employees: train {train_stats['mean_ms']:.0f} ms, "
+              f"predict {predict_stats['median_ms']:.2f} ms, load {load_stats['mean_ms']:.0f} ms, "
+              f"gallery predict {gallery_predict_stats['median_ms']:.2f} ms, "
+              f"gallery load {gallery_stats['median_ms']:.2f} ms, {crowd} faces "
+              f"{frame_stats['median_ms']:.2f} ms -> batch {batch_stats['median_ms']:.2f} ms")
+    return results
+
+
+# Function to time the training data pipeline (get_images_and_labels) and a
+# full train_model() on a synthetic TrainingImage folder of drawn faces. A
+# run where the cascade finds no faces would only measure decoding, so it is
+# reported as an error instead.
+def bench_training(gallery_sizes, samples_per_employee, rng, workers):
+    results = []
+    cascade_path = get_cascade_path()
+    original_cwd = os.getcwd()
+    original_cascade = face_training.CASCADE_PATH
+
+    for n_employees in gallery_sizes:
+        folder = tempfile.mkdtemp(prefix="face_bench_")
+        try:
+            os.chdir(folder)
+            face_training.CASCADE_PATH = cascade_path
+            os.makedirs(face_training.TRAINING_IMAGE_DIR)
+            images, labels = make_face_images(n_employees, samples_per_employee, rng)
+            counters = {}
+            for image, label in zip(images, labels):
+                counters[label] = counters.get(label, 0) + 1
+                cv2.imwrite(f"{face_training.TRAINING_IMAGE_DIR}/User.{label}.{counters[label]}.jpg", image)
+
+            faces, _ = face_training.get_images_and_labels(use_cache=False, workers=workers)
+            if len(faces) == 0:
+                print(f"  ERROR: No faces detected in the {len(images)} training images of {n_employees} employees")
+                continue
+
+            # train_model() runs last, with the cache the stages before it left
+            stages = {
+                "load_images_serial": lambda: face_training.get_images_and_labels(use_cache=False, workers=1),
+                "load_images_parallel": lambda: face_training.get_images_and_labels(use_cache=False, workers=workers),
+                "load_images_cold_cache": lambda: face_training.get_images_and_labels(workers=workers),
+                "load_images_warm_cache": lambda: face_training.get_images_and_labels(workers=workers),
+                "train_model": lambda: face_training.train_model(workers=workers),
+            }
+            for stage, fn in stages.items():
+                stats = time_call(fn, repeat=1, warmup=0)
+                stats.update({"stage": stage, "employees": n_employees, "images": len(images), "detected": len(faces)})
+                results.append(stats)
+                print(f"  {stage:24s} {n_employees:5d} employees: {stats['mean_ms']:.0f} ms")
+        finally:
+            os.chdir(original_cwd)
+            face_training.CASCADE_PATH = original_cascade
+            shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+# Function to describe the machine and code the results come from
+def get_environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        commit = ""
+    return {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "opencv_threads": cv2.getNumThreads(),
+    }
+
+
+# Function to make a key that identifies the same measurement in two runs
+def result_key(result):
+    return tuple(sorted((k, v) for k, v in result.items() if not k.endswith("_ms") and k not in ("repeat", "bytes")))
+
+
+# Function to print how a run compares to an earlier one
+def compare_results(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {result_key(r): r for r in json.load(f)["results"]}
+    print(f"\nCompared to {baseline_path} (median, lower is better):")
+    for result in results:
+        old = baseline.get(result_key(result))
+        if old is None:
+            continue
+        label = ", ".join(f"{k}={v}" for k, v in result_key(result))
+        ratio = result["median_ms"] / old["median_ms"] if old["median_ms"] else float("inf")
+        print(f"  {label}: {old['median_ms']:.2f} -> {result['median_ms']:.2f} ms ({ratio:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the recognition and training hot paths on synthetic data")
+    parser.add_argument("--galleries", type=int, nargs="+", default=GALLERY_SIZES, help="gallery sizes (employees)")
+    parser.add_argument("--samples", type=int, default=SAMPLES_PER_EMPLOYEE,
+                        help="samples per employee (LBPH keeps 64 KB per sample in memory)")
+    parser.add_argument("--frame-sizes", nargs="+", default=[f"{w}x{h}" for w, h in FRAME_SIZES],
+                        help="frame sizes as WIDTHxHEIGHT")
+    parser.add_argument("--faces", type=int, nargs="+", default=FACES_PER_FRAME, help="faces per frame")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per measurement")
+    parser.add_argument("--workers", type=int, default=None, help="training loader workers (default: CPU count)")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["frame", "predict", "training"],
+                        help="benchmark groups to skip")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="JSON results file (default: benchmark-<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    frame_sizes = [tuple(int(v) for v in size.lower().split("x")) for size in args.frame_sizes]
+    face_cascade = cv2.CascadeClassifier(get_cascade_path())
+
+    results = []
+    if "frame" not in args.skip:
+        print("Frame loop stages:")
+        images, labels = make_face_images(FRAME_GALLERY_EMPLOYEES, args.samples, rng)
+        recognizer = make_frame_recognizer(face_cascade, images, labels)
+        results += bench_frame_stages(face_cascade, recognizer, images, rng, frame_sizes, args.faces, args.repeat)
+    if "predict" not in args.skip:
+        print("Recognition gallery:")
+        results += bench_predict(args.galleries, args.samples, rng, args.repeat, max(args.faces))
+    if "training" not in args.skip:
+        print("Training data pipeline:")
+        results += bench_training(args.galleries, args.samples, rng, args.workers)
+
+    output = args.output or f"benchmark-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, "w") as f:
+        json.dump({"environment": get_environment(), "settings": vars(args), "results": results}, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare_results(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import cv2
+import os
+import threading
+import time
+from collections import namedtuple
+from pipeline_metrics import get_metrics
+
+# Default frame source: a camera index, a video file or a folder of images
+FRAME_SOURCE = 0
+# Play video files and image folders at their frame rate (False = as fast as possible)
+FRAME_SOURCE_REALTIME = True
+# Frame rate of image folders (and of videos that don't report one)
+DEFAULT_SOURCE_FPS = 30.0
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+# One captured frame with its sequence number and capture time (time.time())
+FramePacket = namedtuple("FramePacket", ["frame", "frame_id", "timestamp"])
+
+
+# Function to turn a source given as text ("0", "video.mp4", "frames/") into
+# a camera index or a path
+def parse_source(source):
+    if isinstance(source, str) and source.strip().isdigit():
+        return int(source)
+    return source
+
+
+# Function to check if a source is a live camera
+def is_camera_source(source):
+    return isinstance(parse_source(source), int)
+
+
+# Sleeps between frames so a recorded source plays at its frame rate
+class FramePacer:
+    def __init__(self, fps, realtime=True):
+        self.interval = 1.0 / fps if realtime and fps and fps > 0 else 0.0
+        self.start = None
+        self.count = 0
+
+    def wait(self):
+        if self.interval == 0.0:
+            return
+        now = time.time()
+        if self.start is None:
+            self.start = now
+        # Aim at the frame's place on the timeline, so delays don't add up
+        delay = self.start + self.count * self.interval - now
+        if delay > 0:
+            time.sleep(delay)
+        self.count += 1
+
+
+# Video file with optional real-time pacing. Has the parts of the
+# cv2.VideoCapture interface the app uses (read, isOpened, set, release).
+class VideoFileSource:
+    def __init__(self, path, realtime=True, fps=None, loop=False):
+        self.path = path
+        self.loop = loop
+        self.cap = cv2.VideoCapture(path)
+        if fps is None:
+            fps = self.cap.get(cv2.CAP_PROP_FPS) or DEFAULT_SOURCE_FPS
+        self.pacer = FramePacer(fps, realtime)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        if ret:
+            self.pacer.wait()
+        return ret, frame
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        self.cap.release()
+
+
+# Folder of still images read in name order, with optional real-time pacing
+class ImageDirectorySource:
+    def __init__(self, path, realtime=True, fps=None, loop=False):
+        self.path = path
+        self.loop = loop
+        self.files = sorted(
+            os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        self.index = 0
+        self.pacer = FramePacer(fps or DEFAULT_SOURCE_FPS, realtime)
+
+    def isOpened(self):
+        return len(self.files) > 0
+
+    def read(self):
+        while True:
+            if self.index >= len(self.files):
+                if not self.loop or not self.files:
+                    return False, None
+                self.index = 0
+            image_path = self.files[self.index]
+            self.index += 1
+            frame = cv2.imread(image_path)
+            if frame is not None:
+                self.pacer.wait()
+                return True, frame
+            print(f"Skipping unreadable image {image_path}")
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        self.files = []
+
+
+# Function to open a frame source: a camera index, a video file or a folder
+# of images. Everything returned works like a cv2.VideoCapture.
+def open_frame_source(source=None, realtime=None, fps=None, loop=False):
+    if source is None:
+        source = FRAME_SOURCE
+    if realtime is None:
+        realtime = FRAME_SOURCE_REALTIME
+
+    source = parse_source(source)
+    if isinstance(source, int):
+        return cv2.VideoCapture(source)
+    if os.path.isdir(source):
+        return ImageDirectorySource(source, realtime=realtime, fps=fps, loop=loop)
+    return VideoFileSource(source, realtime=realtime, fps=fps, loop=loop)
+
+
+# Camera capture running on its own thread. Only the newest frame is kept, so
+# a slow consumer always gets the freshest frame instead of a stale buffered one.
+# The source can be anything open_frame_source() accepts. Recorded sources that
+# are not played in real time default to drop_frames=False: the capture thread
+# then waits for each frame to be read, so every frame gets processed.
+class CameraStream:
+    def __init__(self, source=None, realtime=None, fps=None, loop=False, drop_frames=None, metrics=None):
+        if source is None:
+            source = FRAME_SOURCE
+        if realtime is None:
+            realtime = FRAME_SOURCE_REALTIME
+        if drop_frames is None:
+            drop_frames = is_camera_source(source) or realtime
+
+        self.source = source
+        self.realtime = realtime
+        self.fps = fps
+        self.loop = loop
+        self.drop_frames = drop_frames
+        self.metrics = metrics if metrics is not None else get_metrics()
+        self.cap = None
+        self.thread = None
+        self.running = False
+        self.error = None
+
+        self._condition = threading.Condition()
+        self._latest = None
+        self._last_read_id = 0
+
+        # Counters
+        self.frames_captured = 0
+        self.frames_read = 0
+        self.frames_dropped = 0  # Captured but replaced before anyone read them
+
+    # Function to open the camera and start the capture thread
+    def start(self):
+        self.cap = open_frame_source(self.source, realtime=self.realtime, fps=self.fps, loop=self.loop)
+        if not self.cap.isOpened():
+            self.cap.release()
+            raise RuntimeError(f"Could not open frame source {self.source}")
+
+        # Keep the driver's own queue as short as possible
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        self.running = True
+        self.thread = threading.Thread(target=self._capture_loop, name="CameraStream", daemon=True)
+        self.thread.start()
+        return self
+
+    def _capture_loop(self):
+        while self.running:
+            start = time.time()
+            try:
+                ret, frame = self.cap.read()
+            except Exception as e:
+                ret, frame = False, None
+                self.error = str(e)
+
+            if not ret:
+                if self.error is None:
+                    if is_camera_source(self.source):
+                        self.error = "Cannot read frame from camera"
+                    else:
+                        self.error = "End of frame source"
+                break
+            # Includes the pacing sleep of recorded sources played in real time
+            self.metrics.observe("capture", time.time() - start)
+
+            with self._condition:
+                # Without dropping, wait until the previous frame has been read
+                if not self.drop_frames:
+                    self._condition.wait_for(
+                        lambda: not self.running or self._latest is None or self._latest.frame_id <= self._last_read_id)
+                    if not self.running:
+                        break
+                if self._latest is not None and self._latest.frame_id > self._last_read_id:
+                    self.frames_dropped += 1
+                self.frames_captured += 1
+                self._latest = FramePacket(frame, self.frames_captured, time.time())
+                self._condition.notify_all()
+
+        with self._condition:
+            self.running = False
+            self._condition.notify_all()
+
+        # The capture thread owns the camera, so it is also the one releasing it
+        self.cap.release()
+
+    # Function to get the newest frame that hasn't been read yet. Waits up to
+    # timeout seconds (None waits forever, 0 doesn't wait) and returns None if
+    # no new frame arrived or the camera stopped.
+    def read(self, timeout=None):
+        with self._condition:
+            has_new_frame = lambda: self._latest is not None and self._latest.frame_id > self._last_read_id
+            if not has_new_frame():
+                if timeout == 0 or not self.running:
+                    return None
+                self._condition.wait_for(lambda: has_new_frame() or not self.running, timeout)
+                if not has_new_frame():
+                    return None
+
+            packet = self._latest
+            self._last_read_id = packet.frame_id
+            self.frames_read += 1
+            # Wake up the capture thread if it waits for frames to be read
+            self._condition.notify_all()
+            return packet
+
+    # Function to stop the capture thread, which then releases the camera
+    def release(self):
+        with self._condition:
+            self.running = False
+            self._condition.notify_all()
+
+        if self.thread is None:
+            if self.cap is not None:
+                self.cap.release()
+        elif self.thread is not threading.current_thread():
+            self.thread.join(timeout=2.0)
@@ -0,0 +1,135 @@
+import csv
+import os
+import threading
+import time
+
+EMPLOYEE_DETAILS_PATH = "EmployeeDetails.csv"
+
+# Seconds between checks of the file's modification time
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+# In-memory ID -> record map of EmployeeDetails.csv. Lookups are dictionary
+# lookups, and the file is reloaded automatically when it changes on disk, so
+# employees registered elsewhere show up without reopening any window.
+class EmployeeDirectory:
+    def __init__(self, path=EMPLOYEE_DETAILS_PATH, check_interval=RELOAD_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.records = {}           # Replaced as a whole on reload, never changed in place
+        self.fieldnames = ["ID", "Name"]
+        self.file_key = None        # (mtime, size) of the loaded file
+        self.last_check = 0.0
+        self.lock = threading.Lock()
+        self.reload_if_changed(force=True)
+
+    # Function to get the (mtime, size) of the file, or None if it's missing
+    def _stat_key(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    # Function to read the file into a new map
+    def _load(self):
+        records = {}
+        fieldnames = ["ID", "Name"]
+        if os.path.exists(self.path):
+            with open(self.path, newline='') as f:
+                reader = csv.DictReader(f)
+                if reader.fieldnames:
+                    fieldnames = reader.fieldnames
+                for row in reader:
+                    try:
+                        id = int(row["ID"])
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    row["ID"] = id
+                    records[id] = row
+        return records, fieldnames
+
+    # Function to reload the file if it changed since it was loaded. The check
+    # itself is skipped if the last one was less than check_interval ago.
+    def reload_if_changed(self, force=False):
+        now = time.time()
+        if not force and now - self.last_check < self.check_interval:
+            return False
+
+        with self.lock:
+            self.last_check = now
+            key = self._stat_key()
+            if not force and key == self.file_key:
+                return False
+
+            try:
+                records, fieldnames = self._load()
+            except Exception as e:
+                print(f"ERROR: Could not load {self.path}: {str(e)}")
+                return False
+
+            self.records = records
+            self.fieldnames = fieldnames
+            self.file_key = key
+            print(f"Loaded {len(records)} employee records")
+            return True
+
+    # Function to get an employee's record, or None if the ID is unknown
+    def get(self, id):
+        self.reload_if_changed()
+        try:
+            return self.records.get(int(id))
+        except (TypeError, ValueError):
+            return None
+
+    # Function to get an employee's name, or None if the ID is unknown
+    def get_name(self, id):
+        record = self.get(id)
+        if record is None:
+            return None
+        return record["Name"]
+
+    def __contains__(self, id):
+        return self.get(id) is not None
+
+    def __len__(self):
+        self.reload_if_changed()
+        return len(self.records)
+
+    # Function to add an employee or rename an existing one, and save the file.
+    # The file is read again first, so employees saved by other processes since
+    # the last reload are kept; if it can't be read, nothing is written.
+    def save_employee(self, id, name):
+        with self.lock:
+            records, self.fieldnames = self._load()
+            record = dict(records.get(int(id), {}))
+            record["ID"] = int(id)
+            record["Name"] = name
+            records[int(id)] = record
+
+            # Write to a temporary file first so readers never see a half-written file
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=self.fieldnames, extrasaction="ignore")
+                writer.writeheader()
+                for row in records.values():
+                    writer.writerow(row)
+            os.replace(temp_path, self.path)
+
+            self.records = records
+            self.file_key = self._stat_key()
+
+
+# One directory per file, shared by every window and mode in the process
+_directories = {}
+_directories_lock = threading.Lock()
+
+
+# Function to get the shared directory of an employee details file
+def get_directory(path=EMPLOYEE_DETAILS_PATH):
+    with _directories_lock:
+        directory = _directories.get(path)
+        if directory is None:
+            directory = EmployeeDirectory(path)
+            _directories[path] = directory
+        return directory
@@ -0,0 +1,165 @@
+import cv2
+
+# Default tracking settings
+DETECT_EVERY_N_FRAMES = 5       # Run the cascade on every Nth frame
+TRACK_MIN_CONFIDENCE = 0.6      # Re-detect right away if a track matches worse than this
+TRACK_IOU_THRESHOLD = 0.3       # Minimum overlap to link a detection to a track
+TRACK_MAX_MISSED = 2            # Detections a track may miss before it is dropped
+TRACK_SEARCH_MARGIN = 0.5       # Search area around a track, as a fraction of its size
+TRACK_TEMPLATE_WIDTH = 32       # Templates are matched at this width to keep it cheap
+
+
+# Function to get the intersection over union of two (x, y, w, h) boxes
+def box_iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = min(ax + aw, bx + bw) - max(ax, bx)
+    ih = min(ay + ah, by + bh) - max(ay, by)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+# One face followed across frames
+class Track:
+    def __init__(self, track_id, box, template):
+        self.id = track_id
+        self.box = box
+        self.template = template    # Downscaled gray crop from the last detection
+        self.confidence = 1.0       # Template match score of the last update
+        self.missed = 0             # Detections in a row that didn't find this face
+        self.frames = 0             # Frames this track has been alive
+
+
+# Follows faces between cascade runs. The cascade runs every `detect_interval`
+# frames, or sooner when a track's template match drops below `min_confidence`.
+# In between, each face is found again by template matching in a small area
+# around its last position, which costs far less than a full cascade pass.
+class FaceTracker:
+    def __init__(self, detect, detect_interval=DETECT_EVERY_N_FRAMES, min_confidence=TRACK_MIN_CONFIDENCE,
+                 iou_threshold=TRACK_IOU_THRESHOLD, max_missed=TRACK_MAX_MISSED,
+                 search_margin=TRACK_SEARCH_MARGIN, template_width=TRACK_TEMPLATE_WIDTH):
+        self.detect = detect        # Function taking a gray frame and returning (x, y, w, h) boxes
+        self.detect_interval = max(1, int(detect_interval))
+        self.min_confidence = min_confidence
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.search_margin = search_margin
+        self.template_width = template_width
+
+        self.tracks = []
+        self.next_id = 1
+        self.frames_since_detect = None
+
+        # Counters
+        self.frames = 0
+        self.detections = 0
+
+    # Function to get the template of a box, scaled to the template width
+    def _make_template(self, gray, box):
+        x, y, w, h = box
+        scale = min(1.0, self.template_width / float(w))
+        crop = gray[y:y+h, x:x+w]
+        if scale < 1.0:
+            crop = cv2.resize(crop, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        return crop
+
+    # Function to find a track again in a new frame by template matching
+    def _follow(self, gray, track):
+        x, y, w, h = track.box
+        frame_h, frame_w = gray.shape[:2]
+        margin_x = int(w * self.search_margin)
+        margin_y = int(h * self.search_margin)
+        x1, y1 = max(0, x - margin_x), max(0, y - margin_y)
+        x2, y2 = min(frame_w, x + w + margin_x), min(frame_h, y + h + margin_y)
+
+        template = track.template
+        scale = template.shape[1] / float(w)
+        region = gray[y1:y2, x1:x2]
+        if scale < 1.0:
+            region = cv2.resize(region, (max(1, int(region.shape[1] * scale)), max(1, int(region.shape[0] * scale))),
+                                interpolation=cv2.INTER_AREA)
+
+        if region.shape[0] < template.shape[0] or region.shape[1] < template.shape[1]:
+            track.confidence = 0.0
+            return
+
+        scores = cv2.matchTemplate(region, template, cv2.TM_CCOEFF_NORMED)
+        _, best, _, (mx, my) = cv2.minMaxLoc(scores)
+        track.confidence = float(best)
+        track.box = (x1 + int(mx / scale), y1 + int(my / scale), w, h)
+
+    # Function to run the cascade and link the detections to the existing tracks
+    def _detect_and_associate(self, gray):
+        self.detections += 1
+        self.frames_since_detect = 0
+        boxes = [tuple(int(v) for v in box) for box in self.detect(gray)]
+
+        # Greedy matching, best overlaps first
+        pairs = []
+        for t_index, track in enumerate(self.tracks):
+            for d_index, box in enumerate(boxes):
+                iou = box_iou(track.box, box)
+                if iou >= self.iou_threshold:
+                    pairs.append((iou, t_index, d_index))
+        pairs.sort(reverse=True)
+
+        matched_tracks = set()
+        matched_boxes = set()
+        for _, t_index, d_index in pairs:
+            if t_index in matched_tracks or d_index in matched_boxes:
+                continue
+            matched_tracks.add(t_index)
+            matched_boxes.add(d_index)
+            track = self.tracks[t_index]
+            track.box = boxes[d_index]
+            track.template = self._make_template(gray, track.box)
+            track.confidence = 1.0
+            track.missed = 0
+
+        # Tracks the cascade didn't find again are kept for a few detections
+        kept = []
+        for t_index, track in enumerate(self.tracks):
+            if t_index not in matched_tracks:
+                track.missed += 1
+                if track.missed > self.max_missed or track.confidence < self.min_confidence:
+                    continue
+            kept.append(track)
+        self.tracks = kept
+
+        # New faces start new tracks
+        for d_index, box in enumerate(boxes):
+            if d_index not in matched_boxes:
+                self.tracks.append(Track(self.next_id, box, self._make_template(gray, box)))
+                self.next_id += 1
+
+    # Function to update the tracks with a new gray frame. Returns the tracks
+    # and whether the cascade ran on this frame.
+    def update(self, gray):
+        self.frames += 1
+
+        if self.frames_since_detect is None or self.frames_since_detect + 1 >= self.detect_interval:
+            self._detect_and_associate(gray)
+            detected = True
+        else:
+            self.frames_since_detect += 1
+            for track in self.tracks:
+                self._follow(gray, track)
+
+            # Tracking got unsure, so look at the whole frame again
+            if any(track.confidence < self.min_confidence for track in self.tracks):
+                self._detect_and_associate(gray)
+                detected = True
+            else:
+                detected = False
+
+        for track in self.tracks:
+            track.frames += 1
+
+        return self.tracks, detected
+
+    # Function to forget every track (e.g. after a long gap in the frames)
+    def reset(self):
+        self.tracks = []
+        self.frames_since_detect = None
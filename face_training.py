@@ -0,0 +1,510 @@
+import cv2
+import multiprocessing
+import os
+import shutil
+import zlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+import lbph
+from gallery import Gallery
+from gallery_index import save_indexed_gallery
+
+# Paths used by the training code
+TRAINING_IMAGE_DIR = "TrainingImage"
+TRAINER_DIR = "TrainingImageLabel"
+TRAINER_PATH = "TrainingImageLabel/trainer.yml"
+# Model file written by older versions of training.py, used if there is no trainer.yml
+LEGACY_TRAINER_PATH = "TrainingImageLabel/trainner.yml"
+CASCADE_PATH = "haarcascade_frontalface_default.xml"
+FACE_CACHE_DIR = "TrainingImageLabel/cache"
+# Registration captures into a subfolder of this, and the images only replace
+# the employee's training images once the capture succeeded
+CAPTURE_DIR = "TrainingImageLabel/capture"
+
+# Binary copy of trainer.yml that recognition loads instead (see gallery.py).
+# "float16" halves its size at a small cost in distance precision.
+GALLERY_PATH = "TrainingImageLabel/trainer.gallery"
+GALLERY_DTYPE = "float32"
+# Samples kept per employee in the gallery (see Gallery.compact); 0 keeps
+# them all. trainer.yml always keeps every sample.
+GALLERY_PROTOTYPES = 0
+
+# Parallel loading settings (None means one worker per CPU core)
+TRAINING_WORKERS = None
+TRAINING_CHUNK_SIZE = 16
+# Below this many images to detect, a process pool costs more than it saves
+MIN_PARALLEL_IMAGES = 32
+
+# Registration capture filters (see SampleSelector). A face is only saved if
+# it is big and sharp enough and differs enough from the samples already
+# saved, and capture stops once CAPTURE_TARGET_SAMPLES are saved.
+CAPTURE_MIN_FACE_SIZE = 80      # Smallest face width in pixels (smaller faces are not detected)
+CAPTURE_MIN_SHARPNESS = 50.0    # Smallest variance of the Laplacian (lower is blurrier)
+CAPTURE_SHARPNESS_SIZE = 128    # Faces are resized to this before measuring sharpness
+CAPTURE_MIN_DISTANCE = 25.0     # Smallest LBPH distance to every saved sample
+CAPTURE_TARGET_SAMPLES = 40     # Capture stops once this many samples are saved
+CAPTURE_MIN_SAMPLES = 15        # Fewest samples a registration is accepted with
+CAPTURE_TIMEOUT = 60.0          # Seconds after which capture stops anyway
+
+# Function to get the employee ID from a training image file name (User.<id>.<n>.jpg)
+def get_id_from_path(image_path):
+    return int(os.path.split(image_path)[-1].split(".")[1])
+
+# Function to list the training images, optionally only those of one employee
+def list_training_images(path=TRAINING_IMAGE_DIR, emp_id=None):
+    if not os.path.exists(path):
+        return []
+
+    file_names = sorted(os.listdir(path))
+    if emp_id is not None:
+        prefix = f"User.{emp_id}."
+        file_names = [f for f in file_names if f.startswith(prefix)]
+
+    return [os.path.join(path, f) for f in file_names]
+
+# Function to delete the training images of one employee (used when overwriting)
+def remove_employee_images(emp_id, path=TRAINING_IMAGE_DIR):
+    for image_path in list_training_images(path, emp_id):
+        os.remove(image_path)
+
+# Function to get an empty folder to capture an employee's images into
+def start_capture(emp_id):
+    capture_dir = os.path.join(CAPTURE_DIR, str(emp_id))
+    shutil.rmtree(capture_dir, ignore_errors=True)
+    os.makedirs(capture_dir)
+    return capture_dir
+
+# Function to replace an employee's training images with the captured ones
+def keep_capture(emp_id, capture_dir, path=TRAINING_IMAGE_DIR):
+    if not os.path.exists(path):
+        os.makedirs(path)
+    remove_employee_images(emp_id, path)
+    for image_path in list_training_images(capture_dir, emp_id):
+        os.replace(image_path, os.path.join(path, os.path.basename(image_path)))
+    discard_capture(capture_dir)
+
+# Function to delete a capture folder, leaving the training images as they were
+def discard_capture(capture_dir):
+    shutil.rmtree(capture_dir, ignore_errors=True)
+
+# Function to measure how sharp a gray face crop is: the variance of its
+# Laplacian, measured at a fixed size so big and small faces compare
+def get_sharpness(face, size=CAPTURE_SHARPNESS_SIZE):
+    face = cv2.resize(face, (size, size), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(face, cv2.CV_64F).var())
+
+# Picks the registration samples worth keeping. Consecutive frames of a
+# person standing still give nearly the same face, which only makes the
+# model bigger and slower, so a face is rejected if it is too small, blurry,
+# or closer than min_distance (the LBPH distance recognition uses) to a
+# sample that was already kept.
+class SampleSelector:
+    def __init__(self, target=CAPTURE_TARGET_SAMPLES, min_size=CAPTURE_MIN_FACE_SIZE,
+                 min_sharpness=CAPTURE_MIN_SHARPNESS, min_distance=CAPTURE_MIN_DISTANCE):
+        self.target = target
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.min_distance = min_distance
+        self.bins = None           # (dim, target) histograms of the kept samples, bin-major like a gallery
+        self.sums = np.zeros(target)
+        self.kept = 0
+        self.rejected = {"small": 0, "blurry": 0, "duplicate": 0}
+
+    @property
+    def done(self):
+        return self.kept >= self.target
+
+    # Function to check a gray face crop. Returns None if it is kept, or why
+    # it was rejected ("small", "blurry" or "duplicate"). Faces are no longer
+    # kept once the target is reached.
+    def consider(self, face):
+        if self.done:
+            return "duplicate"
+        if min(face.shape[:2]) < self.min_size:
+            reason = "small"
+        elif get_sharpness(face) < self.min_sharpness:
+            reason = "blurry"
+        else:
+            histogram = lbph.compute_histogram(face)
+            if self.bins is None:
+                self.bins = np.zeros((len(histogram), self.target), dtype=np.float32)
+            distances = lbph.chi_square_distances(self.bins[:, :self.kept], self.sums[:self.kept], histogram)[0]
+            if len(distances) and distances.min() < self.min_distance:
+                reason = "duplicate"
+            else:
+                self.bins[:, self.kept] = histogram
+                self.sums[self.kept] = histogram.sum(dtype=np.float64)
+                self.kept += 1
+                return None
+        self.rejected[reason] += 1
+        return reason
+
+# Function to load one training image and return the face crops found in it
+def detect_faces_in_file(image_path, detector):
+    # Load image and convert to grayscale
+    pil_img = Image.open(image_path).convert('L')
+    img_numpy = np.array(pil_img, 'uint8')
+
+    # Detect faces
+    faces = detector.detectMultiScale(img_numpy)
+
+    return [img_numpy[y:y+h, x:x+w] for (x, y, w, h) in faces]
+
+# Cascade of the current pool worker process, loaded once per process
+_worker_detector = None
+
+# Function run once in every pool worker process
+def _init_worker(cascade_path):
+    global _worker_detector
+    # Each process is one worker, so keep OpenCV from starting its own threads
+    cv2.setNumThreads(1)
+    _worker_detector = cv2.CascadeClassifier(cascade_path)
+
+# Function run in a pool worker for one image. Errors are returned instead of
+# raised so one bad file doesn't stop the whole batch.
+def _detect_faces_worker(image_path):
+    try:
+        return detect_faces_in_file(image_path, _worker_detector), None
+    except Exception as e:
+        return None, str(e)
+
+# Function to detect the faces in a list of images, in parallel when worth it.
+# Results are returned in the same order as image_paths as (crops, error) pairs.
+def detect_faces_in_files(image_paths, workers=None, chunk_size=None):
+    if workers is None:
+        workers = TRAINING_WORKERS or os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = TRAINING_CHUNK_SIZE
+
+    if workers <= 1 or len(image_paths) < MIN_PARALLEL_IMAGES:
+        detector = cv2.CascadeClassifier(CASCADE_PATH)
+        results = []
+        for image_path in image_paths:
+            try:
+                results.append((detect_faces_in_file(image_path, detector), None))
+            except Exception as e:
+                results.append((None, str(e)))
+        return results
+
+    # map() keeps the input order, so samples and labels stay deterministic.
+    # Workers are spawned, not forked: the GUI calls this with threads
+    # running, and forking next to OpenCV's thread pool can deadlock. Spawned
+    # workers only see the module's default cascade path, so it is passed on.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(CASCADE_PATH,)) as pool:
+        return list(pool.map(_detect_faces_worker, image_paths, chunksize=chunk_size))
+
+# Function to get the cache key of a training image (name, mtime and size)
+def get_file_key(image_path):
+    stat = os.stat(image_path)
+    return (os.path.basename(image_path), stat.st_mtime_ns, stat.st_size)
+
+# Function to get the face crop cache folder of an image folder. TrainingImage
+# uses FACE_CACHE_DIR; any other folder gets its own subfolder in it, so two
+# image trees with the same employee IDs don't overwrite each other's cache.
+def get_cache_dir(path=TRAINING_IMAGE_DIR):
+    folder = os.path.abspath(path)
+    if folder == os.path.abspath(TRAINING_IMAGE_DIR):
+        return FACE_CACHE_DIR
+    return os.path.join(FACE_CACHE_DIR, f"{os.path.basename(folder)}-{zlib.crc32(folder.encode()):08x}")
+
+# Function to get the path of an employee's face crop cache
+def get_cache_path(emp_id, cache_dir=FACE_CACHE_DIR):
+    return os.path.join(cache_dir, f"User.{emp_id}.npz")
+
+# Function to load an employee's face crop cache as {file key: [crops]}
+def load_face_cache(emp_id, cache_dir=FACE_CACHE_DIR):
+    cache_path = get_cache_path(emp_id, cache_dir)
+    if not os.path.exists(cache_path):
+        return {}
+
+    try:
+        with np.load(cache_path) as cache:
+            names = cache["names"]
+            mtimes = cache["mtimes"]
+            sizes = cache["sizes"]
+            counts = cache["counts"]
+            shapes = cache["shapes"]
+            data = cache["data"]
+    except Exception as e:
+        print(f"Ignoring unreadable face cache {cache_path}: {str(e)}")
+        return {}
+
+    # Crops are stored flattened one after another in a single array
+    entries = {}
+    crop_index = 0
+    offset = 0
+    for name, mtime, size, count in zip(names, mtimes, sizes, counts):
+        crops = []
+        for _ in range(count):
+            h, w = shapes[crop_index]
+            crops.append(data[offset:offset + h * w].reshape(h, w))
+            offset += h * w
+            crop_index += 1
+        entries[(str(name), int(mtime), int(size))] = crops
+
+    return entries
+
+# Function to save an employee's face crop cache in one packed archive
+def save_face_cache(emp_id, entries, cache_dir=FACE_CACHE_DIR):
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    keys = sorted(entries)
+    crops = [crop for key in keys for crop in entries[key]]
+
+    if crops:
+        data = np.concatenate([crop.ravel() for crop in crops])
+        shapes = np.array([crop.shape for crop in crops], dtype=np.int32)
+    else:
+        data = np.zeros(0, dtype=np.uint8)
+        shapes = np.zeros((0, 2), dtype=np.int32)
+
+    # Write to a temporary file first so an interrupted save can't corrupt the cache
+    cache_path = get_cache_path(emp_id, cache_dir)
+    temp_path = cache_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        np.savez(
+            f,
+            names=np.array([key[0] for key in keys]),
+            mtimes=np.array([key[1] for key in keys], dtype=np.int64),
+            sizes=np.array([key[2] for key in keys], dtype=np.int64),
+            counts=np.array([len(entries[key]) for key in keys], dtype=np.int32),
+            shapes=shapes,
+            data=data,
+        )
+    os.replace(temp_path, cache_path)
+
+# Function to get images and labels for training. Face crops are cached per
+# employee, so only new or changed images are decoded and detected again, and
+# those are spread over a pool of worker processes.
+def get_images_and_labels(path=TRAINING_IMAGE_DIR, emp_id=None, use_cache=True,
+                          workers=None, chunk_size=None, cache_dir=None):
+    image_paths = list_training_images(path, emp_id)
+    cache_dir = cache_dir or get_cache_dir(path)
+
+    # Group the images by employee so each cache file is read and written once
+    paths_by_id = {}
+    for image_path in image_paths:
+        try:
+            # Get the ID from the image file name
+            id = get_id_from_path(image_path)
+        except Exception as e:
+            print(f"Error processing {image_path}: {str(e)}")
+            continue
+        paths_by_id.setdefault(id, []).append(image_path)
+
+    # Look every image up in its employee's cache and collect the misses
+    caches = {}
+    keys = {}
+    missing_paths = []
+    for id, id_paths in paths_by_id.items():
+        caches[id] = load_face_cache(id, cache_dir) if use_cache else {}
+        for image_path in id_paths:
+            try:
+                key = get_file_key(image_path)
+            except Exception as e:
+                print(f"Error processing {image_path}: {str(e)}")
+                continue
+            keys[image_path] = key
+            if key not in caches[id]:
+                missing_paths.append(image_path)
+
+    # Decode and detect all the misses in one parallel batch
+    detected = {}
+    results = detect_faces_in_files(missing_paths, workers, chunk_size) if missing_paths else []
+    for image_path, (crops, error) in zip(missing_paths, results):
+        if error is not None:
+            print(f"Error processing {image_path}: {error}")
+            continue
+        detected[image_path] = crops
+
+    face_samples = []
+    ids = []
+    for id, id_paths in paths_by_id.items():
+        cache = caches[id]
+        entries = {}
+
+        for image_path in id_paths:
+            key = keys.get(image_path)
+            if key is None:
+                continue
+            if key in cache:
+                crops = cache[key]
+            elif image_path in detected:
+                crops = detected[image_path]
+            else:
+                continue
+            entries[key] = crops
+
+            # Store face samples and IDs
+            for crop in crops:
+                face_samples.append(crop)
+                ids.append(id)
+
+        # Rewrite the cache only if files were added, changed or removed
+        if use_cache and entries.keys() != cache.keys():
+            try:
+                save_face_cache(id, entries, cache_dir)
+            except Exception as e:
+                print(f"Error saving face cache for {id}: {str(e)}")
+
+    return face_samples, ids
+
+# Function to train the model from every image in TrainingImage. Returns the
+# recognizer and the (gallery, index) its gallery file was saved with.
+def train_model(workers=None, chunk_size=None):
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+
+    # Create directory for training labels if it doesn't exist
+    if not os.path.exists(TRAINER_DIR):
+        os.makedirs(TRAINER_DIR)
+
+    # Get faces and IDs
+    faces, ids = get_images_and_labels(TRAINING_IMAGE_DIR, workers=workers, chunk_size=chunk_size)
+
+    # Train the model
+    recognizer.train(faces, np.array(ids))
+
+    # Save the model
+    save_trainer(recognizer)
+    saved = save_gallery(recognizer)
+
+    return recognizer, saved
+
+# Function to get a temporary file name next to a model file. The extension
+# is kept, since OpenCV picks the file format from it.
+def get_temp_path(path):
+    root, ext = os.path.splitext(path)
+    return f"{root}.{os.getpid()}.tmp{ext}"
+
+# Function to copy a model trained by older versions of training.py
+# (trainner.yml) to trainer.yml when there is no trainer.yml yet. Returns
+# True if it was copied.
+def migrate_legacy_trainer(path=TRAINER_PATH, legacy_path=LEGACY_TRAINER_PATH):
+    if os.path.exists(path) or not os.path.exists(legacy_path):
+        return False
+    temp_path = get_temp_path(path)
+    shutil.copyfile(legacy_path, temp_path)
+    os.replace(temp_path, path)
+    print(f"Copied the model {legacy_path} of an older version to {path}")
+    return True
+
+# Function to save a trained model. It is written to a temporary file first,
+# so processes reloading trainer.yml never read a half-written one.
+def save_trainer(recognizer, path=TRAINER_PATH):
+    temp_path = get_temp_path(path)
+    recognizer.save(temp_path)
+    os.replace(temp_path, path)
+
+# Function to save the gallery file of a trained model next to trainer.yml.
+# Returns the (gallery, index) it was saved with.
+def save_gallery(recognizer, path=GALLERY_PATH, dtype=None, prototypes=None):
+    return write_gallery(Gallery.from_recognizer(recognizer), path, dtype, prototypes)
+
+# Function to compact a gallery to `prototypes` samples per employee
+# (GALLERY_PROTOTYPES by default; 0 keeps every sample)
+def compact_gallery(gallery, prototypes=None):
+    prototypes = GALLERY_PROTOTYPES if prototypes is None else prototypes
+    return gallery.compact(prototypes) if prototypes > 0 else gallery
+
+# Function to save a gallery, first compacted to `prototypes` samples per
+# employee (GALLERY_PROTOTYPES by default), with its index if it is large.
+# Returns (gallery as saved, index or None), see save_indexed_gallery.
+def write_gallery(gallery, path=GALLERY_PATH, dtype=None, prototypes=None):
+    count = len(gallery)
+    gallery = compact_gallery(gallery, prototypes)
+    if len(gallery) < count:
+        print(f"Gallery compacted from {count} to {len(gallery)} samples")
+    return save_indexed_gallery(gallery, path, dtype=dtype or GALLERY_DTYPE)
+
+# Function to write an LBPH model file from its parameters and histograms.
+# OpenCV has no API to remove samples from a trained LBPH model, so this is
+# how the samples of one employee are dropped without retraining everyone.
+def write_trainer(path, histograms, labels, radius=1, neighbors=8, grid_x=8, grid_y=8,
+                  threshold=1.7976931348623157e+308):
+    temp_path = get_temp_path(path)
+    fs = cv2.FileStorage(temp_path, cv2.FILE_STORAGE_WRITE)
+    fs.startWriteStruct("opencv_lbphfaces", cv2.FileNode_MAP)
+    fs.write("threshold", float(threshold))
+    fs.write("radius", int(radius))
+    fs.write("neighbors", int(neighbors))
+    fs.write("grid_x", int(grid_x))
+    fs.write("grid_y", int(grid_y))
+
+    fs.startWriteStruct("histograms", cv2.FileNode_SEQ)
+    for hist in histograms:
+        fs.write("", np.asarray(hist, dtype=np.float32).reshape(1, -1))
+    fs.endWriteStruct()
+
+    fs.write("labels", np.asarray(labels, dtype=np.int32).reshape(-1, 1))
+    fs.startWriteStruct("labelsInfo", cv2.FileNode_SEQ)
+    fs.endWriteStruct()
+    fs.endWriteStruct()
+    fs.release()
+    os.replace(temp_path, path)
+
+# Function to drop every sample of one employee from a loaded recognizer.
+# The model on disk is left alone: the pruned model goes through a temporary
+# file, since OpenCV can only load a model from a file.
+def remove_employee_from_model(recognizer, emp_id):
+    labels = recognizer.getLabels().ravel()
+    keep = labels != int(emp_id)
+    if keep.all():
+        return recognizer
+
+    histograms = recognizer.getHistograms()
+    kept_histograms = [hist for hist, k in zip(histograms, keep) if k]
+    temp_path = get_temp_path(TRAINER_PATH)
+    try:
+        write_trainer(
+            temp_path,
+            kept_histograms,
+            labels[keep],
+            radius=recognizer.getRadius(),
+            neighbors=recognizer.getNeighbors(),
+            grid_x=recognizer.getGridX(),
+            grid_y=recognizer.getGridY(),
+            threshold=recognizer.getThreshold(),
+        )
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        recognizer.read(temp_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return recognizer
+
+# Function to add one employee's samples to the existing model instead of
+# retraining from scratch. With replace=True the employee's previous samples
+# are removed from the model first (used when an ID is overwritten). The
+# model files are only written once the new model is complete. Returns the
+# recognizer and the (gallery, index) its gallery file was saved with.
+def update_model(emp_id, replace=False):
+    # Nothing to update yet, so fall back to a full training
+    migrate_legacy_trainer()
+    if not os.path.exists(TRAINER_PATH):
+        return train_model()
+
+    # Only the new employee's images are loaded and detected
+    faces, ids = get_images_and_labels(TRAINING_IMAGE_DIR, emp_id)
+    if len(faces) == 0:
+        raise ValueError(f"No face samples found for employee {emp_id}")
+
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(TRAINER_PATH)
+
+    if replace:
+        recognizer = remove_employee_from_model(recognizer, emp_id)
+
+    # An empty model (every sample was removed) can't be updated, only trained
+    if len(recognizer.getHistograms()) == 0:
+        recognizer.train(faces, np.array(ids))
+    else:
+        recognizer.update(faces, np.array(ids))
+
+    save_trainer(recognizer)
+    saved = save_gallery(recognizer)
+
+    return recognizer, saved
@@ -0,0 +1,583 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+import lbph
+from recognition_pipeline import CONFIDENCE_THRESHOLD
+
+# Binary gallery file: the LBPH histograms as one matrix plus a label vector,
+# laid out so both can be memory-mapped straight from the file
+#
+#   magic (8 bytes) | header length (uint32) | JSON header | padding
+#   labels (int32[count]) | padding | sums (float64[count]) | padding
+#   bins (dtype[dim, count])
+#
+# The histograms are stored bin-major (one row per histogram bin), so a
+# query only reads the rows of the bins it actually uses. sums holds the sum
+# of every histogram. Every array starts on a GALLERY_ALIGN byte boundary.
+GALLERY_MAGIC = b"LBPHGAL1"
+GALLERY_ALIGN = 64
+GALLERY_DTYPES = ("float32", "float16")
+
+# A saved gallery is a small pointer file (magic, then the name of a data
+# file next to it) and the data file of the current version,
+# <gallery>.v<version>. Saving writes a new data file and then replaces the
+# pointer, so a data file is never replaced while it is mapped: Windows
+# refuses to replace or delete a mapped file. Old data files are deleted
+# once nothing has them mapped any more. Files in the layout above without a
+# pointer (a copied data file) load as well.
+GALLERY_POINTER_MAGIC = b"LBPHPTR1"
+# Tries at replacing the pointer; on Windows it fails while a reader has it open
+GALLERY_REPLACE_ATTEMPTS = 10
+
+# Best distinct employees GalleryRecognizer.match() returns per face
+MATCH_TOP_K = 3
+
+# Defaults of the compact command: prototype samples kept per employee and
+# the fraction of each employee's samples held out to measure accuracy
+COMPACT_PROTOTYPES = 5
+COMPACT_HOLDOUT = 0.2
+# Rounds of k-medoids refinement after the initial pick
+COMPACT_ITERATIONS = 10
+
+# Largest relative difference between a distance of the NumPy LBPH and
+# OpenCV's that the verify command accepts (they are summed in another order)
+VERIFY_TOLERANCE = 1e-4
+
+
+# Function to get the gallery file that belongs to a trainer.yml
+def get_gallery_path(trainer_path):
+    return os.path.splitext(trainer_path)[0] + ".gallery"
+
+
+def _align(offset):
+    return (offset + GALLERY_ALIGN - 1) // GALLERY_ALIGN * GALLERY_ALIGN
+
+
+# Function to get the data file a gallery path points to (the path itself if
+# it is a data file)
+def get_gallery_data_path(path):
+    with open(path, "rb") as f:
+        head = f.read(len(GALLERY_POINTER_MAGIC))
+        if head != GALLERY_POINTER_MAGIC:
+            return path
+        name = f.read().decode("utf-8").strip()
+    return os.path.join(os.path.dirname(path), name)
+
+
+# Function to get the version of a data file from its name, or None
+def _get_data_version(path, data_path):
+    suffix = data_path[len(path) + 2:]
+    return int(suffix) if data_path.startswith(path + ".v") and suffix.isdigit() else None
+
+
+# Function to point a gallery path at a data file. The pointer is replaced
+# atomically, and the data files of older versions are deleted where they
+# aren't mapped any more (the others go at a later save).
+def _switch_gallery(path, data_path):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(GALLERY_POINTER_MAGIC)
+        f.write(os.path.basename(data_path).encode("utf-8"))
+    for attempt in range(GALLERY_REPLACE_ATTEMPTS):
+        try:
+            os.replace(temp_path, path)
+            break
+        except PermissionError:
+            if attempt == GALLERY_REPLACE_ATTEMPTS - 1:
+                os.remove(temp_path)
+                raise
+            time.sleep(0.05)
+
+    version = _get_data_version(path, data_path)
+    for old_path in glob.glob(glob.escape(path) + ".v*"):
+        old_version = _get_data_version(path, old_path)
+        if old_version is not None and old_version < version:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+
+# Function to get the sum of every histogram of a (dim, count) bin matrix.
+# Galleries and saved files both use this, so their sums are bit-identical.
+def _get_sums(bins, count):
+    if not bins.size:
+        return np.zeros(count)
+    return np.asarray(bins).sum(axis=0, dtype=np.float64)
+
+
+# The histograms and labels of a trained LBPH model with its parameters.
+# bins is a (dim, count) matrix holding one histogram per column, labels a
+# (count,) int32 vector and sums the (count,) sums of the histograms.
+class Gallery:
+    def __init__(self, bins, labels, sums=None, radius=1, neighbors=8, grid_x=8, grid_y=8,
+                 threshold=1.7976931348623157e+308):
+        self.bins = bins
+        self.labels = labels
+        if sums is None:
+            sums = _get_sums(bins, len(labels))
+        self.sums = sums
+        self.radius = int(radius)
+        self.neighbors = int(neighbors)
+        self.grid_x = int(grid_x)
+        self.grid_y = int(grid_y)
+        self.threshold = float(threshold)
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def dim(self):
+        return self.bins.shape[0] if len(self) else 0
+
+    # The histograms as a (count, dim) matrix (a view, not a copy)
+    @property
+    def histograms(self):
+        return self.bins.T
+
+    # Function to make a gallery from (count, dim) histograms and labels
+    @classmethod
+    def from_histograms(cls, histograms, labels, **params):
+        histograms = np.asarray(histograms, dtype=np.float32)
+        if histograms.size == 0:
+            histograms = np.zeros((0, 0), dtype=np.float32)
+        bins = np.ascontiguousarray(histograms.T)
+        return cls(bins, np.asarray(labels, dtype=np.int32).ravel(), **params)
+
+    # Function to make a gallery from a trained OpenCV LBPH recognizer
+    @classmethod
+    def from_recognizer(cls, recognizer):
+        histograms = recognizer.getHistograms()
+        labels = recognizer.getLabels()
+        if len(histograms):
+            matrix = np.vstack([np.asarray(hist, dtype=np.float32).reshape(1, -1) for hist in histograms])
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        labels = labels if labels is not None else np.zeros(0, np.int32)
+        return cls.from_histograms(matrix, labels, radius=recognizer.getRadius(),
+                                   neighbors=recognizer.getNeighbors(), grid_x=recognizer.getGridX(),
+                                   grid_y=recognizer.getGridY(), threshold=recognizer.getThreshold())
+
+    # Function to read a gallery from a trainer.yml (slow; this is the parse
+    # the gallery file exists to avoid)
+    @classmethod
+    def from_trainer(cls, trainer_path):
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        recognizer.read(trainer_path)
+        return cls.from_recognizer(recognizer)
+
+    # Function to get the parameters shared by every copy of this gallery
+    def params(self):
+        return {"radius": self.radius, "neighbors": self.neighbors, "grid_x": self.grid_x,
+                "grid_y": self.grid_y, "threshold": self.threshold}
+
+    # Function to write the gallery as a trainer.yml that OpenCV can read
+    def to_trainer(self, trainer_path):
+        # Imported here because face_training imports this module
+        from face_training import write_trainer
+        write_trainer(trainer_path, np.asarray(self.histograms, dtype=np.float32), self.labels, **self.params())
+
+    # Function to make an OpenCV LBPH recognizer with this gallery's samples
+    def to_recognizer(self):
+        fd, temp_path = tempfile.mkstemp(suffix=".yml")
+        os.close(fd)
+        try:
+            self.to_trainer(temp_path)
+            recognizer = cv2.face.LBPHFaceRecognizer_create()
+            recognizer.read(temp_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return recognizer
+
+    # Function to get the gallery with its bins as they would be stored in
+    # a file of the given dtype
+    def astype(self, dtype):
+        if self.bins.dtype == np.dtype(dtype):
+            return self
+        return Gallery(np.ascontiguousarray(self.bins, dtype=dtype), self.labels, **self.params())
+
+    # Function to make a gallery of some of the samples, in the given order
+    def take(self, samples):
+        samples = np.asarray(samples, dtype=np.int64)
+        bins = np.ascontiguousarray(self.bins[:, samples]) if len(samples) else np.zeros((0, 0), dtype=np.float32)
+        return Gallery(bins, np.asarray(self.labels)[samples], np.asarray(self.sums)[samples], **self.params())
+
+    # Function to make a gallery that keeps at most `prototypes` samples per
+    # label: the medoids of that many clusters of the label's samples, so
+    # every prototype is a real sample and distances keep their meaning
+    def compact(self, prototypes):
+        labels = np.asarray(self.labels)
+        keep = []
+        for label in np.unique(labels):
+            index = np.flatnonzero(labels == label)
+            if len(index) > prototypes:
+                bins = np.asarray(self.bins[:, index], dtype=np.float32)
+                distances = lbph.chi_square_distances(bins, np.asarray(self.sums)[index], bins.T)
+                index = index[select_medoids(distances, prototypes)]
+            keep.append(index)
+        return self.take(np.sort(np.concatenate(keep)) if keep else [])
+
+    # Function to split off `fraction` of every label's samples (at least one
+    # sample of each label stays): (gallery of the rest, held-out histograms
+    # as a (count, dim) matrix, held-out labels)
+    def split(self, fraction, rng):
+        labels = np.asarray(self.labels)
+        held_out = []
+        for label in np.unique(labels):
+            index = np.flatnonzero(labels == label)
+            count = min(int(round(len(index) * fraction)), len(index) - 1)
+            held_out.append(rng.choice(index, count, replace=False))
+        held_out = np.sort(np.concatenate(held_out)) if held_out else np.zeros(0, dtype=np.int64)
+        rest = self.take(np.setdiff1d(np.arange(len(labels)), held_out))
+        return rest, np.asarray(self.bins[:, held_out], dtype=np.float32).T, labels[held_out]
+
+    # Function to save the gallery. float16 halves the file at a small cost
+    # in distance precision. Written to a new data file that the pointer is
+    # then switched to, so processes that have the old version mapped keep
+    # reading a complete gallery.
+    def save(self, path, dtype="float32"):
+        if dtype not in GALLERY_DTYPES:
+            raise ValueError(f"Unsupported gallery dtype {dtype}")
+        labels = np.ascontiguousarray(self.labels, dtype="<i4")
+        bins = np.ascontiguousarray(self.bins, dtype=np.dtype(dtype).newbyteorder("<"))
+        # The sums of the stored (possibly float16-rounded) bins, so distances
+        # computed from the file stay consistent with its own values
+        sums = np.ascontiguousarray(_get_sums(bins, len(labels)), dtype="<f8")
+
+        header = dict(self.params(), version=1, dtype=dtype, count=len(labels), dim=self.dim)
+        # The offsets depend on the header length, so fix the header size first
+        header.update(labels_offset=0, sums_offset=0, bins_offset=0)
+        header_size = len(json.dumps(header).encode("utf-8")) + 64
+        header["labels_offset"] = _align(len(GALLERY_MAGIC) + 4 + header_size)
+        header["sums_offset"] = _align(header["labels_offset"] + labels.nbytes)
+        header["bins_offset"] = _align(header["sums_offset"] + sums.nbytes)
+        header_bytes = json.dumps(header).encode("utf-8").ljust(header_size)
+
+        # Nothing reads the data file before the pointer names it
+        data_path = f"{path}.v{time.time_ns()}"
+        with open(data_path, "wb") as f:
+            f.write(GALLERY_MAGIC)
+            f.write(np.uint32(len(header_bytes)).tobytes())
+            f.write(header_bytes)
+            for name, array in (("labels", labels), ("sums", sums), ("bins", bins)):
+                f.seek(header[f"{name}_offset"])
+                f.write(array.tobytes())
+        _switch_gallery(path, data_path)
+
+    # Function to load a gallery. With mmap=True the arrays are read-only views
+    # of the file, so loading is instant and processes share the pages.
+    @classmethod
+    def load(cls, path, mmap=True):
+        data_path = get_gallery_data_path(path)
+        if not os.path.exists(data_path) and data_path != path:
+            # A save switched the pointer and deleted the old data file in between
+            data_path = get_gallery_data_path(path)
+        return cls._load_data(data_path, mmap)
+
+    # Function to load a gallery data file
+    @classmethod
+    def _load_data(cls, path, mmap=True):
+        with open(path, "rb") as f:
+            if f.read(len(GALLERY_MAGIC)) != GALLERY_MAGIC:
+                raise ValueError(f"{path} is not a gallery file")
+            header_size = int(np.frombuffer(f.read(4), dtype="<u4")[0])
+            header = json.loads(f.read(header_size).decode("utf-8"))
+
+        count, dim = header["count"], header["dim"]
+        arrays = {}
+        layout = [("labels", np.dtype("<i4"), (count,)), ("sums", np.dtype("<f8"), (count,)),
+                  ("bins", np.dtype(header["dtype"]).newbyteorder("<"), (dim, count))]
+        for name, dtype, shape in layout:
+            offset = header[f"{name}_offset"]
+            if mmap and count:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+            else:
+                arrays[name] = np.fromfile(path, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+        params = {key: header[key] for key in ("radius", "neighbors", "grid_x", "grid_y", "threshold")}
+        return cls(arrays["bins"], arrays["labels"], arrays["sums"], **params)
+
+
+# Function to pick k medoids among samples from their (n, n) distance
+# matrix: the most central sample, then repeatedly the sample farthest from
+# those picked, then k-medoids rounds that move each medoid to the member of
+# its cluster closest to the others. Returns the sorted sample indices.
+def select_medoids(distances, k, iterations=COMPACT_ITERATIONS):
+    if k >= len(distances):
+        return np.arange(len(distances))
+    medoids = [int(np.argmin(distances.sum(axis=1)))]
+    nearest = distances[medoids[0]].copy()
+    while len(medoids) < k and nearest.max() > 0:
+        medoids.append(int(np.argmax(nearest)))
+        nearest = np.minimum(nearest, distances[medoids[-1]])
+    medoids = np.array(medoids)
+
+    for _ in range(iterations):
+        assignment = np.argmin(distances[:, medoids], axis=1)
+        updated = medoids.copy()
+        for cluster in range(len(medoids)):
+            members = np.flatnonzero(assignment == cluster)
+            if len(members):
+                updated[cluster] = members[np.argmin(distances[np.ix_(members, members)].sum(axis=1))]
+        if np.array_equal(updated, medoids):
+            break
+        medoids = updated
+    return np.unique(medoids)
+
+
+# Function to measure how a gallery recognizes held-out histograms the way
+# the application does: a face whose nearest sample isn't closer than
+# `threshold` is unknown. The held-out faces all belong to employees, so
+# every unknown one is a false reject. Returns (accuracy, fraction of faces
+# that were unknown, milliseconds of matching per face).
+def evaluate_gallery(gallery, histograms, labels, threshold=CONFIDENCE_THRESHOLD):
+    if len(histograms) == 0:
+        return 0.0, 0.0, 0.0
+    start = time.time()
+    distances = lbph.chi_square_distances(gallery.bins, gallery.sums, histograms)
+    elapsed = time.time() - start
+    best = np.argmin(distances, axis=1)
+    best_distances = distances[np.arange(len(best)), best]
+    predicted = np.where(best_distances < threshold, np.asarray(gallery.labels)[best], -1)
+    return float(np.mean(predicted == labels)), float(np.mean(predicted == -1)), elapsed * 1000 / len(histograms)
+
+
+# Function to list the image files given as files or folders, in order
+def list_image_paths(paths):
+    image_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            image_paths += [os.path.join(path, name) for name in sorted(os.listdir(path))
+                            if os.path.isfile(os.path.join(path, name))]
+        else:
+            image_paths.append(path)
+    return image_paths
+
+
+# Function to check the NumPy LBPH (lbph.py) against OpenCV's on a model and
+# some gray face crops. The histograms are compared with the ones OpenCV
+# computes when it is trained on the same crops, and every crop is predicted
+# by the model loaded by OpenCV and by a GalleryRecognizer over it. Returns
+# (largest histogram difference, largest distance difference, list of
+# (crop index, OpenCV's (label, distance), the gallery's) that differ).
+def verify_lbph(trainer_path, faces, tolerance=VERIFY_TOLERANCE):
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(trainer_path)
+    gallery_recognizer = GalleryRecognizer(Gallery.from_recognizer(recognizer))
+    if not faces:
+        return 0.0, 0.0, []
+
+    # OpenCV only computes histograms while training
+    reference = cv2.face.LBPHFaceRecognizer_create(recognizer.getRadius(), recognizer.getNeighbors(),
+                                                   recognizer.getGridX(), recognizer.getGridY())
+    reference.train(faces, np.zeros(len(faces), dtype=np.int32))
+    expected = np.vstack([np.asarray(hist, dtype=np.float32).reshape(1, -1) for hist in reference.getHistograms()])
+    histogram_diff = float(np.abs(gallery_recognizer.compute_histograms(faces) - expected).max())
+
+    distance_diff = 0.0
+    mismatches = []
+    for i, (face, predicted) in enumerate(zip(faces, gallery_recognizer.predict_batch(faces))):
+        label, distance = recognizer.predict(face)
+        diff = abs(predicted[1] - distance)
+        distance_diff = max(distance_diff, diff)
+        if predicted[0] != label or diff > tolerance * max(1.0, abs(distance)):
+            mismatches.append((i, (label, distance), predicted))
+    return histogram_diff, distance_diff, mismatches
+
+
+# Recognizer that predicts from a Gallery, a drop-in replacement for an
+# OpenCV LBPH recognizer's predict(). The histograms are computed with the
+# NumPy LBPH in lbph.py, which gives exactly the ones OpenCV would compare,
+# and all the faces of a frame can be scored in one call. With an index
+# (gallery_index.GalleryIndex) each face is only compared with the samples
+# the index picks for it.
+class GalleryRecognizer:
+    def __init__(self, gallery, index=None):
+        self.gallery = gallery
+        self.index = index
+        # The samples grouped by label, for the best distance per employee
+        self._order = np.argsort(gallery.labels, kind="stable")
+        sorted_labels = np.asarray(gallery.labels)[self._order]
+        self._label_values, self._label_starts = np.unique(sorted_labels, return_index=True)
+
+    # Function to compute the LBPH histograms of gray face crops
+    def compute_histograms(self, faces):
+        gallery = self.gallery
+        return lbph.compute_histograms(faces, gallery.radius, gallery.neighbors, gallery.grid_x, gallery.grid_y)
+
+    # Function to get the (faces, samples) distance matrix of some face crops
+    def distances(self, faces):
+        return lbph.chi_square_distances(self.gallery.bins, self.gallery.sums, self.compute_histograms(faces))
+
+    # Function to get, for each face, the samples it was compared with (None
+    # means all of them) and the distances to those samples
+    def _search(self, faces):
+        histograms = self.compute_histograms(faces)
+        if self.index is None:
+            return [(None, row) for row in lbph.chi_square_distances(self.gallery.bins, self.gallery.sums, histograms)]
+        return [self.index.search(self.gallery, histogram) for histogram in histograms]
+
+    # Function to predict like LBPH: (label, distance) of the nearest sample,
+    # or (-1, DBL_MAX) if nothing is closer than the threshold
+    def predict(self, face):
+        return self.predict_batch([face])[0]
+
+    # Function to predict several faces at once, one (label, distance) each
+    def predict_batch(self, faces):
+        if len(self.gallery) == 0:
+            return [(-1, sys.float_info.max) for _ in faces]
+        results = []
+        for samples, row in self._search(faces):
+            best = int(np.argmin(row)) if len(row) else None
+            if best is None or row[best] >= self.gallery.threshold:
+                results.append((-1, sys.float_info.max))
+                continue
+            sample = best if samples is None else samples[best]
+            results.append((int(self.gallery.labels[sample]), float(row[best])))
+        return results
+
+    # Function to get the k closest employees of each face as a list of
+    # (label, distance) pairs, nearest first, one list per face. Each label
+    # appears once, with the distance of its nearest sample; the threshold is
+    # not applied.
+    def match(self, faces, k=MATCH_TOP_K):
+        if len(self.gallery) == 0 or len(faces) == 0:
+            return [[] for _ in faces]
+        results = []
+        for samples, row in self._search(faces):
+            if samples is None:
+                label_values = self._label_values
+                per_label = np.minimum.reduceat(row[self._order], self._label_starts)
+            elif len(samples):
+                labels = np.asarray(self.gallery.labels)[samples]
+                order = np.argsort(labels, kind="stable")
+                label_values, starts = np.unique(labels[order], return_index=True)
+                per_label = np.minimum.reduceat(row[order], starts)
+            else:
+                results.append([])
+                continue
+            top_k = min(k, len(per_label))
+            top = np.argpartition(per_label, top_k - 1)[:top_k]
+            top = top[np.argsort(per_label[top], kind="stable")]
+            results.append([(int(label_values[i]), float(per_label[i])) for i in top])
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert between trainer.yml and the binary gallery format, "
+                                                 "and check the NumPy LBPH against OpenCV's")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser("convert", help="trainer.yml -> gallery")
+    convert_parser.add_argument("trainer", help="trainer.yml to read")
+    convert_parser.add_argument("gallery", nargs="?", help="gallery to write (default: next to trainer.yml)")
+    convert_parser.add_argument("--dtype", default="float32", choices=GALLERY_DTYPES)
+
+    export_parser = subparsers.add_parser("export", help="gallery -> trainer.yml")
+    export_parser.add_argument("gallery", help="gallery to read")
+    export_parser.add_argument("trainer", help="trainer.yml to write")
+
+    info_parser = subparsers.add_parser("info", help="describe a gallery")
+    info_parser.add_argument("gallery")
+
+    compact_parser = subparsers.add_parser("compact", help="keep a few prototype samples per employee")
+    compact_parser.add_argument("gallery", help="gallery to read")
+    compact_parser.add_argument("output", nargs="?", help="gallery to write (default: replace the input)")
+    compact_parser.add_argument("--prototypes", type=int, default=COMPACT_PROTOTYPES,
+                                help="samples kept per employee")
+    compact_parser.add_argument("--holdout", type=float, default=COMPACT_HOLDOUT,
+                                help="fraction of each employee's samples held out to measure accuracy (0 to skip)")
+    compact_parser.add_argument("--seed", type=int, default=0, help="seed of the held-out sample choice")
+    compact_parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD,
+                                help="distance a face must be under to be recognized, as in the application")
+    compact_parser.add_argument("--dry-run", action="store_true", help="only report, don't write the gallery")
+
+    verify_parser = subparsers.add_parser("verify", help="check the NumPy LBPH against OpenCV's on a model")
+    verify_parser.add_argument("trainer", help="trainer.yml to predict with")
+    verify_parser.add_argument("images", nargs="+", help="gray face crops (files or folders, e.g. TrainingImage)")
+    verify_parser.add_argument("--limit", type=int, default=0, help="check at most this many images (0 = all)")
+
+    args = parser.parse_args(argv)
+    # Imported here because gallery_index imports this module
+    from gallery_index import save_indexed_gallery
+
+    if args.command == "convert":
+        gallery_path = args.gallery or get_gallery_path(args.trainer)
+        start = time.time()
+        gallery = Gallery.from_trainer(args.trainer)
+        print(f"Read {len(gallery)} samples from {args.trainer} in {time.time() - start:.2f}s")
+        save_indexed_gallery(gallery, gallery_path, dtype=args.dtype)
+        print(f"Wrote {gallery_path} ({os.path.getsize(get_gallery_data_path(gallery_path)) / 1e6:.1f} MB, "
+              f"{args.trainer} is {os.path.getsize(args.trainer) / 1e6:.1f} MB)")
+    elif args.command == "export":
+        gallery = Gallery.load(args.gallery, mmap=False)
+        gallery.to_trainer(args.trainer)
+        print(f"Wrote {len(gallery)} samples to {args.trainer}")
+    elif args.command == "info":
+        start = time.time()
+        gallery = Gallery.load(args.gallery)
+        print(f"{args.gallery}: {len(gallery)} samples of {gallery.dim} bins ({gallery.histograms.dtype}), "
+              f"{len(np.unique(gallery.labels))} labels, radius={gallery.radius} neighbors={gallery.neighbors} "
+              f"grid={gallery.grid_x}x{gallery.grid_y}, loaded in {(time.time() - start) * 1000:.1f} ms")
+    elif args.command == "compact":
+        if args.prototypes < 1:
+            print("ERROR: --prototypes must be at least 1")
+            return 1
+        gallery = Gallery.load(args.gallery, mmap=False)
+        if args.holdout > 0:
+            # Accuracy of the full and the compacted gallery on the same held-out samples
+            rest, histograms, labels = gallery.split(args.holdout, np.random.default_rng(args.seed))
+            print(f"Holding out {len(labels)} of {len(gallery)} samples, recognized under a distance of "
+                  f"{args.threshold:g}")
+            for name, candidate in (("full", rest), (f"{args.prototypes} per employee", rest.compact(args.prototypes))):
+                accuracy, unknown, ms = evaluate_gallery(candidate, histograms, labels, args.threshold)
+                print(f"  {name:>18s}: {len(candidate):6d} samples, accuracy {accuracy * 100:.1f}%, "
+                      f"unknown {unknown * 100:.1f}%, wrong {(1 - accuracy - unknown) * 100:.1f}%, "
+                      f"{ms:.2f} ms per face")
+
+        start = time.time()
+        compacted = gallery.compact(args.prototypes)
+        print(f"Compacted {len(gallery)} samples to {len(compacted)} in {time.time() - start:.1f}s")
+        if not args.dry_run:
+            output = args.output or args.gallery
+            save_indexed_gallery(compacted, output, dtype=gallery.bins.dtype.name)
+            print(f"Wrote {output}")
+    elif args.command == "verify":
+        image_paths = list_image_paths(args.images)
+        if args.limit > 0:
+            image_paths = image_paths[:args.limit]
+        faces = []
+        for image_path in image_paths:
+            face = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+            if face is None:
+                print(f"Skipping {image_path}: not an image")
+                continue
+            faces.append(face)
+        if not faces:
+            print("ERROR: No images to verify with")
+            return 1
+
+        histogram_diff, distance_diff, mismatches = verify_lbph(args.trainer, faces)
+        print(f"Checked {len(faces)} images against {args.trainer}")
+        print(f"  Largest histogram difference: {histogram_diff:.3g}")
+        print(f"  Largest distance difference: {distance_diff:.3g}")
+        print(f"  Predictions that differ: {len(mismatches)}")
+        for i, expected, predicted in mismatches[:10]:
+            print(f"    {image_paths[i]}: OpenCV {expected[0]} ({expected[1]:.4f}), "
+                  f"gallery {predicted[0]} ({predicted[1]:.4f})")
+        if histogram_diff > 0 or mismatches:
+            print("ERROR: lbph.py doesn't match OpenCV")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+import argparse
+import os
+import sys
+import time
+import zlib
+
+import cv2
+import numpy as np
+
+import lbph
+from gallery import Gallery, COMPACT_HOLDOUT
+
+# Inverted-file index over a gallery, so a face is only compared with the
+# samples of the few clusters nearest to it instead of with every sample.
+#
+# The histograms are square-rooted (chi-square distances between histograms
+# behave much like Euclidean distances between their square roots) and
+# reduced with PCA to INDEX_DIMS numbers. k-means on those vectors gives the
+# clusters ("lists"). A query is reduced the same way, the INDEX_PROBES
+# nearest lists are picked, and their samples are ranked with the exact
+# chi-square distance, so the distances returned are always LBPH's own.
+# More probes means better recall and more work.
+#
+# The gallery's samples are stored grouped by list, so each list is one
+# contiguous run of columns that is read in one go.
+#
+# Only processes that write the model (training, the command line tools, the
+# application and the daemon's main process) build indexes, and they save
+# the index and its gallery together (save_indexed_gallery). Processes that
+# only read the model never write either file: without a matching index they
+# compare every sample.
+
+# Galleries with at least this many samples are indexed
+INDEX_MIN_SAMPLES = 20000
+
+# Numbers each histogram is reduced to for picking the lists
+INDEX_DIMS = 64
+# Lists of the index (0 = square root of the sample count)
+INDEX_LISTS = 0
+# Lists searched per face
+INDEX_PROBES = 8
+# Samples the PCA is fitted on, and samples the k-means is fitted on
+INDEX_PCA_SAMPLES = 2000
+INDEX_KMEANS_SAMPLES = 20000
+INDEX_KMEANS_ITERATIONS = 20
+# Samples reduced at a time while assigning the gallery to lists
+INDEX_CHUNK_SAMPLES = 1024
+
+
+# Function to get the index file that belongs to a gallery file
+def get_index_path(gallery_path):
+    return os.path.splitext(gallery_path)[0] + ".index.npz"
+
+
+# Function to get a fingerprint of a gallery's samples and their order,
+# stored with the index to detect an index built for another gallery
+def get_gallery_fingerprint(gallery):
+    sums = np.ascontiguousarray(gallery.sums, dtype="<f8")
+    labels = np.ascontiguousarray(gallery.labels, dtype="<i4")
+    return np.array([len(gallery), zlib.crc32(sums.tobytes()), zlib.crc32(labels.tobytes())], dtype=np.int64)
+
+
+# Function to compute the PCA of some rows: (mean, (dims, columns) components).
+# The eigenvectors come from the small (rows, rows) Gram matrix, since there
+# are far fewer rows than histogram bins.
+def fit_pca(rows, dims):
+    mean = rows.mean(axis=0, dtype=np.float64).astype(np.float32)
+    centered = rows - mean
+    values, vectors = np.linalg.eigh((centered @ centered.T).astype(np.float64))
+    top = np.argsort(values)[::-1][:dims]
+    top = top[values[top] > 1e-9]
+    components = (vectors[:, top].T.astype(np.float32) @ centered) / np.sqrt(values[top]).astype(np.float32)[:, None]
+    return mean, components
+
+
+class GalleryIndex:
+    def __init__(self, mean, components, centroids, offsets, fingerprint, probes=INDEX_PROBES):
+        self.mean = mean                # (dim,) mean of the square-rooted histograms
+        self.components = components    # (dims, dim) PCA components
+        self.centroids = centroids      # (lists, dims) k-means centers
+        self.offsets = offsets          # List i is gallery samples offsets[i]:offsets[i + 1]
+        self.fingerprint = fingerprint  # Fingerprint of the gallery the lists refer to
+        self.probes = probes
+
+    @property
+    def lists(self):
+        return len(self.centroids)
+
+    # Function to reduce (count, dim) histograms to (count, dims) vectors
+    def reduce(self, histograms):
+        return (np.sqrt(np.asarray(histograms, dtype=np.float32)) - self.mean) @ self.components.T
+
+    # Function to get the `probes` nearest lists of each reduced vector, nearest first
+    def nearest_lists(self, vectors, probes):
+        distances = (
+            (vectors ** 2).sum(axis=1)[:, None]
+            - 2.0 * vectors @ self.centroids.T
+            + (self.centroids ** 2).sum(axis=1)[None, :]
+        )
+        probes = min(probes, self.lists)
+        nearest = np.argpartition(distances, probes - 1, axis=1)[:, :probes]
+        order = np.argsort(np.take_along_axis(distances, nearest, axis=1), axis=1)
+        return np.take_along_axis(nearest, order, axis=1)
+
+    # Function to compare one histogram with the samples of its nearest lists:
+    # (sample indices, chi-square distances to them)
+    def search(self, gallery, histogram, probes=None):
+        histogram = np.asarray(histogram, dtype=np.float32).reshape(1, -1)
+        lists = self.nearest_lists(self.reduce(histogram), probes or self.probes)[0]
+        samples, distances = [], []
+        for i in lists:
+            start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+            if end > start:
+                samples.append(np.arange(start, end))
+                distances.append(lbph.chi_square_distances(gallery.bins[:, start:end], gallery.sums[start:end],
+                                                           histogram)[0])
+        if not samples:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        return np.concatenate(samples), np.concatenate(distances)
+
+    # Function to check that the index belongs to a gallery
+    def matches(self, gallery):
+        return np.array_equal(self.fingerprint, get_gallery_fingerprint(gallery))
+
+    # Function to save the index. Written to a temporary file first, like the gallery.
+    def save(self, path):
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(f, mean=self.mean, components=self.components, centroids=self.centroids,
+                     offsets=self.offsets, fingerprint=self.fingerprint)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, probes=INDEX_PROBES):
+        with np.load(path) as data:
+            return cls(data["mean"], data["components"], data["centroids"], data["offsets"], data["fingerprint"],
+                       probes)
+
+
+# Function to build the index of a gallery. The lists must be contiguous, so
+# this returns (index, gallery with its samples reordered by list); the index
+# only works with that reordered gallery.
+def build_index(gallery, lists=None, dims=INDEX_DIMS, seed=0):
+    count = len(gallery)
+    if count == 0:
+        raise ValueError("Cannot index an empty gallery")
+    lists = max(1, min(lists or INDEX_LISTS or int(round(np.sqrt(count))), count))
+    rng = np.random.default_rng(seed)
+
+    pca_samples = np.sort(rng.choice(count, min(count, INDEX_PCA_SAMPLES), replace=False))
+    mean, components = fit_pca(np.sqrt(np.asarray(gallery.bins[:, pca_samples], dtype=np.float32).T), dims)
+    index = GalleryIndex(mean, components, None, None, None)
+
+    vectors = np.empty((count, len(components)), dtype=np.float32)
+    for start in range(0, count, INDEX_CHUNK_SAMPLES):
+        chunk = np.asarray(gallery.bins[:, start:start + INDEX_CHUNK_SAMPLES], dtype=np.float32).T
+        vectors[start:start + len(chunk)] = index.reduce(chunk)
+
+    kmeans_samples = rng.choice(count, min(count, INDEX_KMEANS_SAMPLES), replace=False)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, INDEX_KMEANS_ITERATIONS, 1e-4)
+    cv2.setRNGSeed(seed)
+    _, _, index.centroids = cv2.kmeans(np.ascontiguousarray(vectors[kmeans_samples]), lists, None, criteria, 1,
+                                       cv2.KMEANS_PP_CENTERS)
+
+    # Every sample goes to the list of its nearest center
+    assignment = np.concatenate([index.nearest_lists(vectors[start:start + INDEX_CHUNK_SAMPLES], 1)[:, 0]
+                                 for start in range(0, count, INDEX_CHUNK_SAMPLES)])
+    gallery = gallery.take(np.argsort(assignment, kind="stable"))
+    index.offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=lists))))
+    index.fingerprint = get_gallery_fingerprint(gallery)
+    return index, gallery
+
+
+# Function to save a gallery file together with its index file. Galleries of
+# at least INDEX_MIN_SAMPLES samples are indexed and saved in list order;
+# smaller ones lose any old index file. The index is written first and the
+# gallery last, so a reader that sees the new index with the old gallery
+# finds that the fingerprints differ and compares every sample until the
+# gallery is replaced too. Returns (gallery as saved, index or None).
+def save_indexed_gallery(gallery, gallery_path, dtype="float32", probes=INDEX_PROBES):
+    index_path = get_index_path(gallery_path)
+    index = None
+    if len(gallery) >= INDEX_MIN_SAMPLES:
+        # Indexed as it will be stored, so the fingerprint matches the file
+        start = time.time()
+        index, gallery = build_index(gallery.astype(dtype))
+        index.probes = probes
+        print(f"Built a {index.lists}-list index of {len(gallery)} samples in {time.time() - start:.1f}s")
+        index.save(index_path)
+    elif os.path.exists(index_path):
+        os.remove(index_path)
+    gallery.save(gallery_path, dtype=dtype)
+    return gallery, index
+
+
+# Function to load the index of a gallery file. Returns None if there is no
+# index file or it belongs to another gallery; it is never built here.
+def load_gallery_index(gallery_path, gallery, probes=INDEX_PROBES):
+    try:
+        index = GalleryIndex.load(get_index_path(gallery_path), probes)
+    except (OSError, ValueError, KeyError):
+        return None
+    return index if index.matches(gallery) else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and tune the approximate nearest-neighbor index of a gallery")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="build the index of a gallery (reorders the gallery file)")
+    build_parser.add_argument("gallery")
+    build_parser.add_argument("--lists", type=int, default=INDEX_LISTS, help="lists (0 = square root of the samples)")
+    build_parser.add_argument("--dims", type=int, default=INDEX_DIMS, help="PCA dimensions")
+
+    evaluate_parser = subparsers.add_parser("evaluate", help="measure recall and speed against the exact search")
+    evaluate_parser.add_argument("gallery")
+    evaluate_parser.add_argument("--lists", type=int, default=INDEX_LISTS, help="lists (0 = square root of the samples)")
+    evaluate_parser.add_argument("--dims", type=int, default=INDEX_DIMS, help="PCA dimensions")
+    evaluate_parser.add_argument("--probes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32],
+                                 help="probe counts to try")
+    evaluate_parser.add_argument("--holdout", type=float, default=COMPACT_HOLDOUT,
+                                 help="fraction of each employee's samples used as queries")
+    evaluate_parser.add_argument("--queries", type=int, default=200, help="at most this many queries")
+    evaluate_parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        gallery = Gallery.load(args.gallery)
+        start = time.time()
+        index, ordered = build_index(gallery, args.lists, args.dims)
+        # Index first and gallery last, like save_indexed_gallery
+        index_path = get_index_path(args.gallery)
+        index.save(index_path)
+        ordered.save(args.gallery, dtype=gallery.bins.dtype.name)
+        print(f"Wrote {index_path}: {index.lists} lists over {len(gallery)} samples in {time.time() - start:.1f}s")
+    elif args.command == "evaluate":
+        rng = np.random.default_rng(args.seed)
+        rest, histograms, labels = Gallery.load(args.gallery).split(args.holdout, rng)
+        if len(labels) > args.queries:
+            pick = np.sort(rng.choice(len(labels), args.queries, replace=False))
+            histograms, labels = histograms[pick], labels[pick]
+        if len(labels) == 0:
+            print("ERROR: No samples to hold out; use a larger --holdout")
+            return 1
+
+        start = time.time()
+        index, rest = build_index(rest, args.lists, args.dims, args.seed)
+        print(f"Index of {len(rest)} samples: {index.lists} lists, built in {time.time() - start:.1f}s; "
+              f"{len(labels)} queries")
+
+        start = time.time()
+        exact = lbph.chi_square_distances(rest.bins, rest.sums, histograms)
+        exact_ms = (time.time() - start) * 1000 / len(labels)
+        exact_best = np.argmin(exact, axis=1)
+        print(f"  {'exact':>10s}: {len(rest):7d} samples per face, {exact_ms:8.2f} ms per face")
+
+        for probes in args.probes:
+            start = time.time()
+            found, compared = [], 0
+            for histogram in histograms:
+                samples, distances = index.search(rest, histogram, probes)
+                found.append(samples[np.argmin(distances)] if len(samples) else -1)
+                compared += len(samples)
+            ms = (time.time() - start) * 1000 / len(labels)
+            recall = np.mean(np.array(found) == exact_best)
+            print(f"  {probes:4d} probes: {compared // len(labels):7d} samples per face, {ms:8.2f} ms per face, "
+                  f"recall@1 {recall * 100:.1f}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
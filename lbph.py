@@ -0,0 +1,119 @@
+import math
+
+import numpy as np
+
+# NumPy implementation of OpenCV's LBPH face recognizer (cv2.face), so the
+# histograms of many faces can be computed and compared in one go. It follows
+# OpenCV's code step by step: extended LBP codes sampled on a circle with
+# bilinear interpolation, all 2^neighbors patterns (not the 59 "uniform" ones,
+# which would not match trainer.yml), one L1-normalized histogram per grid
+# cell, and the HISTCMP_CHISQR_ALT distance.
+
+# Gallery samples scored against a query at once (bounds the temporary memory)
+MATCH_CHUNK_SAMPLES = 256
+
+_FLOAT_EPSILON = np.finfo(np.float32).eps
+
+
+# Function to get the sampling offsets and bilinear weights of each neighbor,
+# computed with the same float32 roundings as OpenCV
+def _neighbor_weights(radius, neighbors):
+    points = []
+    for n in range(neighbors):
+        x = np.float32(radius * math.cos(2.0 * math.pi * n / float(neighbors)))
+        y = np.float32(-radius * math.sin(2.0 * math.pi * n / float(neighbors)))
+        fx, fy = int(math.floor(x)), int(math.floor(y))
+        cx, cy = int(math.ceil(x)), int(math.ceil(y))
+        ty = np.float32(y - np.float32(fy))
+        tx = np.float32(x - np.float32(fx))
+        one = np.float32(1)
+        w1 = (one - tx) * (one - ty)
+        w2 = tx * (one - ty)
+        w3 = (one - tx) * ty
+        w4 = tx * ty
+        points.append((fx, fy, cx, cy, w1, w2, w3, w4))
+    return points
+
+
+# Function to compute the LBP code image of a gray face crop. The result is
+# 2 * radius smaller than the input in both directions.
+def lbp_codes(gray, radius=1, neighbors=8):
+    src = np.asarray(gray, dtype=np.float32)
+    rows, cols = src.shape
+    height, width = rows - 2 * radius, cols - 2 * radius
+    if height <= 0 or width <= 0:
+        return np.zeros((max(height, 0), max(width, 0)), dtype=np.int32)
+
+    def window(dy, dx):
+        return src[radius + dy:radius + dy + height, radius + dx:radius + dx + width]
+
+    center = window(0, 0)
+    codes = np.zeros((height, width), dtype=np.int32)
+    for n, (fx, fy, cx, cy, w1, w2, w3, w4) in enumerate(_neighbor_weights(radius, neighbors)):
+        t = w1 * window(fy, fx) + w2 * window(fy, cx) + w3 * window(cy, fx) + w4 * window(cy, cx)
+        bit = (t > center) | (np.abs(t - center) < _FLOAT_EPSILON)
+        codes |= bit.astype(np.int32) << n
+    return codes
+
+
+# Function to compute the spatial histogram of an LBP code image: the image
+# is cut into grid_x * grid_y cells (leftover pixels on the right and bottom
+# are ignored), and each cell gets an L1-normalized histogram of its codes
+def spatial_histogram(codes, num_patterns, grid_x=8, grid_y=8):
+    rows, cols = codes.shape
+    cell_w, cell_h = cols // grid_x, rows // grid_y
+    histogram = np.zeros(grid_x * grid_y * num_patterns, dtype=np.float32)
+    if cell_w == 0 or cell_h == 0:
+        return histogram
+
+    cells = codes[:cell_h * grid_y, :cell_w * grid_x]
+    cell_y = np.arange(cell_h * grid_y) // cell_h
+    cell_x = np.arange(cell_w * grid_x) // cell_w
+    cell_index = cell_y[:, None] * grid_x + cell_x[None, :]
+    counts = np.bincount((cell_index * num_patterns + cells).ravel(), minlength=histogram.size)
+    # OpenCV scales the float32 counts by a float32 1 / pixels
+    histogram[:] = counts.astype(np.float32) * np.float32(1.0 / (cell_w * cell_h))
+    return histogram
+
+
+# Function to compute the LBPH histogram of one gray face crop
+def compute_histogram(gray, radius=1, neighbors=8, grid_x=8, grid_y=8):
+    return spatial_histogram(lbp_codes(gray, radius, neighbors), 1 << neighbors, grid_x, grid_y)
+
+
+# Function to compute the histograms of several face crops as a (faces, dim) matrix
+def compute_histograms(faces, radius=1, neighbors=8, grid_x=8, grid_y=8):
+    dim = grid_x * grid_y * (1 << neighbors)
+    histograms = np.zeros((len(faces), dim), dtype=np.float32)
+    for i, face in enumerate(faces):
+        histograms[i] = compute_histogram(face, radius, neighbors, grid_x, grid_y)
+    return histograms
+
+
+# Function to compute the chi-square distances (OpenCV's HISTCMP_CHISQR_ALT)
+# between every query histogram and every gallery sample, as a (queries,
+# samples) matrix. bins is the gallery's (dim, samples) bin-major matrix and
+# sums the sum of each sample's histogram.
+#
+# Per bin, (a - b)^2 / (a + b) = a + b - 4ab / (a + b), so each distance is the
+# two histogram sums minus a cross term that is zero wherever the query is
+# zero: only the gallery rows of a query's non-zero bins are read, and each
+# query is scored against all samples at once. Stacking the queries into one
+# bigger array was measured to be slower, because the temporaries no longer
+# fit in the cache.
+def chi_square_distances(bins, sums, queries):
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    count = bins.shape[1] if bins.ndim == 2 else 0
+    cross = np.zeros((len(queries), count), dtype=np.float64)
+    for q, query in enumerate(queries):
+        used = np.flatnonzero(query)
+        values = query[used][:, None]
+        for start in range(0, count, MATCH_CHUNK_SAMPLES):
+            rows = np.asarray(bins[used, start:start + MATCH_CHUNK_SAMPLES], dtype=np.float32)
+            total = rows + values
+            np.multiply(rows, values, out=rows)
+            np.divide(rows, total, out=rows)
+            cross[q, start:start + rows.shape[1]] = rows.sum(axis=0, dtype=np.float64)
+
+    query_sums = queries.sum(axis=1, dtype=np.float64)[:, None]
+    return 2.0 * (np.asarray(sums, dtype=np.float64)[None, :] + query_sums - 4.0 * cross)
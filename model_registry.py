@@ -0,0 +1,261 @@
+import os
+import threading
+import time
+
+import cv2
+
+import face_training
+from gallery import Gallery, GalleryRecognizer, get_gallery_path
+from gallery_index import INDEX_MIN_SAMPLES, INDEX_PROBES, get_index_path, load_gallery_index, save_indexed_gallery
+
+# Seconds between checks of the model file's modification time
+RELOAD_CHECK_INTERVAL = 1.0
+
+# Recognize from the memory-mapped gallery file instead of parsing
+# trainer.yml into an OpenCV recognizer
+USE_GALLERY = True
+
+# Galleries with at least INDEX_MIN_SAMPLES samples are searched through an
+# approximate nearest-neighbor index (gallery_index.py) instead of compared
+# with every sample; INDEX_PROBES trades recall for speed
+
+# Training writes trainer.yml and then its gallery, so a trainer.yml newer
+# than its gallery is only converted once it is this many seconds old
+STALE_GALLERY_DELAY = 10.0
+
+
+# Function to get the (mtime, size) of a file, or None if it's missing
+def get_file_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+# The trained model and the face cascade files, loaded once per process and
+# shared by every window, mode and pipeline (each gets its own classifier).
+# The model is reloaded when trainer.yml (or its gallery or index file)
+# changes on disk: the new one is read without holding the lock and then
+# swapped in as a whole, so callers always see either the old or the new
+# model. With use_gallery the model is a GalleryRecognizer over the
+# memory-mapped gallery file. A trainer.yml that is newer than its gallery is
+# converted, and a large gallery without a matching index is indexed, unless
+# the registry is read_only: read-only registries never write a file, and
+# leave that to the process that writes the model. Both run on a background
+# thread, so get_recognizer() never waits for a k-means: until the files are
+# written the model is read from trainer.yml or compares every sample, and
+# the written files are then picked up like any other change.
+class ModelRegistry:
+    def __init__(self, trainer_path=face_training.TRAINER_PATH, check_interval=RELOAD_CHECK_INTERVAL,
+                 gallery_path=None, use_gallery=None, read_only=False):
+        self.trainer_path = trainer_path
+        self.gallery_path = gallery_path or get_gallery_path(trainer_path)
+        self.index_path = get_index_path(self.gallery_path)
+        self.use_gallery = USE_GALLERY if use_gallery is None else use_gallery
+        self.read_only = read_only
+        self.check_interval = check_interval
+        self.recognizer = None
+        self.recognizer_key = None      # File keys of the loaded model files
+        self.last_check = 0.0
+        self.cascades = {}              # path -> (file key, parsed cascade file)
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()   # Only one thread reads a model at a time
+        self.reloads = 0
+        self.writer = None              # Thread writing the gallery or index in the background
+
+    # Function to get the key that changes whenever the model files change
+    def _model_key(self):
+        trainer_key = get_file_key(self.trainer_path)
+        if not self.use_gallery:
+            return trainer_key
+        gallery_key = get_file_key(self.gallery_path)
+        if trainer_key is None and gallery_key is None:
+            return None
+        return (trainer_key, gallery_key, get_file_key(self.index_path))
+
+    # Function to read the model from disk. Returns None to keep the current
+    # model for now.
+    def _load(self):
+        if not self.use_gallery:
+            recognizer = cv2.face.LBPHFaceRecognizer_create()
+            recognizer.read(self.trainer_path)
+            return recognizer
+
+        trainer_key = get_file_key(self.trainer_path)
+        gallery_key = get_file_key(self.gallery_path)
+        if trainer_key is not None and (gallery_key is None or gallery_key[0] < trainer_key[0]):
+            # Training may be about to write the gallery
+            if (self.recognizer is not None and gallery_key is not None
+                    and time.time() - trainer_key[0] / 1e9 < STALE_GALLERY_DELAY):
+                return None
+            print(f"{self.gallery_path} is older than {self.trainer_path}, reading {self.trainer_path}")
+            gallery = Gallery.from_trainer(self.trainer_path)
+            if not self.read_only:
+                # trainer.yml was written by something that doesn't write the
+                # gallery (an older version, a copy from another machine)
+                self._write_in_background(f"Converting {self.trainer_path} to {self.gallery_path}",
+                                          lambda: face_training.write_gallery(gallery, self.gallery_path))
+            return GalleryRecognizer(gallery)
+        return self._open_gallery()
+
+    # Function to make a recognizer over the gallery file, with its index if
+    # the gallery is large
+    def _open_gallery(self):
+        gallery = Gallery.load(self.gallery_path)
+        if len(gallery) < INDEX_MIN_SAMPLES:
+            return GalleryRecognizer(gallery)
+        index = load_gallery_index(self.gallery_path, gallery, INDEX_PROBES)
+        if index is None:
+            print(f"No index matches {self.gallery_path}, comparing every sample")
+            # The index is written before its gallery, so an index newer than
+            # the gallery belongs to a gallery that is about to be written
+            index_key = get_file_key(self.index_path)
+            gallery_key = get_file_key(self.gallery_path)
+            if not self.read_only and (index_key is None or gallery_key is None or index_key[0] <= gallery_key[0]):
+                self._write_in_background(
+                    f"Indexing {self.gallery_path}",
+                    lambda: save_indexed_gallery(gallery, self.gallery_path, gallery.bins.dtype.name, INDEX_PROBES))
+        return GalleryRecognizer(gallery, index)
+
+    # Function to run a gallery or index write on the background thread,
+    # unless one is already running. The files it writes change the model
+    # key, so the next check loads them.
+    def _write_in_background(self, description, write):
+        if self.writer is not None and self.writer.is_alive():
+            return
+
+        def run():
+            print(description)
+            try:
+                write()
+            except Exception as e:
+                print(f"ERROR: {description} failed: {str(e)}")
+
+        self.writer = threading.Thread(target=run, name="model-writer", daemon=True)
+        self.writer.start()
+
+    # Function to wait until a background gallery or index write is done
+    def wait_for_writes(self, timeout=None):
+        writer = self.writer
+        if writer is not None:
+            writer.join(timeout)
+
+    # Function to get the current model, loading or reloading it if needed.
+    # Raises FileNotFoundError if there is no model yet.
+    def get_recognizer(self):
+        now = time.time()
+        recognizer = self.recognizer
+        if recognizer is not None and now - self.last_check < self.check_interval:
+            return recognizer
+
+        self.last_check = now
+        key = self._model_key()
+        if recognizer is not None and key == self.recognizer_key:
+            return recognizer
+        if key is None:
+            if recognizer is not None:
+                return recognizer
+            raise FileNotFoundError(f"Model file {self.trainer_path} not found. Please train the model first.")
+
+        with self.load_lock:
+            # Another thread may have loaded it while this one waited
+            if self.recognizer is not None and self.recognizer_key == self._model_key():
+                return self.recognizer
+
+            start = time.time()
+            new_recognizer = self._load()
+            if new_recognizer is None:
+                return self.recognizer
+            with self.lock:
+                self.recognizer = new_recognizer
+                self.recognizer_key = self._model_key()
+                self.reloads += 1
+            print(f"Face recognizer loaded from {self.gallery_path if self.use_gallery else self.trainer_path} "
+                  f"in {time.time() - start:.2f}s")
+            return new_recognizer
+
+    # Function to install a model that was just trained in this process, so
+    # it isn't read back from disk. saved is the (gallery, index) its gallery
+    # file was saved with (see face_training.write_gallery); the index is
+    # used as it is, never built here.
+    def set_recognizer(self, recognizer, saved=None):
+        if self.use_gallery:
+            if saved is not None:
+                recognizer = GalleryRecognizer(*saved)
+            else:
+                # The model's own samples, compacted like its saved gallery
+                # file, compared with every sample
+                recognizer = GalleryRecognizer(face_training.compact_gallery(Gallery.from_recognizer(recognizer)))
+        with self.lock:
+            self.recognizer = recognizer
+            self.recognizer_key = self._model_key()
+            self.last_check = time.time()
+
+    # Function to get a proxy that always predicts with the current model, for
+    # pipelines that run for a long time and should pick up a retrained model
+    def shared_recognizer(self):
+        return SharedRecognizer(self)
+
+    # Function to get a new face cascade for one detecting thread. Raises
+    # ValueError if the file is missing or not a cascade.
+    #
+    # detectMultiScale isn't thread-safe, so pipelines and registration each
+    # get their own CascadeClassifier. Only the parsed file is shared: reading
+    # a classifier from its parsed file takes about half the time of loading it.
+    def get_cascade(self, path=face_training.CASCADE_PATH):
+        key = get_file_key(path)
+        with self.lock:
+            item = self.cascades.get(path)
+        if item is None or item[0] != key:
+            storage = cv2.FileStorage(path, cv2.FILE_STORAGE_READ)
+            if not storage.isOpened():
+                raise ValueError(f"Failed to load face detector {path}")
+            item = (key, storage)
+            with self.lock:
+                self.cascades[path] = item
+
+        cascade = cv2.CascadeClassifier()
+        try:
+            with self.lock:
+                loaded = cascade.read(item[1].getFirstTopLevelNode())
+        except cv2.error:
+            loaded = False
+        if not loaded or cascade.empty():
+            raise ValueError(f"Failed to load face detector {path}")
+        return cascade
+
+
+# Stands in for a recognizer and forwards predict() to the registry's current
+# model, so a reload takes effect on the next face
+class SharedRecognizer:
+    def __init__(self, registry):
+        self.registry = registry
+
+    def predict(self, face):
+        return self.registry.get_recognizer().predict(face)
+
+    # Function to predict all the faces of a frame with the same model
+    def predict_batch(self, faces):
+        recognizer = self.registry.get_recognizer()
+        if hasattr(recognizer, "predict_batch"):
+            return recognizer.predict_batch(faces)
+        return [recognizer.predict(face) for face in faces]
+
+
+# One registry per model file, shared by every window and mode in the process
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+# Function to get the shared registry of a model file. read_only only
+# applies when the registry is created.
+def get_model_registry(trainer_path=face_training.TRAINER_PATH, read_only=False):
+    with _registries_lock:
+        registry = _registries.get(trainer_path)
+        if registry is None:
+            if trainer_path == face_training.TRAINER_PATH and not read_only:
+                face_training.migrate_legacy_trainer()
+            registry = ModelRegistry(trainer_path, read_only=read_only)
+            _registries[trainer_path] = registry
+        return registry
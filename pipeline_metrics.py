@@ -0,0 +1,313 @@
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Number of recent samples each stage keeps for its percentiles
+METRICS_WINDOW = 1000
+# Seconds over which frame rates are measured
+RATE_WINDOW = 2.0
+# Default port of the Prometheus endpoint (0 = don't serve)
+METRICS_PORT = 0
+METRICS_HOST = "127.0.0.1"
+
+# Stages in pipeline order, used to order the log line
+STAGES = ["capture", "convert", "detect", "recognize", "decision", "attendance_write", "display"]
+QUANTILES = [0.5, 0.95, 0.99]
+
+
+# Counts events and reports their rate over a sliding window
+class RateCounter:
+    def __init__(self, window=RATE_WINDOW):
+        self.window = window
+        self.times = []
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def tick(self):
+        now = time.time()
+        with self.lock:
+            self.total += 1
+            self.times.append(now)
+            while self.times and now - self.times[0] > self.window:
+                self.times.pop(0)
+
+    def rate(self):
+        now = time.time()
+        with self.lock:
+            while self.times and now - self.times[0] > self.window:
+                self.times.pop(0)
+            if len(self.times) < 2:
+                return 0.0
+            return (len(self.times) - 1) / max(self.times[-1] - self.times[0], 1e-6)
+
+
+# The last `window` values of one measurement, plus running totals
+class RollingSamples:
+    def __init__(self, window=METRICS_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, value):
+        with self.lock:
+            self.samples.append(value)
+            self.count += 1
+            self.sum += value
+
+    # Function to get the quantiles of the recent samples (None when empty)
+    def quantiles(self, quantiles=QUANTILES):
+        with self.lock:
+            values = sorted(self.samples)
+        if not values:
+            return {q: None for q in quantiles}
+        last = len(values) - 1
+        return {q: values[min(last, int(round(q * last)))] for q in quantiles}
+
+
+# Latencies, rates, counters and gauges of the recognition pipeline. Stages
+# record into it from their own threads; the log line and the HTTP endpoint
+# read from it. Gauges are functions that are called when the metrics are read,
+# so queue depths and drop counters cost nothing until someone looks.
+class PipelineMetrics:
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self.latencies = {}         # stage -> RollingSamples of seconds
+        self.values = {}            # name -> RollingSamples (faces per frame, ...)
+        self.rates = {}             # name -> RateCounter
+        self.counters = {}          # name -> int
+        self.gauges = {}            # (name, label) -> (function returning a number, owner)
+        self.lock = threading.Lock()
+
+    def _get(self, table, name, factory):
+        item = table.get(name)
+        if item is None:
+            with self.lock:
+                item = table.setdefault(name, factory())
+        return item
+
+    # Function to record how long a stage took for one frame (in seconds)
+    def observe(self, stage, seconds):
+        self._get(self.latencies, stage, lambda: RollingSamples(self.window)).add(seconds)
+
+    # Function to record a per-frame value such as the number of faces
+    def observe_value(self, name, value):
+        self._get(self.values, name, lambda: RollingSamples(self.window)).add(value)
+
+    # Function to count one event of a rate (frames captured, displayed, ...)
+    def tick(self, name):
+        self._get(self.rates, name, RateCounter).tick()
+
+    def rate(self, name):
+        counter = self.rates.get(name)
+        return counter.rate() if counter is not None else 0.0
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    # Function to register a gauge such as ("queue_depth", "detect"). The
+    # function is called every time the metrics are read.
+    def set_gauge(self, name, label, function, owner=None):
+        with self.lock:
+            self.gauges[(name, label)] = (function, owner)
+
+    # Function to remove the gauges registered by an owner (when a pipeline stops)
+    def remove_gauges(self, owner):
+        with self.lock:
+            for key in [key for key, (function, gauge_owner) in self.gauges.items() if gauge_owner is owner]:
+                del self.gauges[key]
+
+    def _read_gauges(self):
+        with self.lock:
+            gauges = list(self.gauges.items())
+        values = {}
+        for key, (function, owner) in gauges:
+            try:
+                values[key] = float(function())
+            except Exception:
+                continue
+        return values
+
+    # Function to get every metric as plain data
+    def snapshot(self):
+        with self.lock:
+            latencies = dict(self.latencies)
+            values = dict(self.values)
+            rates = dict(self.rates)
+            counters = dict(self.counters)
+        return {
+            "latency": {stage: {"quantiles": samples.quantiles(), "count": samples.count, "sum": samples.sum}
+                        for stage, samples in latencies.items()},
+            "values": {name: {"quantiles": samples.quantiles(), "count": samples.count, "sum": samples.sum}
+                       for name, samples in values.items()},
+            "rates": {name: counter.rate() for name, counter in rates.items()},
+            "counters": counters,
+            "gauges": self._read_gauges(),
+        }
+
+    # Function to summarize the metrics in one log line
+    def format_summary(self):
+        snapshot = self.snapshot()
+        parts = []
+
+        rates = snapshot["rates"]
+        if rates:
+            parts.append("fps " + " ".join(f"{name}={rate:.1f}" for name, rate in sorted(rates.items())))
+
+        latency = snapshot["latency"]
+        ordered = [stage for stage in STAGES if stage in latency] + sorted(set(latency) - set(STAGES))
+        for stage in ordered:
+            q = latency[stage]["quantiles"]
+            if q[0.5] is None:
+                continue
+            parts.append(f"{stage} p50/p95/p99={q[0.5] * 1000:.1f}/{q[0.95] * 1000:.1f}/{q[0.99] * 1000:.1f}ms")
+
+        faces = snapshot["values"].get("faces_per_frame")
+        if faces and faces["count"]:
+            parts.append(f"faces/frame={faces['sum'] / faces['count']:.2f}")
+
+        dropped = {label: value for (name, label), value in snapshot["gauges"].items() if name == "frames_dropped"}
+        if dropped:
+            parts.append("dropped " + " ".join(f"{label}={int(value)}" for label, value in sorted(dropped.items())))
+        depths = {label: value for (name, label), value in snapshot["gauges"].items() if name == "queue_depth"}
+        if depths:
+            parts.append("queues " + " ".join(f"{label}={int(value)}" for label, value in sorted(depths.items())))
+
+        for name, value in sorted(snapshot["counters"].items()):
+            parts.append(f"{name}={value}")
+        return ", ".join(parts) if parts else "no metrics yet"
+
+    # Function to render the metrics in the Prometheus text exposition format
+    def format_prometheus(self, prefix="attendance"):
+        snapshot = self.snapshot()
+        lines = []
+
+        def summary(metric, help_text, label_name, table):
+            if not table:
+                return
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} summary")
+            for label, data in sorted(table.items()):
+                label_text = f'{label_name}="{label}",' if label_name else ""
+                for q, value in data["quantiles"].items():
+                    if value is not None:
+                        lines.append(f'{metric}{{{label_text}quantile="{q}"}} {value:.6g}')
+                label_only = f'{{{label_name}="{label}"}}' if label_name else ""
+                lines.append(f"{metric}_sum{label_only} {data['sum']:.6g}")
+                lines.append(f"{metric}_count{label_only} {data['count']}")
+
+        summary(f"{prefix}_stage_latency_seconds", "Time spent in each pipeline stage per frame.", "stage",
+                snapshot["latency"])
+        for name, data in sorted(snapshot["values"].items()):
+            summary(f"{prefix}_{name}", f"Recent distribution of {name.replace('_', ' ')}.", None, {name: data})
+
+        if snapshot["rates"]:
+            lines.append(f"# HELP {prefix}_fps Frames per second over the last {RATE_WINDOW:g} seconds.")
+            lines.append(f"# TYPE {prefix}_fps gauge")
+            for name, rate in sorted(snapshot["rates"].items()):
+                lines.append(f'{prefix}_fps{{stream="{name}"}} {rate:.6g}')
+
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+
+        gauges = {}
+        for (name, label), value in snapshot["gauges"].items():
+            gauges.setdefault(name, []).append((label, value))
+        for name, items in sorted(gauges.items()):
+            # Drop counters only ever grow; everything else is a gauge
+            kind = "counter" if name == "frames_dropped" else "gauge"
+            metric = f"{prefix}_{name}_total" if kind == "counter" else f"{prefix}_{name}"
+            lines.append(f"# TYPE {metric} {kind}")
+            for label, value in sorted(items):
+                lines.append(f'{metric}{{stage="{label}"}} {value:.6g}')
+
+        return "\n".join(lines) + "\n"
+
+
+# Serves the metrics at http://host:port/metrics for Prometheus to scrape
+class MetricsServer:
+    def __init__(self, metrics, port, host=METRICS_HOST):
+        self.metrics = metrics
+        metrics_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics_server.metrics.format_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            # Scrapes every few seconds would flood the console
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Calls `log` with the summary line every `interval` seconds on a daemon thread
+class MetricsLogger:
+    def __init__(self, metrics, interval, log=print):
+        self.metrics = metrics
+        self.interval = interval
+        self.log = log
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name="MetricsLogger", daemon=True)
+
+    def _loop(self):
+        while not self.stop_event.wait(self.interval):
+            self.log(self.metrics.format_summary())
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+
+# One metrics registry per process, shared by the camera, the pipeline, the
+# attendance ledger and the UI
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+# Function to get the shared metrics registry
+def get_metrics():
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = PipelineMetrics()
+        return _metrics
+
+
+# Function to serve the shared metrics over HTTP. Returns the server, or None
+# if the port is 0 or can't be opened.
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    if not port:
+        return None
+    try:
+        server = MetricsServer(get_metrics(), port, host).start()
+    except OSError as e:
+        print(f"ERROR: Could not start metrics server on {host}:{port}: {str(e)}")
+        return None
+    print(f"Serving metrics on http://{host}:{server.port}/metrics")
+    return server
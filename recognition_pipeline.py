@@ -0,0 +1,476 @@
+import cv2
+import queue
+import threading
+import time
+from collections import Counter, deque
+from face_tracker import FaceTracker, box_iou, DETECT_EVERY_N_FRAMES, TRACK_MIN_CONFIDENCE
+from pipeline_metrics import RateCounter, get_metrics
+
+# LBPH distance below which a face counts as recognized (lower is better)
+CONFIDENCE_THRESHOLD = 70
+
+# Default detection settings. Frames wider than DETECT_WIDTH are downscaled
+# before the cascade runs; face sizes are in full-resolution pixels (0 = no limit).
+DETECT_WIDTH = 640
+MIN_FACE_SIZE = 60
+MAX_FACE_SIZE = 0
+
+# Default identity caching settings for tracked faces
+PREDICT_EVERY_N_FRAMES = 5      # Re-run predict on an identified track every Nth frame
+VOTE_WINDOW = 5                 # Number of recent predictions a track votes over
+MIN_VOTES = 3                   # Agreeing predictions needed before a track is identified
+REPREDICT_IOU = 0.5             # Predict again when the box moved this much since the last predict
+
+
+# One detected face and what the pipeline knows about it
+class FaceResult:
+    def __init__(self, box, id=None, confidence=None, status="unknown", track_id=None):
+        self.box = box                  # (x, y, w, h) in frame coordinates
+        self.track_id = track_id        # Set when the face comes from the tracker
+        self.id = id                    # Predicted employee ID
+        self.confidence = confidence    # LBPH distance, lower is better
+        self.status = status            # "recognized", "unknown" or "error"
+        self.name = None                # Filled in by the attendance decision
+        self.marked = False             # True once attendance exists for this face
+
+
+# Identity of one tracked face, decided by a vote over its recent predictions
+class TrackIdentity:
+    def __init__(self, vote_window=VOTE_WINDOW):
+        self.votes = deque(maxlen=vote_window)  # (id, confidence) of recent predictions
+        self.last_box = None                    # Box at the last prediction
+        self.frames_since_predict = 0
+        self.id = None
+        self.confidence = None
+
+    # Function to add a prediction and recount the votes. Only predictions under
+    # the threshold count, and one id needs min_votes of them to win.
+    def add_vote(self, id, confidence, confidence_threshold, min_votes=MIN_VOTES):
+        self.votes.append((id, confidence))
+        counts = Counter(vote_id for vote_id, vote_conf in self.votes if vote_conf < confidence_threshold)
+        self.id = None
+        self.confidence = None
+        if counts:
+            best_id, best_count = counts.most_common(1)[0]
+            if best_count >= min_votes:
+                self.id = best_id
+                confidences = [c for i, c in self.votes if i == best_id and c < confidence_threshold]
+                self.confidence = sum(confidences) / len(confidences)
+
+
+# Everything the pipeline produced for one camera frame
+class FrameResult:
+    def __init__(self, packet):
+        self.packet = packet            # FramePacket from the camera
+        self.gray = None
+        self.faces = []
+        self.detected = True            # False when faces were tracked, not detected
+        self.events = []                # Attendance events for the UI
+        self.timings = {}               # Seconds spent in each stage
+
+
+# Function to run a face cascade on a downscaled copy of a gray frame and
+# return the boxes in full-resolution coordinates
+def detect_faces_scaled(face_cascade, gray, scale_factor=1.3, min_neighbors=5, detect_width=DETECT_WIDTH,
+                        min_face_size=MIN_FACE_SIZE, max_face_size=MAX_FACE_SIZE):
+    frame_h, frame_w = gray.shape[:2]
+    scale = 1.0
+    if detect_width and frame_w > detect_width:
+        scale = detect_width / float(frame_w)
+        gray = cv2.resize(gray, (detect_width, max(1, int(round(frame_h * scale)))), interpolation=cv2.INTER_AREA)
+
+    # The cascade never looks at scales outside these bounds
+    min_size = (0, 0)
+    if min_face_size:
+        side = max(1, int(min_face_size * scale))
+        min_size = (side, side)
+    max_size = (0, 0)
+    if max_face_size:
+        side = max(1, int(max_face_size * scale))
+        max_size = (side, side)
+
+    faces = face_cascade.detectMultiScale(gray, scale_factor, min_neighbors, minSize=min_size, maxSize=max_size)
+
+    boxes = []
+    for (x, y, w, h) in faces:
+        x, y = int(x / scale), int(y / scale)
+        w, h = int(w / scale), int(h / scale)
+        # Rounding can push a box just past the frame edge
+        w, h = min(w, frame_w - x), min(h, frame_h - y)
+        boxes.append((x, y, w, h))
+    return boxes
+
+
+# Function to make the attendance decision of continuous mode: every
+# recognized employee is marked once per day. New marks are added to
+# result.events as ("marked", id, name, time).
+def make_continuous_decider(directory, ledger):
+    def decide(result):
+        for face in result.faces:
+            if face.status != "recognized":
+                continue
+
+            id = face.id
+            # Get employee name from the ID
+            employee_name = directory.get_name(id)
+            if employee_name is None:
+                # No matching employee found
+                print(f"ERROR: No employee with ID {id}")
+                face.status = "unknown"
+                continue
+            face.name = employee_name
+
+            # Mark attendance unless it was already marked today. This is a
+            # set lookup; the file is written later by the ledger's writer thread.
+            marked = ledger.mark(id, employee_name)
+            if marked is not None:
+                date, timestamp = marked
+                result.events.append(("marked", id, employee_name, timestamp))
+            else:
+                face.marked = True
+
+    return decide
+
+
+# Passed down the stages when the camera stops, so frames in flight still finish
+_END = object()
+
+
+# Function to put an item into a bounded queue, dropping the oldest item when
+# it is full. Returns True if something was dropped.
+def put_latest(q, item):
+    try:
+        q.put_nowait(item)
+        return False
+    except queue.Full:
+        pass
+
+    try:
+        q.get_nowait()
+    except queue.Empty:
+        pass
+
+    try:
+        q.put_nowait(item)
+    except queue.Full:
+        pass
+    return True
+
+
+# Staged recognition running on worker threads:
+#   capture -> detect -> recognize -> attendance decision -> UI event queue
+# Stages are connected by small bounded queues that keep only recent frames.
+# `decide` is called on the decision thread with every FrameResult; it fills in
+# names and appends attendance events to result.events. The UI polls
+# get_events(), get_results() and latest_frame() from its own loop, so the
+# display rate and the recognition rate are independent of each other.
+# With tracking=True the cascade only runs every `detect_interval` frames (or
+# when tracking gets unsure) and faces are followed by a FaceTracker in between.
+# Each track then keeps its identity: predict only runs every `predict_interval`
+# frames once the track is identified (or when its box changes a lot), and the
+# identity is a vote over the last `vote_window` predictions.
+# Stage timings, frame rates, drop counters and queue depths are recorded in
+# `metrics` (the shared registry of pipeline_metrics by default).
+class RecognitionPipeline:
+    def __init__(self, camera, face_cascade, recognizer, decide=None,
+                 confidence_threshold=CONFIDENCE_THRESHOLD, queue_size=2, detect_scale_factor=1.3, detect_min_neighbors=5,
+                 detect_width=DETECT_WIDTH, min_face_size=MIN_FACE_SIZE, max_face_size=MAX_FACE_SIZE,
+                 tracking=False, detect_interval=DETECT_EVERY_N_FRAMES, track_min_confidence=TRACK_MIN_CONFIDENCE,
+                 predict_interval=PREDICT_EVERY_N_FRAMES, vote_window=VOTE_WINDOW, min_votes=MIN_VOTES,
+                 repredict_iou=REPREDICT_IOU, drop_frames=None, metrics=None):
+        self.camera = camera
+        self.metrics = metrics if metrics is not None else get_metrics()
+        # Offline sources process every frame, so stages wait instead of dropping
+        if drop_frames is None:
+            drop_frames = getattr(camera, "drop_frames", True)
+        self.drop_frames = drop_frames
+        self.face_cascade = face_cascade
+        self.recognizer = recognizer
+        self.decide = decide
+        self.confidence_threshold = confidence_threshold
+        self.detect_scale_factor = detect_scale_factor
+        self.detect_min_neighbors = detect_min_neighbors
+        self.detect_width = detect_width
+        self.min_face_size = min_face_size
+        self.max_face_size = max_face_size
+
+        self.tracker = None
+        if tracking:
+            self.tracker = FaceTracker(self.detect_faces, detect_interval=detect_interval,
+                                       min_confidence=track_min_confidence)
+
+        # Identity caching for tracked faces, keyed by track ID
+        self.identities = {}
+        self.predict_interval = max(1, int(predict_interval))
+        self.vote_window = vote_window
+        self.min_votes = min_votes
+        self.repredict_iou = repredict_iou
+        self.predictions = 0
+
+        self.detect_queue = queue.Queue(maxsize=queue_size)
+        self.recognize_queue = queue.Queue(maxsize=queue_size)
+        self.decision_queue = queue.Queue(maxsize=queue_size)
+        # Results waiting for the UI (only the newest ones matter for drawing)
+        self.result_queue = queue.Queue(maxsize=queue_size)
+        # Attendance events for the UI; never dropped
+        self.event_queue = queue.Queue()
+
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.error = None
+
+        self._latest_frame = None
+        self._latest_lock = threading.Lock()
+
+        # Stats
+        self.capture_rate = RateCounter()
+        self.recognition_rate = RateCounter()
+        self.dropped = {"detect": 0, "recognize": 0, "decision": 0, "result": 0}
+
+    # Function to start all the stage threads
+    def start(self):
+        stages = [
+            ("capture", self._capture_loop),
+            ("detect", self._detect_loop),
+            ("recognize", self._recognize_loop),
+            ("decision", self._decision_loop),
+        ]
+        for name, target in stages:
+            thread = threading.Thread(target=target, name=f"Pipeline-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+        queues = [("detect", self.detect_queue), ("recognize", self.recognize_queue),
+                  ("decision", self.decision_queue), ("result", self.result_queue)]
+        for stage, q in queues:
+            self.metrics.set_gauge("queue_depth", stage, q.qsize, owner=self)
+            self.metrics.set_gauge("frames_dropped", stage, lambda stage=stage: self.dropped[stage], owner=self)
+        self.metrics.set_gauge("queue_depth", "events", self.event_queue.qsize, owner=self)
+        if hasattr(self.camera, "frames_dropped"):
+            self.metrics.set_gauge("frames_dropped", "camera", lambda: self.camera.frames_dropped, owner=self)
+        return self
+
+    # Function to stop the stage threads (the camera is released by its owner)
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=2.0)
+        self.metrics.remove_gauges(self)
+
+    def is_running(self):
+        return not self.stop_event.is_set()
+
+    # Function to get the newest camera frame for display
+    def latest_frame(self):
+        with self._latest_lock:
+            return self._latest_frame
+
+    # Function to get every item that is ready in a queue, oldest first, without waiting
+    def _drain(self, q):
+        items = []
+        while True:
+            try:
+                items.append(q.get_nowait())
+            except queue.Empty:
+                return items
+
+    # Function to get the frame results that are ready for the UI
+    def get_results(self):
+        return self._drain(self.result_queue)
+
+    # Function to get the attendance events that are ready for the UI
+    def get_events(self):
+        return self._drain(self.event_queue)
+
+    # Function to get one item from a stage queue, or None when stopping
+    def _get(self, q):
+        while not self.stop_event.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def _put(self, q, item, stage):
+        # Results only feed the display, so they are always allowed to drop
+        if self.drop_frames or stage == "result":
+            if put_latest(q, item):
+                self.dropped[stage] += 1
+            return
+
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _capture_loop(self):
+        while not self.stop_event.is_set():
+            packet = self.camera.read(timeout=0.1)
+            if packet is None:
+                if not self.camera.running:
+                    self.error = self.camera.error or "Camera stopped"
+                    self._put(self.detect_queue, _END, "detect")
+                    return
+                continue
+
+            self.capture_rate.tick()
+            self.metrics.tick("capture")
+            with self._latest_lock:
+                self._latest_frame = packet
+            self._put(self.detect_queue, FrameResult(packet), "detect")
+
+    # Function to find the faces in a frame (runs on the detect thread)
+    def detect_faces(self, gray):
+        return detect_faces_scaled(self.face_cascade, gray, self.detect_scale_factor, self.detect_min_neighbors,
+                                   self.detect_width, self.min_face_size, self.max_face_size)
+
+    def _detect_loop(self):
+        while True:
+            result = self._get(self.detect_queue)
+            if result is None:
+                return
+            if result is _END:
+                self._put(self.recognize_queue, _END, "recognize")
+                return
+            try:
+                start = time.time()
+                result.gray = cv2.cvtColor(result.packet.frame, cv2.COLOR_BGR2GRAY)
+                converted = time.time()
+                result.timings["convert"] = converted - start
+                if self.tracker is not None:
+                    tracks, result.detected = self.tracker.update(result.gray)
+                    result.faces = [FaceResult(track.box, track_id=track.id) for track in tracks]
+                else:
+                    result.faces = [FaceResult(box) for box in self.detect_faces(result.gray)]
+                result.timings["detect"] = time.time() - converted
+            except Exception as e:
+                print(f"ERROR: Face detection failed: {str(e)}")
+                continue
+            self.metrics.observe("convert", result.timings["convert"])
+            self.metrics.observe("detect", result.timings["detect"])
+            self.metrics.observe_value("faces_per_frame", len(result.faces))
+            self._put(self.recognize_queue, result, "recognize")
+
+    # Function to predict the identity of one face crop
+    def predict_face(self, gray, box):
+        return self.predict_faces(gray, [box])[0]
+
+    # Function to predict the identities of several face crops of a frame at
+    # once; recognizers with predict_batch() score them in a single call
+    def predict_faces(self, gray, boxes):
+        crops = [gray[y:y+h, x:x+w] for x, y, w, h in boxes]
+        self.predictions += len(crops)
+        if not crops:
+            return []
+        if hasattr(self.recognizer, "predict_batch"):
+            return self.recognizer.predict_batch(crops)
+        return [self.recognizer.predict(crop) for crop in crops]
+
+    # Function to recognize the faces of one frame (runs on the recognize thread)
+    def recognize_faces(self, result):
+        if self.tracker is not None:
+            self.recognize_tracked_faces(result)
+            return
+
+        try:
+            predictions = self.predict_faces(result.gray, [face.box for face in result.faces])
+        except Exception as e:
+            print(f"ERROR: Face recognition failed: {str(e)}")
+            for face in result.faces:
+                face.status = "error"
+            return
+
+        for face, (id, confidence) in zip(result.faces, predictions):
+            face.id, face.confidence = id, confidence
+            # Lower confidence is better in LBPH (0 is a perfect match)
+            face.status = "recognized" if face.confidence < self.confidence_threshold else "unknown"
+
+    # Function to recognize tracked faces, reusing each track's identity
+    def recognize_tracked_faces(self, result):
+        identities = {}
+        pending = []    # Faces whose track predicts this frame
+        for face in result.faces:
+            identity = self.identities.get(face.track_id)
+            if identity is None:
+                identity = TrackIdentity(self.vote_window)
+            identities[face.track_id] = identity
+
+            # Unidentified tracks predict on every frame to collect votes quickly
+            need_predict = (
+                identity.id is None
+                or identity.frames_since_predict + 1 >= self.predict_interval
+                or box_iou(face.box, identity.last_box) < self.repredict_iou
+            )
+            if need_predict:
+                pending.append(face)
+            else:
+                identity.frames_since_predict += 1
+
+        # All the faces that need a prediction are scored together
+        try:
+            predictions = self.predict_faces(result.gray, [face.box for face in pending])
+        except Exception as e:
+            print(f"ERROR: Face recognition failed: {str(e)}")
+            predictions = []
+            for face in pending:
+                face.status = "error"
+        for face, (label, confidence) in zip(pending, predictions):
+            identity = identities[face.track_id]
+            identity.add_vote(label, confidence, self.confidence_threshold, self.min_votes)
+            identity.last_box = face.box
+            identity.frames_since_predict = 0
+
+        for face in result.faces:
+            identity = identities[face.track_id]
+            if face.status == "error":
+                continue
+            if identity.id is not None:
+                face.id, face.confidence = identity.id, identity.confidence
+                face.status = "recognized"
+            else:
+                face.status = "unknown"
+
+        # Tracks that are gone take their identity with them
+        self.identities = identities
+
+    def _recognize_loop(self):
+        while True:
+            result = self._get(self.recognize_queue)
+            if result is None:
+                return
+            if result is _END:
+                self._put(self.decision_queue, _END, "decision")
+                return
+            start = time.time()
+            self.recognize_faces(result)
+            result.timings["recognize"] = time.time() - start
+            self.metrics.observe("recognize", result.timings["recognize"])
+            self.recognition_rate.tick()
+            self.metrics.tick("recognition")
+            self._put(self.decision_queue, result, "decision")
+
+    def _decision_loop(self):
+        while True:
+            result = self._get(self.decision_queue)
+            if result is None:
+                return
+            if result is _END:
+                # Every stage has finished its work
+                self.stop_event.set()
+                return
+            if self.decide is not None:
+                start = time.time()
+                try:
+                    self.decide(result)
+                except Exception as e:
+                    print(f"ERROR: Attendance decision failed: {str(e)}")
+                result.timings["decision"] = time.time() - start
+                self.metrics.observe("decision", result.timings["decision"])
+            # The gray image is only needed by the workers
+            result.gray = None
+            for event in result.events:
+                self.event_queue.put(event)
+            self._put(self.result_queue, result, "result")
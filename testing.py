@@ -1,15 +1,25 @@
+import argparse
 import cv2
-import numpy as np
+import face_training
+from camera import open_frame_source
 
-recognizer = cv2.createLBPHFaceRecognizer()
-recognizer.read('TrainingImageLabel/trainner.yml')
-cascadePath = "haarcascade_frontalface_default.xml"
+parser = argparse.ArgumentParser(description="Show live recognition results from the trained model")
+parser.add_argument("--source", default="0", help="camera index, video file or folder of images (default: camera 0)")
+parser.add_argument("--fast", action="store_true", help="don't slow video files and image folders down to real time")
+args = parser.parse_args()
+
+face_training.migrate_legacy_trainer()
+recognizer = cv2.face.LBPHFaceRecognizer_create()
+recognizer.read(face_training.TRAINER_PATH)
+cascadePath = face_training.CASCADE_PATH
 faceCascade = cv2.CascadeClassifier(cascadePath)
 font = cv2.FONT_HERSHEY_SIMPLEX
 
-cam = cv2.VideoCapture(0)
+cam = open_frame_source(args.source, realtime=not args.fast)
 while True:
     ret, im = cam.read()
+    if not ret:
+        break
     gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
     faces = faceCascade.detectMultiScale(gray, 1.2, 5)
     for(x, y, w, h) in faces:
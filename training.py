@@ -1,38 +1,24 @@
-import cv2
-import os
-import numpy as np
-from PIL import Image
-#
-# recognizer = cv2.face.LBPHFaceRecognizer_create()
-recognizer = cv2.face.LBPHFaceRecognizer_create()
-detector = cv2.CascadeClassifier("haarcascade_frontalface_default.xml")
+import argparse
+import time
+import face_training
 
 
-def getImagesAndLabels(path):
-    # get the path of all the files in the folder
-    imagePaths = [os.path.join(path, f) for f in os.listdir(path)]
-    # create empth face list
-    faceSamples = []
-    # create empty ID list
-    Ids = []
-    # now looping through all the image paths and loading the Ids and the images
-    for imagePath in imagePaths:
-        # loading the image and converting it to gray scale
-        pilImage = Image.open(imagePath).convert('L')
-        # Now we are converting the PIL image into numpy array
-        imageNp = np.array(pilImage, 'uint8')
-        # getting the Id from the image
+def main():
+    parser = argparse.ArgumentParser(description="Train the face recognizer from the TrainingImage folder")
+    # worker processes used to decode and detect the training images
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: one per CPU core)")
+    # images handed to a worker at a time
+    parser.add_argument("--chunk-size", type=int, default=face_training.TRAINING_CHUNK_SIZE,
+                        help="images sent to a worker per task")
+    args = parser.parse_args()
 
-        Id = int(os.path.split(imagePath)[-1].split(".")[1])
-        # extract the face from the training image sample
-        faces = detector.detectMultiScale(imageNp)
-        # If a face is there then append that in the list as well as Id of it
-        for (x, y, w, h) in faces:
-            faceSamples.append(imageNp[y:y+h, x:x+w])
-            Ids.append(Id)
-    return faceSamples, Ids
+    start = time.time()
+    recognizer, _ = face_training.train_model(workers=args.workers, chunk_size=args.chunk_size)
+    print(f"Trained on {len(recognizer.getHistograms())} samples in {time.time() - start:.1f}s")
+    print(f"Model saved to {face_training.TRAINER_PATH} and {face_training.GALLERY_PATH}")
 
 
-faces, Ids = getImagesAndLabels('TrainingImage')
-recognizer.train(faces, np.array(Ids))
-recognizer.save('TrainingImageLabel/trainner.yml')
+# The guard is needed so worker processes can import this file safely
+if __name__ == "__main__":
+    main()